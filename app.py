@@ -1,9 +1,18 @@
-from flask import Flask, render_template, request, send_file, jsonify
-from process.audit import check_tags, generate_html_report
-from process.helpers import check_robots_sitemap_https
+import json
+import os
+import time
+from flask import Flask, Response, render_template, request, send_from_directory, jsonify, stream_with_context
+from werkzeug.exceptions import NotFound
+from process import config, metrics
+from process.jobs import DONE, FAILED, get_queue, ensure_workers, profile_path
+from process.batch import batch_audit, check_urls, read_urls
 
 app = Flask(__name__)
 
+if config.PRELOAD:
+    from process.audit import preload
+    preload()
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -12,29 +21,110 @@ def home():
 def audit():
         
     url = request.form['url']
-    api_key = '' #Replace your Google PageSpeed API key 
+    # profile=1 writes a profile of this audit next to its report
+    profile = request.form.get('profile') == '1'
 
     try:
-        # Fetch SEO audit details
-        seo_report = check_tags(url, api_key)
-        robots_report = check_robots_sitemap_https(url)
-
-        # Combine the results
-        full_report = {**seo_report, **robots_report}
+        # Queue the audit and return straight away, a worker picks it up
+        ensure_workers()
+        job_id = get_queue().submit(url, profile=profile)
 
-        # Generate HTML report
-        report_filename = "seo_audit_report.html"
-        generate_html_report(full_report, filename=report_filename)
-        
-        return jsonify({"success": True, "filename": report_filename})
+        return jsonify({"success": True, "job_id": job_id})
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+def sse(event, data, event_id=None):
+    # One Server-Sent Events message
+    message = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+# Seconds between keep-alive comments while a streamed job has nothing new
+STREAM_KEEPALIVE = 15
+
+@app.route('/audit/stream')
+def audit_stream():
+    # Relays a queued job (see /audit) as Server-Sent Events: a "section"
+    # event for each stage the worker has finished (the page itself right
+    # after the fetch, slower checks as they finish), "progress" as it
+    # changes, then "done" with the report file to download, or "failed".
+    # The audit runs in the worker, so a dropped connection loses nothing;
+    # a reconnecting EventSource resumes after its Last-Event-ID.
+    job_id = request.args.get('job', '').strip()
+    queue = get_queue()
+    if not job_id or queue.get(job_id) is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    try:
+        last_seq = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_seq = 0
+
+    def generate():
+        seq, progress, idle = last_seq, None, 0.0
+        while True:
+            # Read the status first so no section recorded before the job finished is missed
+            job = queue.get(job_id)
+            for seq, event, data in queue.events(job_id, after=seq):
+                yield sse(event, data, seq)
+            if job["status"] == DONE:
+                yield sse("done", {"filename": job["filename"]})
+                return
+            if job["status"] == FAILED:
+                yield sse("failed", {"error": job["error"]})
+                return
+            if job["progress"] != progress:
+                progress = job["progress"]
+                yield sse("progress", {"progress": progress})
+                idle = 0.0
+            elif idle >= STREAM_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            time.sleep(config.JOB_POLL_INTERVAL)
+            idle += config.JOB_POLL_INTERVAL
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/audit/batch', methods=['POST'])
+def audit_batch():
+    # Accepts a JSON list of URLs (or {"urls": [...]}) or an uploaded file with
+    # one URL per line, and streams one JSON report per line as each completes
+    try:
+        if 'file' in request.files:
+            urls = read_urls(request.files['file'].read().decode('utf-8'))
+        else:
+            data = request.get_json(silent=True)
+            urls = check_urls(data.get('urls', []) if isinstance(data, dict) else data)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not urls:
+        return jsonify({"success": False, "error": "No URLs given"}), 400
+
+    def generate():
+        for report in batch_audit(urls, config.PAGESPEED_API_KEY):
+            yield json.dumps(report, default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    job = get_queue().get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    if job["profile"]:
+        job["profile_filename"] = os.path.basename(profile_path(job_id))
+    return jsonify({"success": True, **job})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Counters and stage histograms of the audits run by this process, plus the job queue
+    gauges = [("seo_audit_jobs", {"status": status}, count) for status, count in get_queue().counts().items()]
+    return Response(metrics.registry.render(gauges), mimetype='text/plain; version=0.0.4')
+
 @app.route('/download/<filename>')
 def download_report(filename):
     try:
-        return send_file(filename, as_attachment=True)
-    except FileNotFoundError:
+        return send_from_directory(os.path.abspath(config.REPORTS_DIR), filename, as_attachment=True)
+    except NotFound:
         return jsonify({"success": False, "error": "File not found"})
 
 @app.route('/')
@@ -43,4 +133,3 @@ def index():
 
 if __name__ == "__main__":
     app.run(debug=True)
-
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from process.extract import extract_page
+
+# Compares the single-pass extractor with the repeated soup.find/find_all
+# scans check_tags used to run, on sample_report.html and larger copies of it.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, "sample_report.html")
+SIZES = (1, 10, 50)
+ROUNDS = 3
+
+
+def soup_scan(html):
+    soup = BeautifulSoup(html, "html.parser")
+    favicon = soup.find("link", rel="icon") or soup.find("link", rel="shortcut icon")
+    return {
+        "favicon": favicon["href"] if favicon and "href" in favicon.attrs else None,
+        "title": soup.find("title").text if soup.find("title") else None,
+        "description": soup.find("meta", attrs={"name": "description"})["content"] if soup.find("meta", attrs={"name": "description"}) else None,
+        "h1_texts": [h1.get_text(strip=True) for h1 in soup.find_all("h1")],
+        "heading_counts": {tag: len(soup.find_all(tag)) for tag in ("h1", "h2", "h3", "h4", "h5", "h6")},
+        "canonical": soup.find("link", rel="canonical")["href"] if soup.find("link", rel="canonical") else None,
+        "robots": soup.find("meta", attrs={"name": "robots"})["content"] if soup.find("meta", attrs={"name": "robots"}) else None,
+        "og_tags": bool(soup.find_all("meta", attrs={"property": lambda x: x and x.startswith("og:")})),
+        "schema_markup": bool(soup.find_all("script", type="application/ld+json")),
+        "iframes": [{attr: iframe.get(attr) for attr in iframe.attrs if "src" in attr} for iframe in soup.find_all("iframe")],
+        "social": [a["href"] for a in soup.find_all("a", href=True)],
+        "broken": [a["href"] for a in soup.find_all("a", href=True)],
+        "links": [a["href"] for a in soup.find_all("a", href=True)],
+        "images": [(img.get("src"), img.get("alt")) for img in soup.find_all("img")],
+        # bs4 collapses whitespace-only strings, so compare the words only
+        "text": soup.get_text().split(),
+    }
+
+
+def single_pass(html):
+    page = extract_page(html)
+    return {
+        "favicon": page.favicon,
+        "title": page.title,
+        "description": page.description,
+        "h1_texts": page.h1_texts,
+        "heading_counts": page.heading_counts,
+        "canonical": page.canonical,
+        "robots": page.robots,
+        "og_tags": page.og_tags,
+        "schema_markup": page.schema_markup,
+        "iframes": page.iframes,
+        "social": page.links,
+        "broken": page.links,
+        "links": page.links,
+        "images": [(img.get("src"), img.get("alt")) for img in page.images],
+        "text": page.text.split(),
+    }
+
+
+def best_time(func, html):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = func(html)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    with open(SAMPLE, encoding="utf-8") as f:
+        sample = f.read()
+    head, _, body = sample.partition("<body>")
+    body, _, tail = body.rpartition("</body>")
+
+    print(f"{'size':>10} {'soup scans':>12} {'single pass':>12} {'speed-up':>9}")
+    for multiple in SIZES:
+        html = head + "<body>" + body * multiple + "</body>" + tail
+        soup_time, expected = best_time(soup_scan, html)
+        pass_time, actual = best_time(single_pass, html)
+        for key in expected:
+            if expected[key] != actual[key]:
+                print(f"  mismatch on {key}")
+        print(f"{len(html) // 1024:>8}KB {soup_time * 1000:>10.1f}ms {pass_time * 1000:>10.1f}ms {soup_time / pass_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
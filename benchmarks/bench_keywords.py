@@ -0,0 +1,77 @@
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+from nltk.corpus import stopwords
+from process.extract import extract_page
+from process.keywords import analyze
+
+# Keyword extraction on large text pages: the old path (BeautifulSoup
+# get_text including script/style, stopwords rebuilt from the corpus on every
+# call, filtered word list) against visible text from the extractor and
+# process.keywords, with and without bigrams/trigrams.
+
+PAGE_SIZES = (100_000, 1_000_000, 5_000_000)
+PAGES = 20
+
+VOCABULARY = [f"word{i}" for i in range(5000)] + stopwords.words("english")
+
+
+def build_page(size, seed=0):
+    rng = random.Random(seed)
+    paragraphs = []
+    length = 0
+    while length < size:
+        paragraph = " ".join(rng.choice(VOCABULARY) for _ in range(80))
+        paragraphs.append(f"<p>{paragraph}</p>")
+        length += len(paragraph) + 7
+    script = "<script>" + "var x = 1; " * (size // 110) + "</script>"
+    return f"<html lang='en'><head><title>t</title>{script}</head><body>{''.join(paragraphs)}</body></html>"
+
+
+def legacy_keywords(html):
+    return legacy_extract_top_keywords(BeautifulSoup(html, "html.parser").get_text())
+
+
+def legacy_extract_top_keywords(text):
+    words = re.findall(r'\w+', text.lower())
+    stop_words = set(stopwords.words('english'))
+    filtered_words = [word for word in words if word not in stop_words]
+    return Counter(filtered_words).most_common(15)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'page size':>10} {'legacy total':>13} {'legacy kw':>10} {'new kw':>8} {'new kw+ngrams':>14}")
+    for size in PAGE_SIZES:
+        html = build_page(size)
+        page = extract_page(html)
+        legacy_text = BeautifulSoup(html, "html.parser").get_text()
+        assert legacy_keywords(html)[:5] == analyze(page.text, page.lang, ngrams=False).top(5)
+
+        legacy_total = timed(legacy_keywords, html)
+        legacy_step = timed(legacy_extract_top_keywords, legacy_text)
+        words_only = timed(lambda: analyze(page.text, page.lang, ngrams=False).top(15))
+        with_ngrams = timed(lambda: analyze(page.text, page.lang))
+        print(f"{size:>10} {legacy_total:>12.3f}s {legacy_step:>9.3f}s {words_only:>7.3f}s {with_ngrams:>13.3f}s")
+
+    # Many small pages: the old code reloads the stopword list from disk per call
+    texts = [extract_page(build_page(20_000, seed)).text for seed in range(PAGES)]
+    legacy = timed(lambda: [legacy_extract_top_keywords(text) for text in texts])
+    new = timed(lambda: [analyze(text, "en", ngrams=False).top(15) for text in texts])
+    print(f"{PAGES} pages of 20KB: legacy {legacy:.3f}s, new {new:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
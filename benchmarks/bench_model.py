@@ -0,0 +1,49 @@
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_report import build_report
+from process.model import AuditResult, HostTable, write_ndjson
+
+# Memory held by a batch of audit results as report dicts versus the typed
+# model, and the time to convert and export them as NDJSON.
+
+RESULTS = 1000
+LINKS = 200
+
+
+def held_memory(build):
+    tracemalloc.start()
+    results = build()
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del results
+    return held
+
+
+def main():
+    dict_memory = held_memory(lambda: [build_report(LINKS) for _ in range(RESULTS)])
+    # One host table for the batch, like an export uses
+    hosts = HostTable()
+    model_memory = held_memory(lambda: [AuditResult.from_report(build_report(LINKS), hosts) for _ in range(RESULTS)])
+    print(f"{RESULTS} results, {LINKS} links each")
+    print(f"report dicts  {dict_memory / 1024 / 1024:>8.1f}MB")
+    print(f"typed model   {model_memory / 1024 / 1024:>8.1f}MB")
+
+    reports = [build_report(LINKS) for _ in range(RESULTS)]
+    start = time.perf_counter()
+    results = [AuditResult.from_report(report, hosts) for report in reports]
+    converted = time.perf_counter() - start
+    start = time.perf_counter()
+    out = io.StringIO()
+    write_ndjson(results, out)
+    exported = time.perf_counter() - start
+    print(f"convert {converted:.2f}s, NDJSON export {exported:.2f}s ({len(out.getvalue()) / 1024 / 1024:.1f}MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process import config
+from process.extract import PARSER_BACKENDS, extract_response
+
+# Parse time and peak RSS of each parser backend on a large page, buffered
+# (whole body read first) vs streamed (fed to the parser chunk by chunk).
+# Every run happens in a fresh process so peak RSS is not shared.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, "sample_report.html")
+COPIES = int(os.environ.get("BENCH_COPIES", 400))
+
+
+class FileResponse:
+    # Enough of requests.Response for extract_response, backed by a file
+    def __init__(self, path):
+        self.path = path
+        self.headers = {"Content-Type": "text/html; charset=utf-8"}
+        self.encoding = "utf-8"
+
+    @property
+    def content(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def iter_content(self, chunk_size):
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def close(self):
+        pass
+
+
+def build_page(path):
+    with open(SAMPLE, encoding="utf-8") as f:
+        sample = f.read()
+    head, _, body = sample.partition("<body>")
+    body, _, tail = body.rpartition("</body>")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(head + "<body>")
+        for _ in range(COPIES):
+            f.write(body)
+        f.write("</body>" + tail)
+
+
+def run(path, backend, streaming, queue):
+    config.PARSER_STREAMING = streaming
+    config.PARSER_MAX_BYTES = 0
+    start = time.perf_counter()
+    page = extract_response(FileResponse(path), backend=backend)
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((elapsed, peak_kb, sum(page.heading_counts.values())))
+
+
+def main():
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "page.html")
+        build_page(path)
+        print(f"page size: {os.path.getsize(path) / 1024 / 1024:.1f}MB")
+        print(f"{'backend':<12} {'mode':<9} {'time':>8} {'peak RSS':>10} {'headings':>9}")
+        for backend in PARSER_BACKENDS:
+            for streaming in (False, True):
+                queue = context.Queue()
+                process = context.Process(target=run, args=(path, backend, streaming, queue))
+                process.start()
+                process.join()
+                mode = "streamed" if streaming else "buffered"
+                if process.exitcode != 0:
+                    print(f"{backend:<12} {mode:<9} {'not installed or failed':>27}")
+                    continue
+                elapsed, peak_kb, headings = queue.get()
+                print(f"{backend:<12} {mode:<9} {elapsed:>7.2f}s {peak_kb / 1024:>8.1f}MB {headings:>9}")
+
+
+if __name__ == "__main__":
+    main()
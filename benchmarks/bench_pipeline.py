@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixture_server import start_fixture_server
+from process import audit, config
+
+# Compares the audit with every stage forced onto a single worker (the old
+# serial behaviour) against the concurrent pipeline. WHOIS and PageSpeed are
+# replaced with sleeps so no external service is hit.
+
+WHOIS_LATENCY = 0.5
+PAGESPEED_LATENCY = 1.0
+
+
+def stub_whois(domain_name):
+    time.sleep(WHOIS_LATENCY)
+    return {"Domain Name": domain_name, "Registrar": "Stub"}
+
+
+def stub_pagespeed(url, api_key, strategy):
+    time.sleep(PAGESPEED_LATENCY)
+    return {"Performance Score": 100}
+
+
+def timed_audit(url, workers):
+    config.AUDIT_STAGE_WORKERS = workers
+    config.LINK_CHECK_WORKERS = workers
+    start = time.perf_counter()
+    report = audit.run_audit(url, "")
+    return time.perf_counter() - start, report
+
+
+def main():
+    audit.get_domain_details = stub_whois
+    audit.get_pagespeed_metrics = stub_pagespeed
+    # No HTTP cache: the serial run would warm it for the concurrent one, and
+    # an old .cache would serve both
+    config.HTTP_CACHE_ENABLED = False
+    # The stub server is a single host; measure the pipeline, not the politeness limits
+    config.HOST_RATE = 0
+    config.HOST_INITIAL_CONCURRENCY = config.HOST_MAX_CONCURRENCY = 64
+    server, url = start_fixture_server(pages=21, links=20, images=10, latency=0.05)
+    try:
+        serial, serial_report = timed_audit(url, 1)
+        concurrent, concurrent_report = timed_audit(url, 16)
+    finally:
+        server.shutdown()
+
+    assert serial_report.keys() == concurrent_report.keys()
+    print(f"serial stages:     {serial:.2f}s")
+    print(f"concurrent stages: {concurrent:.2f}s")
+    print(f"speed-up:          {serial / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
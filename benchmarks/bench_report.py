@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process.report import generate_html_report
+
+# Render time and peak Python memory of the HTML report versus link count,
+# with every row rendered (max_rows=0) and with the default table limit.
+# The old renderer's `rows_html +=` table loop is timed alongside.
+
+LINK_COUNTS = (1000, 10000, 100000, 300000)
+METRICS = ("Performance Score", "First Contentful Paint", "Largest Contentful Paint",
+           "Cumulative Layout Shift", "Speed Index", "Total Blocking Time")
+
+
+def build_report(links):
+    metrics = dict.fromkeys(METRICS, "1 s")
+    return {
+        "URL": "https://example.com/", "Favicon Link": "https://example.com/favicon.ico",
+        "Title": "Example", "Description": "Example page", "H1 Tags Text": ["Example"],
+        "H1 Count": 1, "H2 Count": 0, "H3 Count": 0, "H4 Count": 0, "H5 Count": 0, "H6 Count": 0,
+        "Canonical Tag": "No canonical tag", "Robots Tag": "No robots tag",
+        "OG Tags Available": "No", "Schema Markup Available": "No",
+        "social_media_links": "No social media links", "iframes": ["Great! No iframes"],
+        "broken_links": "All links well good",
+        "Image Details": [{"src": f"https://example.com/img/{i}.png", "alt": "", "size": 1.0} for i in range(links // 10)],
+        "Internal Links": [f"https://example.com/page/{i}" for i in range(links)],
+        "External Links": [f"https://other.example/page/{i}" for i in range(links // 2)],
+        "Top Keywords": [("example", 3)],
+        "PageSpeed Metrics Mobile": metrics, "PageSpeed Metrics Desktop": metrics,
+        "Custom 404 Page": "Yes", "Robots.txt Available": "Yes", "Sitemap.xml Available": "Yes",
+        "HTTPS": "Yes", "Image Count": links // 10, "Images with Alt Text": 0,
+    }
+
+
+def legacy_rows(report):
+    internal_links = report["Internal Links"]
+    external_links = report["External Links"]
+    rows_html = ''
+    for i in range(max(len(internal_links), len(external_links))):
+        internal_link = internal_links[i] if i < len(internal_links) else ''
+        external_link = external_links[i] if i < len(external_links) else ''
+        rows_html += f"<tr><td>{internal_link}</td><td>{external_link}</td></tr>"
+    return rows_html
+
+
+def measure(func, *args):
+    # Timed and memory-traced separately, tracemalloc slows rendering down a lot
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.html")
+        print(f"{'links':>8} {'full render':>20} {'limited render':>20} {'legacy table loop':>20}")
+        for links in LINK_COUNTS:
+            report = build_report(links)
+            full = measure(generate_html_report, report, path, 0)
+            size = os.path.getsize(path)
+            limited = measure(generate_html_report, report, path, None)
+            legacy = measure(legacy_rows, report)
+            print(f"{links:>8} " + " ".join(
+                f"{elapsed:>8.2f}s {peak / 1024 / 1024:>7.1f}MB" for elapsed, peak in (full, limited, legacy)
+            ) + f"   ({size / 1024 / 1024:.1f}MB file)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold import time of each entry point, from `python -X importtime`, with the
+# heaviest modules it pulls in. Budgets are in milliseconds; with --check the
+# script exits non-zero when an entry point goes over its budget, so an eager
+# import of nltk or whois sneaking back in shows up as a failure.
+
+ENTRY_POINTS = {
+    "app": 250,
+    "process.audit": 200,
+    "process.batch": 80,
+    "process.crawl": 200,
+    "process.jobs": 40,
+}
+# Modules that must stay out of these imports, they load on first use
+LAZY_MODULES = ("nltk", "whois", "bs4", "numpy")
+RUNS = 5
+
+
+def import_times(module):
+    # {module: cumulative microseconds} for one cold `import module`
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the entry points.")
+    parser.add_argument("--check", action="store_true", help="Exit with an error when over budget")
+    args = parser.parse_args(argv)
+
+    # Modules the interpreter imports at startup anyway (site, encodings...)
+    baseline = import_times("sys")
+    failures = []
+    for module, budget in ENTRY_POINTS.items():
+        runs = [import_times(module) for _ in range(RUNS)]
+        best = min(run[module] for run in runs) / 1000
+        heaviest = sorted((name for name in runs[0] if "." not in name and name != module and name not in baseline),
+                          key=lambda name: runs[0][name], reverse=True)[:4]
+        eager = [name for name in LAZY_MODULES if name in runs[0]]
+        print(f"{module:<15} {best:>7.1f}ms (budget {budget}ms)  heaviest: "
+              + ", ".join(f"{name} {runs[0][name] / 1000:.0f}ms" for name in heaviest))
+        if best > budget:
+            failures.append(f"{module} imports in {best:.0f}ms, over its {budget}ms budget")
+        if eager:
+            failures.append(f"{module} eagerly imports {', '.join(eager)}")
+
+    for failure in failures:
+        print(failure)
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
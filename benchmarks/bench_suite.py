@@ -0,0 +1,265 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixture_server import build_page, install_stub_backends, start_fixture_server
+
+# Performance tracking suite: end-to-end check_tags, parsing, link checking,
+# report rendering, crawling and link graph analytics, all against the local fixture server with
+# stub WHOIS and PageSpeed backends, so nothing leaves the machine. Each
+# benchmark runs in a fresh process (for a meaningful peak RSS) and reports
+# throughput, p50/p95 latency and peak RSS. With --json the results are
+# appended, with the commit and a timestamp, to a JSON Lines file so runs
+# can be compared over time.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = {
+    # pages in the fixture site, links and images per page, words per page
+    "small": dict(pages=30, links=10, images=5, words=300),
+    "medium": dict(pages=200, links=20, images=10, words=600),
+    "large": dict(pages=1000, links=40, images=20, words=1500),
+}
+# Synthetic link graphs: pages and internal links per page
+GRAPH_SIZES = {"small": (10_000, 10), "medium": (100_000, 10), "large": (300_000, 20)}
+LATENCY = 0.02
+WHOIS_LATENCY = 0.2
+PAGESPEED_LATENCY = 0.5
+
+
+class Measurement:
+    def __init__(self, name, items, seconds, latencies, unit="item"):
+        self.name = name
+        self.items = items
+        self.seconds = seconds
+        self.latencies = sorted(latencies)
+        self.unit = unit
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        index = min(len(self.latencies) - 1, round(q / 100 * (len(self.latencies) - 1)))
+        return self.latencies[index]
+
+    def to_dict(self):
+        return {
+            "benchmark": self.name,
+            "items": self.items,
+            "unit": self.unit,
+            "seconds": round(self.seconds, 3),
+            "throughput": round(self.items / self.seconds, 2) if self.seconds else None,
+            "p50_ms": _ms(self.percentile(50)),
+            "p95_ms": _ms(self.percentile(95)),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def timed(name, func, items, concurrency=1, unit="item"):
+    # Calls func(item) for every item on `concurrency` threads
+    latencies = []
+
+    def run(item):
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        for item in items:
+            run(item)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(run, items))
+    return Measurement(name, len(items), time.perf_counter() - start, latencies, unit)
+
+
+def configure():
+    # No disk caches (every run starts cold and leaves nothing behind) and no
+    # politeness limits: the fixture site and the stub backends are local
+    from process import config, network
+    config.HTTP_CACHE_ENABLED = False
+    config.MEMO_PERSIST = False
+    # Before any timing; a shared session made earlier would keep its cache
+    network._session = None
+    config.HOST_RATE = config.PAGESPEED_RATE = config.WHOIS_RATE = 0
+    config.HOST_INITIAL_CONCURRENCY = config.HOST_MAX_CONCURRENCY = 64
+    config.PAGESPEED_CONCURRENCY = config.WHOIS_CONCURRENCY = 64
+
+
+def bench_check_tags(size):
+    from process.audit import check_tags
+    configure()
+    pagespeed = install_stub_backends(WHOIS_LATENCY, PAGESPEED_LATENCY)
+    server, _ = start_fixture_server(latency=LATENCY, slow_every=10, fail_every=7, **SIZES[size])
+    try:
+        urls = server.page_urls()
+        return timed("check_tags", lambda url: check_tags(url, "stub-key"), urls, concurrency=4, unit="page")
+    finally:
+        server.shutdown()
+        pagespeed.shutdown()
+
+
+def bench_first_result(size):
+    # Latency until an audit yields its first section (what /audit/stream
+    # shows first), each audit still run to completion
+    from process.audit import iter_check_tags
+    configure()
+    pagespeed = install_stub_backends(WHOIS_LATENCY, PAGESPEED_LATENCY)
+    server, _ = start_fixture_server(latency=LATENCY, slow_every=10, fail_every=7, **SIZES[size])
+    latencies = []
+
+    def first_result(url):
+        start = time.perf_counter()
+        sections = iter_check_tags(url, "stub-key")
+        next(sections)
+        latencies.append(time.perf_counter() - start)
+        for _ in sections:
+            pass
+
+    try:
+        urls = server.page_urls()
+        total = timed("first_result", first_result, urls, concurrency=4, unit="page")
+        return Measurement(total.name, total.items, total.seconds, latencies, total.unit)
+    finally:
+        server.shutdown()
+        pagespeed.shutdown()
+
+
+def bench_parse(size):
+    from process.extract import extract_page
+    options = SIZES[size]
+    pages = [build_page(i, **options) for i in range(options["pages"])]
+    extract_page(pages[0])
+    return timed("parse", extract_page, pages, unit="page")
+
+
+def bench_links(size):
+    from process.links import check_links
+    configure()
+    server, url = start_fixture_server(latency=LATENCY, slow_every=5, slow_latency=0.5, fail_every=3,
+                                       **SIZES[size])
+    try:
+        # The links of each page, checked as one batch like an audit does
+        batches = []
+        for index in range(server.pages):
+            page = server.page(index).decode()
+            hrefs = [part.split('"', 1)[0] for part in page.split('<a href="')[1:]]
+            batches.append([url.rstrip("/") + href for href in hrefs])
+        return timed("links", check_links, batches, unit="page")
+    finally:
+        server.shutdown()
+
+
+def bench_report(size):
+    from benchmarks.bench_report import build_report
+    from process.report import generate_html_report
+    links = SIZES[size]["pages"] * SIZES[size]["links"] * 10
+    reports = [build_report(links) for _ in range(5)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "report.html")
+        return timed("report", lambda report: generate_html_report(report, path), reports, unit="report")
+
+
+def bench_crawl(size):
+    from process.crawl import crawl
+    configure()
+    server, url = start_fixture_server(latency=LATENCY, slow_every=10, fail_every=7, **SIZES[size])
+    try:
+        start = time.perf_counter()
+        reports = list(crawl(url, max_pages=server.pages, workers=8))
+        seconds = time.perf_counter() - start
+        # Per-page latency is each page's audit time, from its metrics
+        latencies = [report["Audit Metrics"]["Total Seconds"] for report in reports if "Audit Metrics" in report]
+        return Measurement("crawl", len(reports), seconds, latencies, unit="page")
+    finally:
+        server.shutdown()
+
+
+def bench_linkgraph(size):
+    import random
+    from process.linkgraph import LinkGraph
+    pages, links = GRAPH_SIZES[size]
+    rng = random.Random(0)
+    urls = ["https://example.com/"] + [f"https://example.com/p/{i}" for i in range(1, pages)]
+    reports = [{"URL": url, "Status Code": 200, "Internal Links": [urls[rng.randrange(pages)] for _ in range(links)]}
+               for url in urls]
+    graph = LinkGraph()
+    start = time.perf_counter()
+    for report in reports:
+        graph.add(report)
+    graph.analyze()
+    return Measurement("linkgraph", pages, time.perf_counter() - start, [], unit="page")
+
+
+BENCHMARKS = {
+    "check_tags": bench_check_tags,
+    "first_result": bench_first_result,
+    "parse": bench_parse,
+    "links": bench_links,
+    "report": bench_report,
+    "crawl": bench_crawl,
+    "linkgraph": bench_linkgraph,
+}
+
+
+def run_one(name, size):
+    return BENCHMARKS[name](size).to_dict()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite against a local fixture site.")
+    parser.add_argument("--size", choices=SIZES, default="small", help="Fixture site size")
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run only these benchmarks")
+    parser.add_argument("--json", help="Append the results to this JSON Lines file")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'benchmark':<12} {'items':>6} {'seconds':>8} {'per sec':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS':>9}")
+    context = multiprocessing.get_context("spawn")
+    for name in args.only or BENCHMARKS:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_one, (name, args.size))
+        results.append(result)
+        print(f"{name:<12} {result['items']:>6} {result['seconds']:>8.2f} {result['throughput'] or 0:>9.1f} "
+              f"{result['p50_ms'] or 0:>8.1f} {result['p95_ms'] or 0:>8.1f} {result['peak_rss_mb'] or 0:>7.1f}MB")
+
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                                "commit": git_commit(), "python": sys.version.split()[0], "size": args.size,
+                                "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import gzip
+import json
+import random
+import struct
+import threading
+import time
+import types
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local fixture server for the benchmarks: a synthetic site of `pages` pages,
+# each with `links` internal links, `images` images and about `words` words
+# of text, plus robots.txt, a sitemap index and a gzipped sitemap. Every
+# `slow_every`-th page also links to an endpoint that takes `slow_latency`
+# seconds, every `fail_every`-th page to one answering 500, and every page
+# to one broken link. Pages load a render-blocking stylesheet (gzipped,
+# cached for a year, with a web font) and script, and a deferred script
+# (neither compressed nor cached). All responses are delayed by `latency` seconds to
+# stand in for a network round trip. Content is generated from `seed`, so
+# runs are reproducible.
+#
+# The same server stands in for the PageSpeed API (see install_stub_backends).
+
+# Static assets: (content type, body, gzipped, Cache-Control)
+STATIC = {
+    "/static/site.css": ("text/css", ("@font-face{font-family:Fixture;src:url(/static/fixture.woff2) format('woff2')}"
+                                      + "body{font-family:Fixture,sans-serif;margin:0 auto}" * 200).encode(),
+                         True, "public, max-age=31536000"),
+    "/static/app.js": ("application/javascript", b"var fixture = 1;\n" * 500, False, None),
+    "/static/defer.js": ("application/javascript", b"var deferred = 1;\n" * 200, False, "max-age=60"),
+    "/static/fixture.woff2": ("font/woff2", b"wOF2" + b"\0" * 15000, False, "public, max-age=31536000"),
+}
+
+# A 640x480 PNG header padded out to ~20KB
+PNG_IMAGE = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 640, 480) + b"\0" * 20000
+
+VOCABULARY = (
+    "search engine optimisation audit page content site ranking crawl index link image speed mobile "
+    "desktop title description keyword heading sitemap robots canonical schema markup performance "
+    "metric report domain server response cache browser render script style font layout paint "
+    "the a an and or of to in on for with is are was be this that it as by from at"
+).split()
+
+LIGHTHOUSE_RESULT = {
+    "lighthouseResult": {
+        "categories": {"performance": {"score": 0.87}},
+        "audits": {
+            "first-contentful-paint": {"displayValue": "1.2 s"},
+            "largest-contentful-paint": {"displayValue": "2.1 s"},
+            "cumulative-layout-shift": {"displayValue": "0.02"},
+            "speed-index": {"displayValue": "1.9 s"},
+            "total-blocking-time": {"displayValue": "150 ms"},
+        },
+    }
+}
+
+
+def page_path(index):
+    return "/" if index == 0 else f"/p/{index}"
+
+
+def build_page(index, pages=100, links=20, images=10, words=300, slow_every=0, fail_every=0, seed=0):
+    rng = random.Random(seed * 1000003 + index)
+    hrefs = [page_path((index * 31 + k * 17 + 1) % pages) for k in range(min(links, pages))]
+    hrefs.append(f"/missing/{index}")
+    if slow_every and index % slow_every == 0:
+        hrefs.append(f"/slow/{index}")
+    if fail_every and index % fail_every == 0:
+        hrefs.append(f"/fail/{index}")
+    anchors = "".join(f'<a href="{href}">Link {k}</a> ' for k, href in enumerate(hrefs))
+    imgs = "".join(f'<img src="/img/{index}-{k}.png" alt="Image {k}">' for k in range(images))
+    paragraphs = "".join(f"<p>{' '.join(rng.choices(VOCABULARY, k=50))}</p>" for _ in range(max(words // 50, 1)))
+    return f"""<html lang="en"><head><title>Fixture page {index}</title>
+<meta name="description" content="Benchmark fixture page {index}">
+<link rel="icon" href="/favicon.ico"><link rel="canonical" href="{page_path(index)}">
+<link rel="stylesheet" href="/static/site.css"><script src="/static/app.js"></script></head>
+<body><h1>Fixture page {index}</h1><h2>Text</h2>{paragraphs}<h2>Links</h2>{anchors}<h2>Images</h2>{imgs}
+<script src="/static/defer.js" defer></script></body></html>"""
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(head=True)
+
+    def do_GET(self):
+        self.respond(head=False)
+
+    def respond(self, head):
+        server = self.server
+        time.sleep(server.latency)
+        path = self.path.split("?")[0]
+        base = f"http://{self.headers.get('Host', '127.0.0.1')}"
+        status, content_type, body = 200, "text/html", b""
+        headers = {}
+        if path == "/" or path.startswith("/p/"):
+            index = 0 if path == "/" else int(path[3:]) if path[3:].isdigit() else -1
+            if 0 <= index < server.pages:
+                body = server.page(index)
+            else:
+                status, body = 404, b"<html><body>404 not found</body></html>"
+        elif path in STATIC:
+            content_type, body, compressed, cache_control = STATIC[path]
+            if compressed and "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                headers["Content-Encoding"] = "gzip"
+            if cache_control:
+                headers["Cache-Control"] = cache_control
+        elif path.startswith("/img/"):
+            content_type, body = "image/png", PNG_IMAGE
+        elif path.startswith("/slow/"):
+            time.sleep(server.slow_latency)
+            body = b"<html><body>slow</body></html>"
+        elif path.startswith("/fail/"):
+            status, body = 500, b"<html><body>server error</body></html>"
+        elif path == "/robots.txt":
+            content_type = "text/plain"
+            body = f"User-agent: *\nDisallow:\nSitemap: {base}/sitemap_index.xml\n".encode()
+        elif path == "/sitemap_index.xml":
+            content_type = "application/xml"
+            body = (f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                    f'<sitemap><loc>{base}/sitemap-pages.xml.gz</loc></sitemap></sitemapindex>').encode()
+        elif path == "/sitemap-pages.xml.gz":
+            content_type = "application/gzip"
+            entries = "".join(f"<url><loc>{base}{page_path(i)}</loc><lastmod>2024-01-01</lastmod></url>"
+                              for i in range(server.pages))
+            body = gzip.compress(f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/'
+                                 f'schemas/sitemap/0.9">{entries}</urlset>'.encode())
+        elif path == "/pagespeedonline/v5/runPagespeed":
+            time.sleep(server.pagespeed_latency)
+            content_type, body = "application/json", json.dumps(LIGHTHOUSE_RESULT).encode()
+        else:
+            status, body = 404, b"<html><body>404 not found</body></html>"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, pages=100, links=20, images=10, words=300, latency=0.05, slow_every=0, slow_latency=1.0,
+                 fail_every=0, pagespeed_latency=0.0, seed=0):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.pages = pages
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.pagespeed_latency = pagespeed_latency
+        self.options = dict(pages=pages, links=links, images=images, words=words, slow_every=slow_every,
+                            fail_every=fail_every, seed=seed)
+        self.cache = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def page(self, index):
+        body = self.cache.get(index)
+        if body is None:
+            body = self.cache[index] = build_page(index, **self.options).encode()
+        return body
+
+    def page_urls(self):
+        return [self.url.rstrip("/") + page_path(i) for i in range(self.pages)]
+
+
+def start_fixture_server(**options):
+    # Returns (server, url); call server.shutdown() when done
+    server = FixtureServer(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.url
+
+
+def install_stub_backends(whois_latency=0.5, pagespeed_latency=1.0):
+    # Points PageSpeed at a local fixture server and replaces the WHOIS
+    # lookup with a stub, so audits never reach Google or WHOIS servers.
+    # Returns the PageSpeed server.
+    import whois
+    from process import config
+
+    def stub_whois(domain_name):
+        time.sleep(whois_latency)
+        return types.SimpleNamespace(domain_name=domain_name, registrar="Stub Registrar", creation_date="2000-01-01",
+                                     expiration_date="2100-01-01", updated_date="2024-01-01",
+                                     name_servers=["ns1.stub", "ns2.stub"], status="ok")
+
+    whois.whois = stub_whois
+    server, url = start_fixture_server(pages=1, latency=0, pagespeed_latency=pagespeed_latency)
+    config.PAGESPEED_API_URL = url + "pagespeedonline/v5/runPagespeed"
+    return server
@@ -1,19 +1,56 @@
-import requests
-from bs4 import BeautifulSoup
-from collections import Counter
-from datetime import datetime
-import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
+import functools
+import time
 from urllib.parse import urljoin, urlparse
-from nltk.corpus import stopwords
-import whois
 from process.pagespeed import get_pagespeed_metrics
-from process.helpers import get_image_size, check_custom_404
+from process.helpers import check_custom_404, check_robots_sitemap_https
+from process.images import resolve_image_src, probe_images
+from process.keywords import analyze, top_keywords
+from process.duplicates import content_signature
+from process.links import find_broken_links
+from process.pageweight import document_resource, page_resources, page_weight, probe_resources
+from process.extract import extract_response, read_body
+from process.history import (PAGE_KEYS, body_fingerprint, diff_reports, find_broken_links_incremental,
+                             probe_images_incremental)
+from process import config, metrics
+from process.network import get_session, page_timeout
+from process.memo import memoize, without_error
+from process.ratelimit import get_limiter
 
 
+def __getattr__(name):
+    # generate_html_report is still importable from here; Jinja2 is only
+    # loaded once a report is rendered
+    if name == "generate_html_report":
+        from process.report import generate_html_report
+        return generate_html_report
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def preload():
+    # Import everything an audit loads lazily (WHOIS, Jinja2, the parser
+    # backend, the NLTK stopword corpus). Pre-fork servers call this in the
+    # parent so every forked worker starts warm and shares these pages.
+    import whois  # noqa: F401
+    from process import report  # noqa: F401
+    from process.extract import extract_page
+    from process.keywords import stop_words
+    extract_page("<html></html>")
+    stop_words()
+
+
+@memoize("whois", ttl=config.WHOIS_CACHE_TTL, should_cache=without_error)
 def get_domain_details(domain_name):
+    import whois
+
     try:
-        # Perform the WHOIS lookup
-        domain_info = whois.whois(domain_name)
+        # Perform the WHOIS lookup, within the WHOIS servers' rate limit
+        limiter = get_limiter()
+        with limiter.slot("whois") as state:
+            start = time.monotonic()
+            domain_info = whois.whois(domain_name)
+            limiter.record(state, None, time.monotonic() - start)
         
         # Handling the case where domain_info is a string or a list
         if isinstance(domain_info, str):
@@ -35,28 +72,50 @@ def get_domain_details(domain_name):
     except Exception as e:
         return {'Error': str(e)}
 
-def extract_top_keywords(soup):
-        # Get the text content from the soup
-        text = soup.get_text()
+def extract_top_keywords(text, lang=None):
+    # Top 15 keywords, without stopwords of the page's language
+    return top_keywords(text, lang)
 
-        # Convert text to lowercase and extract words
-        words = re.findall(r'\w+', text.lower())
 
-        # Define common stop words to exclude
-        stop_words = set(stopwords.words('english'))  # Using NLTK's stop words
+# Report fields of the site-level checks (check_robots_sitemap_https and the
+# custom 404 probe), left out of check_tags' report when site_checks is off
+SITE_KEYS = ("Custom 404 Page", "Robots.txt Available", "Sitemap.xml Available", "HTTPS")
 
-        # Filter out stop words
-        filtered_words = [word for word in words if word not in stop_words]
 
-        # Count the frequency of remaining words
-        word_counts = Counter(filtered_words)
+def check_tags(url, api_key, site_checks=True, progress=None, history=None, keyword_index=None, pagespeed=None):
+    # site_checks=False skips the domain-level WHOIS, PageSpeed and custom 404
+    # checks, for crawls where they only need to run once per site.
+    # pagespeed turns the PageSpeed Insights runs on or off (default
+    # config.PAGESPEED_ENABLED); page weight is always measured locally.
+    # progress(message) is called as each stage starts.
+    # history (an AuditHistory) turns on incremental mode, see process/history.py.
+    # keyword_index (a keywords.TfIdf) collects the page's word counts.
+    # Stage timings, request counts and errors go in report["Audit Metrics"].
+    report = {}
+    for _, fields in iter_check_tags(url, api_key, site_checks, progress, history, keyword_index, pagespeed):
+        report.update(fields)
+    return report
 
-        # Return the top 15 keywords
-        return word_counts.most_common(15)
 
+def iter_check_tags(url, api_key, site_checks=True, progress=None, history=None, keyword_index=None,
+                    pagespeed=None):
+    # check_tags as (section, fields) pairs, each yielded as soon as its stage
+    # completes: "page" (everything read from the page itself) right after
+    # the fetch, then "links", "images", "page weight", "pagespeed mobile",
+    # "pagespeed desktop", "custom 404" and "whois" in whichever order they
+    # finish, "changes" in incremental mode and "metrics" last. Merging the
+    # fields in order gives check_tags' report.
+    with metrics.trace() as trace:
+        pagespeed = config.PAGESPEED_ENABLED if pagespeed is None else pagespeed
+        yield from _check_tags(url, api_key, site_checks, progress or (lambda message: None),
+                               history, keyword_index, pagespeed, trace)
+        yield "metrics", {"Audit Metrics": trace.summary()}
 
-def check_tags(url, api_key):
-    response = requests.get(url)
+
+def _check_tags(url, api_key, site_checks, progress, history, keyword_index, pagespeed, trace):
+    progress("Fetching page")
+    with trace.span("fetch"):
+        response = get_session().get(url, stream=True, timeout=page_timeout())
     report = {
         "URL": url,
         'Favicon Link': "",
@@ -89,401 +148,212 @@ def check_tags(url, api_key):
         
     }
     
+    if not site_checks:
+        # Filled in by the caller's once-per-site checks, which must not be
+        # overwritten by these placeholders
+        for key in SITE_KEYS:
+            del report[key]
+    report["Status Code"] = response.status_code
+    previous = history.previous(url) if history is not None else None
+    etag = response.headers.get("ETag")
+    body = fingerprint = None
     if response.status_code == 200:
-        soup = BeautifulSoup(response.content, 'html.parser')
         # Extract the domain name from the URL
         parsed_url = urlparse(url)
         domain_name = parsed_url.netloc
 
-        # Pass the domain name to the get_domain_details function
-        whois_info = get_domain_details(domain_name)
+        # The remote checks only need the URL, so start them before parsing.
+        # Each stage runs on the pool and is yielded as soon as it completes.
+        pool = ThreadPoolExecutor(max_workers=config.AUDIT_STAGE_WORKERS)
+        if site_checks:
+            whois_future = pool.submit(trace.timed("whois", get_domain_details), domain_name)
+            custom_404_future = pool.submit(trace.timed("custom 404", check_custom_404), url)
+        if site_checks and pagespeed:
+            mobile_future = pool.submit(trace.timed("pagespeed mobile", get_pagespeed_metrics), url, api_key, "mobile")
+            desktop_future = pool.submit(trace.timed("pagespeed desktop", get_pagespeed_metrics), url, api_key, "desktop")
 
-        # Add WHOIS information to the report
-        report.update(whois_info)
-        # Process title, description, h1.
-        favicon = soup.find('link', rel='icon') or soup.find('link', rel='shortcut icon')
-        if favicon and 'href' in favicon.attrs:
-            # Join the base URL with the favicon href to ensure it's a full URL
-            favicon_url = urljoin(url, favicon['href'])
-            report['Favicon Link'] = favicon_url
+        if history is not None:
+            check_links_stage = functools.partial(find_broken_links_incremental, history=history)
+            probe_images_stage = functools.partial(probe_images_incremental, history=history)
         else:
-            report['Favicon Link'] = 'No favicon link'
-        report["Title"] = soup.find('title').text if soup.find('title') else "No title"
-        report["Description"] = soup.find('meta', attrs={'name': 'description'})['content'] if soup.find('meta', attrs={'name': 'description'}) else "No description"
-        report["H1 Tags Text"] = [h1.get_text(strip=True) for h1 in soup.find_all('h1')] if soup.find_all('h1') else "No H1 tags"
-        # Heading Tags Count
-        report["H1 Count"] = len(soup.find_all('h1'))
-        report["H2 Count"] = len(soup.find_all('h2'))
-        report["H3 Count"] = len(soup.find_all('h3'))
-        report["H4 Count"] = len(soup.find_all('h4'))
-        report["H5 Count"] = len(soup.find_all('h5'))
-        report["H6 Count"] = len(soup.find_all('h6'))
-        # ... add more parsing logic for images, links, etc.
-        report["Canonical Tag"] = soup.find('link', rel='canonical')['href'] if soup.find('link', rel='canonical') else "No canonical tag"
-        report["Robots Tag"] = soup.find('meta', attrs={'name': 'robots'})['content'] if soup.find('meta', attrs={'name': 'robots'}) else "No robots tag"
-        report["OG Tags Available"] = "Yes" if soup.find_all('meta', attrs={'property': lambda x: x and x.startswith('og:')}) else "No"
-        schema_tag = soup.find_all('script', type='application/ld+json')
-        report["Schema Markup Available"] = "Yes" if schema_tag else "No"
-        # # iFrame detection
-        # iFrame detection with multiple 'src'-like attributes
-        iframes = soup.find_all('iframe')
-        # Check for 'src', 'data-src', or any other 'src'-like attributes
-        report['iframes'] = [
-            {attr: iframe.get(attr, 'No value') for attr in iframe.attrs if 'src' in attr} 
-            for iframe in iframes
-        ] if iframes else ["Great! No iframes"]
+            check_links_stage, probe_images_stage = find_broken_links, probe_images
+        check_links_stage = trace.timed("links", check_links_stage)
+        probe_images_stage = trace.timed("images", probe_images_stage)
 
-        # Social media links detection
-        social_links = []
-        social_domains = ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com', 'youtube.com']
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            if any(social_domain in href for social_domain in social_domains):
-                social_links.append(href)
-        report['social_media_links'] = social_links if social_links else 'No social media links'
-        # Broken links detection
-        broken_links = []
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            full_url = urljoin(url, href)
-            try:
-                link_response = requests.get(full_url)
-                if link_response.status_code == 404:
-                    broken_links.append(full_url)
-            except requests.RequestException:
-                broken_links.append(full_url)
-        report['broken_links'] = broken_links if broken_links else "All links well good"
-        # Image        
-        images = soup.find_all('img')
-        report["Image Count"] = len(images)
-        report["Images with Alt Text"] = sum(1 for img in images if img.get('alt'))
-    
-        for img in images:
-            src = img.get('src')
-            alt = img.get('alt', 'N/A')
-            full_url = urljoin(url, src)
-            size = get_image_size(full_url)
-            report["Image Details"].append({"src": full_url, "alt": alt, "size": size})
+        # In incremental mode a page with the same ETag or body fingerprint as
+        # last time reuses the page fields of its previous report unparsed
+        # (unless its word counts are needed for the keyword index)
+        if history is not None and not (previous and etag and etag == previous[1]):
+            with trace.span("download"):
+                body = read_body(response)
+            fingerprint = body_fingerprint(body)
+        elif previous:
+            fingerprint = previous[0]
+        if previous and fingerprint is not None and fingerprint == previous[0] and keyword_index is None:
+            progress("Page unchanged")
+            response.close()
+            report.update({key: previous[2][key] for key in PAGE_KEYS if key in previous[2]})
+            full_links = report["Internal Links"] + report["External Links"]
+            broken_future = pool.submit(check_links_stage, full_links)
+            image_rows = [(image["src"], image["alt"], image.get("srcset", [])) for image in previous[2]["Image Details"]]
+            images_future = pool.submit(probe_images_stage, [full_url for full_url, _, _ in image_rows])
+            weight_future = None
+        else:
+            # Walk the document once, as it downloads, and collect every on-page signal
+            progress("Parsing page")
+            # Streamed parsing: this span includes downloading the body
+            with trace.span("parse"):
+                page = extract_response(response, body=body)
+            # Stylesheets, scripts and fonts are measured alongside the link and image checks
+            document = document_resource(url, response, page.size)
+            weight_future = pool.submit(trace.timed("page weight", probe_resources), page_resources(url, page))
+            # Process title, description, h1.
+            if page.favicon:
+                # Join the base URL with the favicon href to ensure it's a full URL
+                report['Favicon Link'] = urljoin(url, page.favicon)
+            else:
+                report['Favicon Link'] = 'No favicon link'
+            report["Title"] = page.title if page.title is not None else "No title"
+            report["Description"] = page.description if page.description is not None else "No description"
+            report["H1 Tags Text"] = page.h1_texts if page.h1_texts else "No H1 tags"
+            # Heading Tags Count
+            for tag, count in page.heading_counts.items():
+                report[f"{tag.upper()} Count"] = count
+            report["Canonical Tag"] = page.canonical if page.canonical is not None else "No canonical tag"
+            report["Robots Tag"] = page.robots if page.robots is not None else "No robots tag"
+            report["OG Tags Available"] = "Yes" if page.og_tags else "No"
+            report["Schema Markup Available"] = "Yes" if page.schema_markup else "No"
+            # iFrame detection with multiple 'src'-like attributes ('src', 'data-src'...)
+            report['iframes'] = page.iframes if page.iframes else ["Great! No iframes"]
+
+            # Social media links detection
+            social_domains = ['facebook.com', 'twitter.com', 'instagram.com', 'linkedin.com', 'youtube.com']
+            social_links = [href for href in page.links if any(social_domain in href for social_domain in social_domains)]
+            report['social_media_links'] = social_links if social_links else 'No social media links'
 
+            # Links
+            full_links = [urljoin(url, href) for href in page.links]
+            # Broken links detection
+            broken_future = pool.submit(check_links_stage, full_links)
             internal_links = []
             external_links = []
-            parsed_url = urlparse(url)
-        # Links
-        for a in soup.find_all('a', href=True):
-            href = a['href']
-            full_url = urljoin(url, href)
-            if urlparse(full_url).netloc == parsed_url.netloc:
-                internal_links.append(full_url)
-            else:
-                external_links.append(full_url)
-                
-        report["Internal Links"] = internal_links
-        report["External Links"] = external_links
-        
-        report["Top Keywords"] = extract_top_keywords(soup)
-    
-        # Fetch Google PageSpeed Insights metrics
-        report["PageSpeed Metrics Mobile"] = get_pagespeed_metrics(url, api_key, "mobile")
-        report["PageSpeed Metrics Desktop"] = get_pagespeed_metrics(url, api_key, "desktop")
-        
-        # Custom 404 page check
-        report["Custom 404 Page"] = check_custom_404(url)
+            for full_url in full_links:
+                if urlparse(full_url).netloc == parsed_url.netloc:
+                    internal_links.append(full_url)
+                else:
+                    external_links.append(full_url)
+            report["Internal Links"] = internal_links
+            report["External Links"] = external_links
 
-    return report
+            # Image
+            report["Image Count"] = len(page.images)
+            report["Images with Alt Text"] = sum(1 for img in page.images if img.get('alt'))
+            image_rows = []
+            for img in page.images:
+                src, srcset = resolve_image_src(img)
+                image_rows.append((urljoin(url, src) if src else url, img.get('alt', 'N/A'), [urljoin(url, candidate) for candidate in srcset]))
+            # Each distinct image is probed once, concurrently
+            images_future = pool.submit(probe_images_stage, [full_url for full_url, _, _ in image_rows])
 
-def generate_html_report(report, filename="seo_audit_report.html"):
-    internal_links = report.get("Internal Links", [])
-    external_links = report.get("External Links", [])
-    num_rows = max(len(internal_links), len(external_links))
-    rows_html = ''
-    
-    for i in range(num_rows):
-        internal_link = internal_links[i] if i < len(internal_links) else ''
-        external_link = external_links[i] if i < len(external_links) else ''
-        rows_html += f"<tr><td>{internal_link}</td><td>{external_link}</td></tr>"
-                
-    current_date = datetime.now().strftime("%I:%M %p %d-%m-%y")
+            with trace.span("keywords"):
+                keywords = analyze(page.text, page.lang)
+                report["Content Signature"] = content_signature(keywords)
+            report["Language"] = page.lang or "Not specified"
+            report["Top Keywords"] = keywords.top(15)
+            report["Top Bigrams"] = keywords.top_bigrams(10)
+            report["Top Trigrams"] = keywords.top_trigrams(10)
+            if keyword_index is not None:
+                keyword_index.add(url, keywords.words)
 
-    for key, value in report.items():
-        if value is None:
-            report[key] = "Null"
+        yield "page", dict(report)
 
-    html_content = f"""
-    <html>
-    <head>
-        <title>Report - Website & SEO Audit</title>
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.2.1/dist/css/bootstrap.min.css" rel="stylesheet">
-        <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.2.1/dist/js/bootstrap.bundle.min.js"></script>
-        <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.2/font/bootstrap-icons.min.css">
-        <style>
-            body {{ font-family: Poppins, sans-serif; margin: 50px; }}
-            h2 {{ color: #00B899; margin-top: 50px }}
-            h1{{font-size: 35px;color: #00B899;}}
-            h2{{font-size: 30px;}}
-            h3{{font-size: 25px; color: #545454;}} 
-            p{{font-size: 18px; margin: 5px 0px 5px 0px;}}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 20px; }}
-            th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-            th {{ background-color: #f2f2f2; }}
-            .collapsible {{cursor: pointer; padding: 10px; text-align: left; }}
-            .content {{ display: none; padding: 0 18px; }}
-            .tabsplit{{width: 48% !important;}}
-            .tabspace th, .tabspace td{{padding: 20px 5px !important; text-align: center;}}
-        </style>
-    </head>
-    <body>
-        <div class="d-flex justify-content-between">
-            <div>
-                <h1>Website & SEO Audit Report</h1>
-                <p><strong>URL:</strong> {report["URL"]}</p>
-                <p><strong>Generated on:</strong> {current_date}</p>
-            </div>
-            <div class="my-auto">
-                <img src="{report["URL"]}{report["Favicon Link"]}" width="100px", height="100px"/>
-            </div>
-        </div>
+        # Gather the concurrent stages as they finish
+        stages = {broken_future: "links", images_future: "images"}
+        if weight_future is not None:
+            stages[weight_future] = "page weight"
+        if site_checks and pagespeed:
+            stages[mobile_future] = "pagespeed mobile"
+            stages[desktop_future] = "pagespeed desktop"
+        if site_checks:
+            stages[custom_404_future] = "custom 404"
+            stages[whois_future] = "whois"
+        images_in = False
+        try:
+            for future in as_completed(stages):
+                stage = stages[future]
+                waiting = [name for other, name in stages.items() if not other.done()]
+                if waiting:
+                    progress(f"Waiting for {', '.join(waiting)}")
+                if stage == "links":
+                    fields = {"broken_links": future.result() or "All links well good"}
+                elif stage == "images":
+                    image_info = future.result()
+                    image_details = []
+                    for full_url, alt, srcset in image_rows:
+                        details = {"src": full_url, "alt": alt, **image_info.get(full_url, {"size": "N/A"})}
+                        if srcset:
+                            details["srcset"] = srcset
+                        image_details.append(details)
+                    fields = {"Image Details": image_details}
+                    images_in = True
+                elif stage == "page weight":
+                    # Counts the images too, so it is yielded once they are in
+                    fields = None
+                elif stage == "pagespeed mobile":
+                    fields = {"PageSpeed Metrics Mobile": future.result()}
+                elif stage == "pagespeed desktop":
+                    fields = {"PageSpeed Metrics Desktop": future.result()}
+                elif stage == "custom 404":
+                    fields = {"Custom 404 Page": future.result()}
+                else:
+                    # WHOIS information
+                    fields = future.result()
+                if fields is not None:
+                    report.update(fields)
+                    yield stage, fields
+                # Once the image sizes are in the report, not merely probed
+                if (stage in ("images", "page weight") and weight_future is not None
+                        and weight_future.done() and images_in):
+                    fields = {"Page Weight": page_weight(document, weight_future.result(), report["Image Details"])}
+                    report.update(fields)
+                    weight_future = None
+                    yield "page weight", fields
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    else:
+        response.close()
+        yield "page", dict(report)
 
-        <h2>On-Page SEO Metrics</h2>
-        <div class="card p-4">
-            <div class="card-body">
-                <h3>Title</h3>
-                <div class="d-flex flex-row justify-content-between">
-                    <p class="w-75 text-justify">{report['Title']}</p>
-                    <p><span class="badge text-bg-secondary p-2 text-center">{len(report['Title'])} char</span></p>
-                </div>
-            </div>
-            <div class="card-body">
-                <h3>Description</h3>
-                <div class="d-flex flex-row justify-content-between">
-                    <p class="w-75 text-justify">{report['Description']}</p>
-                    <p><span class="badge text-bg-secondary p-2 text-center">{len(report['Description'])} char</span></p>
-                </div>
-            </div>
-            <div class="card-body">
-                <h3>H1 Tags</h3>
-                <div>
-                    <p>{"".join(f"<p>{text}</P>" for text in report['H1 Tags Text'])}</p>
-                </div>
-            </div>
-            <div class="card">
-                <div class="d-flex justify-content-around card-body">
-                        <div class="text-center">
-                            <h3>{report["H1 Count"]}</h3>
-                            <p>H1 Tags</p>
-                        </div>
-                        <div class="text-center">
-                            <h3>{report["H2 Count"]}</h3>
-                            <p>H2 Tags</p>
-                        </div>
-                        <div class="text-center">
-                            <h3>{report["H3 Count"]}</h3>
-                            <p>H3 Tags</p>
-                        </div>
-                        <div class="text-center">
-                            <h3>{report["H4 Count"]}</h3>
-                            <p>H4 Tags</p>
-                        </div>
-                        <div class="text-center">
-                            <h3>{report["H5 Count"]}</h3>
-                            <p>H5 Tags</p>
-                        </div>
-                        <div class="text-center">
-                            <h3>{report["H6 Count"]}</h3>
-                            <p>H6 Tags</p>
-                        </div>
-                </div>
-            </div>
-          </div>
-        <h2>Image & Links</h2>
-          <div class="accordion accordion-flush" id="accordionFlushExample">
-            <div class="accordion-item">
-              <h2 class="accordion-header">
-                <button class="accordion-button collapsed" type="button" data-bs-toggle="collapse" data-bs-target="#flush-collapseOne" aria-expanded="false" aria-controls="flush-collapseOne">
-                  List of Image Details
-                </button>
-              </h2>
-              <div id="flush-collapseOne" class="accordion-collapse collapse" data-bs-parent="#accordionFlushExample">
-                <table class="accordion-body tabspace table-striped table-hover">
-                    <tr><th>Source</th><th>Alt Text</th><th>Size (KB)</th></tr>
-                    {''.join(f"<tr><td>{img['src']}</td><td>{img['alt']}</td><td>{img['size']}</td></tr>" for img in report["Image Details"])}
-                </table>
-              </div>
-            </div>
-            <div class="accordion-item">
-              <h2 class="accordion-header">
-                <button class="accordion-button collapsed" type="button" data-bs-toggle="collapse" data-bs-target="#flush-collapseTwo" aria-expanded="false" aria-controls="flush-collapseTwo">
-                  List of Links Details
-                </button>
-              </h2>
-              <div id="flush-collapseTwo" class="accordion-collapse collapse" data-bs-parent="#accordionFlushExample">
-                <table class="accordion-body tabspace table-striped table-hover">
-                    <tr><th>Internal Links</th><th>External Links</th></tr>
-                    {rows_html}
-                </table>
-              </div>
-            </div>
-          </div>
-          
-          <div class="card mt-5">
-            <div class="d-flex justify-content-around card-body">
-                    <div class="text-center">
-                        <h3>{report['Image Count']}</h3>
-                        <p>Img Count</p>
-                    </div>
-                    <div class="text-center">
-                        <h3>{report['Images with Alt Text']}</h3>
-                        <p>Img With Alt</p>
-                    </div>
-                    <div class="text-center">
-                        <h3>{len(report['Internal Links'])}</h3>
-                        <p>Internal Links</p>
-                    </div>
-                    <div class="text-center">
-                        <h3>{len(report['External Links'])}</h3>
-                        <p>External Links</p>
-                    </div>
-            </div>
-        </div>
-        <h2>Technical SEO Metrics</h2>
-        <div class="d-flex justify-content-between">
-            <table class="table tabspace tabsplit table-striped table-hover">
-                <tbody>
-                <tr>
-                    <th scope="row">Canonical Tag</th>
-                    <td>{report['Canonical Tag']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Robots Tag</th>
-                    <td>{report['Robots Tag']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">OG Tags</th>
-                    <td>{report['OG Tags Available']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Schema Markup Tags</th>
-                    <td>{report['Schema Markup Available']}</td>
-                </tr>
-                </tbody>
-            </table>
-            <table class="table tabspace tabsplit table-striped table-hover">
-                <tbody>
-                <tr>
-                    <th scope="row">HTTPS</th>
-                    <td>{report['HTTPS']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Custom 404 Page</th>
-                    <td>{report['Custom 404 Page']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Robots.txt</th>
-                    <td>{report['Robots.txt Available']}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Sitemap.xml</th>
-                    <td>{report['Sitemap.xml Available']}</td>
-                </tr>
-                </tbody>
-            </table>
-        </div>  
-        <h2>PageSpeed Insights</h2>
-        <table class="table tabspace table-striped table-hover w-100">
-            <thead>
-                <tr>
-                  <th scope="col">Metrics</th>
-                  <th scope="col">Mobile</th>
-                  <th scope="col">Desktop</th>
-                </tr>
-              </thead>
-            <tbody>
-            <tr>
-                <th scope="row">Performance Score</th>
-                <td>{report['PageSpeed Metrics Mobile']['Performance Score']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['Performance Score']}</td>
-            </tr>
-            <tr>
-                <th scope="row">First Contentful Paint</th>
-                <td>{report['PageSpeed Metrics Mobile']['First Contentful Paint']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['First Contentful Paint']}</td>
-            </tr>
-            <tr>
-                <th scope="row">Largest Contentful Paint</th>
-                <td>{report['PageSpeed Metrics Mobile']['Largest Contentful Paint']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['Largest Contentful Paint']}</td>
-            </tr>
-            <tr>
-                <th scope="row">Cumulative Layout Shift</th>
-                <td>{report['PageSpeed Metrics Mobile']['Cumulative Layout Shift']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['Cumulative Layout Shift']}</td>
-            </tr>
-            <tr>
-                <th scope="row">Speed Index</th>
-                <td>{report['PageSpeed Metrics Mobile']['Speed Index']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['Speed Index']}</td>
-            </tr>
-            <tr>
-                <th scope="row">Total Blocking Time</th>
-                <td>{report['PageSpeed Metrics Mobile']['Total Blocking Time']}</td>
-                <td>{report['PageSpeed Metrics Desktop']['Total Blocking Time']}</td>
-            </tr>
-            </tbody>
-        </table>
-        <h2>Top 15 Keywords</h2>
-            {" ".join(f'<span class="badge text-bg-secondary p-2 my-2">{keyword} {count}</span>' for keyword, count in report["Top Keywords"])}
-        <h2>Other Links</h2>
-        <div class="d-flex justify-content-between">
-                <table class="table tabspace table-striped table-hover text-start">
-                    <tbody>
-                    <tr>
-                        <th scope="row" class="text-start">Social Media Links: {len(report['social_media_links'])}</th>
-                    </tr>
-                    <tr>
-                        <td class="text-start">{", ".join(report['social_media_links'])}</td>
-                    </tr>
-                    <tr>
-                        <th scope="row" class="text-start">Broken Links: {len(report['broken_links'])}</th>
-                    </tr>
-                    <tr>
-                        <td class="text-start">{", ".join(report['broken_links'])}</td>
-                    </tr>
-                    <tr>
-                        <th scope="row" class="text-start">iFrame Detection: {len(report['iframes'])}</th>
-                    </tr>
-                    <tr>
-                        <td class="text-start">{", ".join([iframe['src'] for iframe in report['iframes'] if 'src' in iframe])}</td>
-                    </tr>
-                    </tbody>
-                </table>
-            </div> 
-            
-        <h2>WHOIS Domain Information</h2>
-            <table class="table tabspace table-striped table-hover">
-                <tbody>
-                <tr>
-                    <th scope="row">Domain Name</th>
-                    <td>{report.get("Domain Name", "No data available")}</td>
-                    <th scope="row">Registrar</th>
-                    <td>{report.get("Registrar", "No data available")}</td>
-                </tr>
-                <tr>
-                    <th scope="row">Creation Date</th>
-                    <td>{report.get("Creation Date", "No data available")}</td>
-                    <th scope="row">Expiration Date</th>
-                    <td>{report.get("Expiration Date", "No data available")}</td>
-                </tr>
-                <tr>
-                    <th scope="row" colspan="3">Last Updated</th>
-                    <td>{report.get("Last Updated", "No data available")}</td>
-                </tr>
-                </tbody>
-            </table>
+    if history is not None:
+        if previous:
+            report["Changes"] = diff_reports(previous[2], report)
+            yield "changes", {"Changes": report["Changes"]}
+        history.record(url, fingerprint, etag, report)
 
-    </body>
-    </html>
-    """
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    return filename
+
+def iter_audit(url, api_key, progress=None):
+    # run_audit as (section, fields) pairs, like iter_check_tags, with the
+    # robots.txt / sitemap checks as a "robots" section once they finish
+    with metrics.trace() as trace:
+        # robots.txt / sitemap.xml checks don't depend on the page, run them alongside check_tags
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            robots_future = pool.submit(trace.timed("robots", check_robots_sitemap_https), url)
+            for section, fields in iter_check_tags(url, api_key, progress=progress):
+                if section == "metrics":
+                    continue
+                yield section, fields
+                if robots_future is not None and robots_future.done():
+                    yield "robots", robots_future.result()
+                    robots_future = None
+            if robots_future is not None:
+                yield "robots", robots_future.result()
+        yield "metrics", {"Audit Metrics": trace.summary()}
+
+
+def run_audit(url, api_key, progress=None, profile=None):
+    # profile is a file to write a profile of this audit to (see metrics.profiled)
+    full_report = {}
+    with metrics.profiled(profile) if profile else contextlib.nullcontext():
+        for _, fields in iter_audit(url, api_key, progress):
+            full_report.update(fields)
+    return full_report
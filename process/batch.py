@@ -0,0 +1,202 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from process import config
+from process.duplicates import DuplicateIndex
+from process.history import tee_changes
+from process.linkgraph import LinkGraph
+from process.model import EXPORT_FORMATS, write_reports
+
+# Batch audits for large URL lists. Page checks run on a process pool while
+# the per-domain work (robots.txt, sitemap.xml, HTTPS, WHOIS, custom 404
+# probe) runs once per domain and is merged into each of its pages' results.
+# Results are yielded, and written as JSON Lines, as each URL completes.
+
+
+def audit_page(url, api_key, incremental=False, pagespeed=None):
+    from process.audit import check_tags
+    from process.history import get_history
+    from process.pagespeed import get_pagespeed_metrics
+
+    pagespeed = config.PAGESPEED_ENABLED if pagespeed is None else pagespeed
+    try:
+        report = check_tags(url, api_key, site_checks=False, history=get_history() if incremental else None)
+        if pagespeed:
+            report["PageSpeed Metrics Mobile"] = get_pagespeed_metrics(url, api_key, "mobile")
+            report["PageSpeed Metrics Desktop"] = get_pagespeed_metrics(url, api_key, "desktop")
+        return report
+    except Exception as e:
+        return {"URL": url, "Error": str(e)}
+
+
+def audit_domain(url, full_sitemaps=True):
+    # full_sitemaps=False keeps the sitemap check to its first file, for
+    # callers that read the sitemaps themselves (crawls)
+    from process.audit import get_domain_details
+    from process.helpers import check_custom_404, check_robots_sitemap_https
+
+    report = {}
+    try:
+        report.update(check_robots_sitemap_https(url, full_sitemaps=full_sitemaps))
+        report["Custom 404 Page"] = check_custom_404(url)
+    except Exception as e:
+        report["Domain Error"] = str(e)
+    whois = dict(get_domain_details(urlparse(url).netloc))
+    if "Error" in whois:
+        # Not the page's own Error
+        report["WHOIS Error"] = whois.pop("Error")
+    report.update(whois)
+    return report
+
+
+def merge_domain(report, domain_report):
+    # A page report with its domain's results; the page's own fields win
+    return {**domain_report, **report}
+
+
+def check_urls(urls):
+    # The URLs of a JSON list, stripped; ValueError unless it is a list of non-empty strings
+    if not isinstance(urls, list):
+        raise ValueError("Expected a list of URLs")
+    if not all(isinstance(url, str) and url.strip() for url in urls):
+        raise ValueError("Every URL must be a non-empty string")
+    return [url.strip() for url in urls]
+
+
+def read_urls(source):
+    # A JSON list of URLs, or one URL per line (blank lines and # comments
+    # skipped). ValueError for malformed input.
+    text = source.read() if hasattr(source, "read") else source
+    if text.lstrip().startswith("["):
+        return check_urls(json.loads(text))
+    lines = (line.strip() for line in text.splitlines())
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def batch_audit(urls, api_key="", workers=None, per_domain=None, domain_interval=None, incremental=False,
+                pagespeed=None):
+    workers = workers or config.BATCH_WORKERS
+    per_domain = per_domain or config.BATCH_PER_DOMAIN
+    domain_interval = config.BATCH_DOMAIN_INTERVAL if domain_interval is None else domain_interval
+    # Decided here, spawned workers don't see config changes made by the caller
+    pagespeed = config.PAGESPEED_ENABLED if pagespeed is None else pagespeed
+
+    queues = defaultdict(deque)
+    for url in dict.fromkeys(urls):
+        queues[urlparse(url).netloc].append(url)
+
+    domain_results = {}
+    waiting = defaultdict(list)   # finished pages whose domain checks are still running
+    running = defaultdict(int)
+    next_start = defaultdict(float)
+
+    if multiprocessing.get_start_method() == "fork":
+        # Forked workers inherit the parent's modules, import the audit stack once here
+        from process.audit import preload
+        preload()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for domain, queue in queues.items():
+            pending[pool.submit(audit_domain, queue[0])] = ("domain", domain)
+
+        while queues or pending:
+            # Start pages for every domain under its concurrency and rate limits
+            now = time.monotonic()
+            for domain in list(queues):
+                queue = queues[domain]
+                while (queue and running[domain] < per_domain and next_start[domain] <= now
+                       and len(pending) < workers * 2):
+                    future = pool.submit(audit_page, queue.popleft(), api_key, incremental, pagespeed)
+                    pending[future] = ("page", domain)
+                    running[domain] += 1
+                    next_start[domain] = now + domain_interval
+                if not queue:
+                    del queues[domain]
+
+            # Sleep until a completion, or until a rate-limited domain may start again
+            timeout = None
+            startable = [next_start[domain] for domain in queues if running[domain] < per_domain]
+            if startable and len(pending) < workers * 2:
+                timeout = max(0.01, min(startable) - now)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, domain = pending.pop(future)
+                if kind == "domain":
+                    domain_results[domain] = future.result()
+                    for report in waiting.pop(domain, []):
+                        yield merge_domain(report, domain_results[domain])
+                else:
+                    running[domain] -= 1
+                    if domain in domain_results:
+                        yield merge_domain(future.result(), domain_results[domain])
+                    else:
+                        waiting[domain].append(future.result())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit a list of URLs, one JSON report per line.")
+    parser.add_argument("input", help="File with one URL per line or a JSON list ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="Output file (JSON Lines), defaults to stdout; "
+                                                "a directory for csv and parquet")
+    parser.add_argument("--format", choices=("raw",) + EXPORT_FORMATS, default="raw",
+                        help="raw writes the report dicts as they are, the others the typed model")
+    parser.add_argument("--api-key", default="", help="Google PageSpeed API key")
+    parser.add_argument("--pagespeed", action="store_true", default=config.PAGESPEED_ENABLED,
+                        help="Also run PageSpeed Insights on every page (slow; page weight is always measured)")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS)
+    parser.add_argument("--per-domain", type=int, default=config.BATCH_PER_DOMAIN,
+                        help="Maximum pages of one domain audited at the same time")
+    parser.add_argument("--domain-interval", type=float, default=config.BATCH_DOMAIN_INTERVAL,
+                        help="Seconds between starting two pages of the same domain")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the stored audit history: skip unchanged pages and fresh link checks")
+    parser.add_argument("--changes", help="With --incremental, write what changed on each page to this file")
+    parser.add_argument("--duplicates", help="Afterwards, write duplicate titles, descriptions and "
+                                             "near-duplicate pages (JSON) to this file")
+    parser.add_argument("--link-graph", help="Afterwards, write internal PageRank, click depth, inlinks and "
+                                             "orphan pages (JSON) to this file")
+    args = parser.parse_args(argv)
+    if args.format in ("csv", "parquet") and not args.output:
+        parser.error(f"--format {args.format} needs an --output directory")
+
+    try:
+        if args.input == "-":
+            urls = read_urls(sys.stdin)
+        else:
+            with open(args.input, encoding="utf-8") as f:
+                urls = read_urls(f)
+    except ValueError as e:
+        parser.error(f"{args.input}: {e}")
+
+    results = batch_audit(urls, args.api_key, args.workers, args.per_domain, args.domain_interval,
+                          incremental=args.incremental, pagespeed=args.pagespeed)
+    changes = open(args.changes, "w", encoding="utf-8") if args.changes else None
+    if changes is not None:
+        results = tee_changes(results, changes)
+    duplicates = DuplicateIndex() if args.duplicates else None
+    if duplicates is not None:
+        results = duplicates.track(results)
+    link_graph = LinkGraph() if args.link_graph else None
+    if link_graph is not None:
+        results = link_graph.track(results)
+    try:
+        write_reports(results, args.format, args.output)
+    finally:
+        if changes is not None:
+            changes.close()
+
+    if duplicates is not None:
+        duplicates.write(args.duplicates)
+
+    if link_graph is not None:
+        link_graph.write(args.link_graph)
+
+
+if __name__ == "__main__":
+    main()
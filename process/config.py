@@ -0,0 +1,188 @@
+import os
+
+# Runtime settings. Every value can be overridden with an environment variable
+# so the tool can be tuned without editing code.
+
+
+def _env_int(name, default):
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+USER_AGENT = os.environ.get("SEO_AUDIT_USER_AGENT", "Mozilla/5.0 (compatible; SEO-Audit-Tool/1.0)")
+
+# HTTP connection pooling
+HTTP_POOL_CONNECTIONS = _env_int("SEO_AUDIT_POOL_CONNECTIONS", 20)
+HTTP_POOL_MAXSIZE = _env_int("SEO_AUDIT_POOL_MAXSIZE", 32)
+
+# Broken link checker
+LINK_CHECK_CONNECT_TIMEOUT = _env_float("SEO_AUDIT_LINK_CONNECT_TIMEOUT", 5)
+LINK_CHECK_READ_TIMEOUT = _env_float("SEO_AUDIT_LINK_READ_TIMEOUT", 10)
+LINK_CHECK_DEADLINE = _env_float("SEO_AUDIT_LINK_DEADLINE", 60)
+LINK_CHECK_WORKERS = _env_int("SEO_AUDIT_LINK_WORKERS", 20)
+LINK_CHECK_PER_HOST = _env_int("SEO_AUDIT_LINK_PER_HOST", 4)
+
+# Audit pipeline: independent stages (WHOIS, PageSpeed, 404 probe, images...)
+AUDIT_STAGE_WORKERS = _env_int("SEO_AUDIT_STAGE_WORKERS", 16)
+
+# HTML parsing: "html.parser" (stdlib), "lxml" or "selectolax" (both optional installs).
+# With streaming on, the page is fed to the parser as it downloads and
+# anything past PARSER_MAX_BYTES is never read (0 disables the cap).
+PARSER_BACKEND = os.environ.get("SEO_AUDIT_PARSER", "html.parser")
+PARSER_STREAMING = os.environ.get("SEO_AUDIT_PARSER_STREAMING", "1") == "1"
+PARSER_MAX_BYTES = _env_int("SEO_AUDIT_PARSER_MAX_BYTES", 10 * 1024 * 1024)
+
+# Image probing: sizes come from Content-Length when possible; with sniffing on,
+# the first IMAGE_SNIFF_BYTES are also read to get format and dimensions
+IMAGE_PROBE_WORKERS = _env_int("SEO_AUDIT_IMAGE_WORKERS", 16)
+IMAGE_READ_TIMEOUT = _env_float("SEO_AUDIT_IMAGE_READ_TIMEOUT", 15)
+IMAGE_SNIFF_DIMENSIONS = os.environ.get("SEO_AUDIT_IMAGE_DIMENSIONS", "0") == "1"
+IMAGE_SNIFF_BYTES = _env_int("SEO_AUDIT_IMAGE_SNIFF_BYTES", 32 * 1024)
+
+# Site crawl mode
+CRAWL_MAX_PAGES = _env_int("SEO_AUDIT_CRAWL_MAX_PAGES", 500)
+CRAWL_MAX_DEPTH = _env_int("SEO_AUDIT_CRAWL_MAX_DEPTH", 5)
+CRAWL_WORKERS = _env_int("SEO_AUDIT_CRAWL_WORKERS", 8)
+# Seconds between requests to one host when robots.txt sets no Crawl-delay
+CRAWL_DELAY = _env_float("SEO_AUDIT_CRAWL_DELAY", 0)
+
+# Read timeout for pages, robots.txt, sitemap.xml and the 404 probe
+PAGE_READ_TIMEOUT = _env_float("SEO_AUDIT_PAGE_READ_TIMEOUT", 30)
+
+# On-disk HTTP cache (SQLite). Responses without Cache-Control or Expires
+# are stored stale and revalidated on every use (when they carry an ETag
+# or Last-Modified), unless HTTP_CACHE_DEFAULT_TTL gives them a heuristic
+# lifetime; every entry is dropped after HTTP_CACHE_MAX_AGE, and least
+# recently used entries are evicted once the cache grows past
+# HTTP_CACHE_MAX_BYTES.
+HTTP_CACHE_ENABLED = os.environ.get("SEO_AUDIT_HTTP_CACHE", "1") == "1"
+HTTP_CACHE_PATH = os.environ.get("SEO_AUDIT_HTTP_CACHE_PATH", os.path.join(".cache", "http_cache.sqlite"))
+HTTP_CACHE_DEFAULT_TTL = _env_float("SEO_AUDIT_HTTP_CACHE_TTL", 0)
+HTTP_CACHE_MAX_AGE = _env_float("SEO_AUDIT_HTTP_CACHE_MAX_AGE", 7 * 24 * 60 * 60)
+HTTP_CACHE_MAX_BYTES = _env_int("SEO_AUDIT_HTTP_CACHE_MAX_BYTES", 500 * 1024 * 1024)
+HTTP_CACHE_MAX_ENTRY_BYTES = _env_int("SEO_AUDIT_HTTP_CACHE_MAX_ENTRY_BYTES", 5 * 1024 * 1024)
+
+# WHOIS and PageSpeed results: cached per domain / per URL and strategy,
+# persisted to MEMO_CACHE_PATH so they survive restarts
+MEMO_PERSIST = os.environ.get("SEO_AUDIT_MEMO_PERSIST", "1") == "1"
+MEMO_CACHE_PATH = os.environ.get("SEO_AUDIT_MEMO_CACHE_PATH", os.path.join(".cache", "lookups.sqlite"))
+WHOIS_CACHE_TTL = _env_float("SEO_AUDIT_WHOIS_TTL", 24 * 60 * 60)
+PAGESPEED_CACHE_TTL = _env_float("SEO_AUDIT_PAGESPEED_TTL", 6 * 60 * 60)
+
+# Background audit jobs: /audit enqueues into a SQLite queue and JOB_WORKERS
+# threads (or processes, with JOB_WORKER_MODE=process) run them
+JOB_QUEUE_PATH = os.environ.get("SEO_AUDIT_JOB_QUEUE_PATH", os.path.join(".cache", "jobs.sqlite"))
+JOB_WORKERS = _env_int("SEO_AUDIT_JOB_WORKERS", 4)
+JOB_WORKER_MODE = os.environ.get("SEO_AUDIT_JOB_WORKER_MODE", "thread")
+JOB_POLL_INTERVAL = _env_float("SEO_AUDIT_JOB_POLL_INTERVAL", 0.5)
+# Running jobs older than this are assumed to belong to a dead worker
+JOB_STALE_AFTER = _env_float("SEO_AUDIT_JOB_STALE_AFTER", 60 * 60)
+REPORTS_DIR = os.environ.get("SEO_AUDIT_REPORTS_DIR", "reports")
+
+# Batch audits: process pool size, and per-domain politeness (pages of one
+# domain running at once, seconds between starting two of them)
+BATCH_WORKERS = _env_int("SEO_AUDIT_BATCH_WORKERS", os.cpu_count() or 4)
+BATCH_PER_DOMAIN = _env_int("SEO_AUDIT_BATCH_PER_DOMAIN", 2)
+BATCH_DOMAIN_INTERVAL = _env_float("SEO_AUDIT_BATCH_DOMAIN_INTERVAL", 0.5)
+
+# Distributed audits: the shared task queue, URLs per task (tasks hold one
+# host each), tasks a worker runs at once and page reports pushed together.
+# A worker renews its lease on a task every third of DISTRIBUTED_LEASE
+# seconds; an expired or failed task is retried after DISTRIBUTED_RETRY_DELAY
+# seconds (doubling) up to DISTRIBUTED_MAX_ATTEMPTS tries. `serve` and the
+# workers that reach it over HTTP share DISTRIBUTED_TOKEN.
+DISTRIBUTED_QUEUE_PATH = os.environ.get("SEO_AUDIT_DISTRIBUTED_QUEUE_PATH",
+                                        os.path.join(".cache", "distributed.sqlite"))
+DISTRIBUTED_TASK_URLS = _env_int("SEO_AUDIT_DISTRIBUTED_TASK_URLS", 200)
+DISTRIBUTED_SLOTS = _env_int("SEO_AUDIT_DISTRIBUTED_SLOTS", 4)
+DISTRIBUTED_PUSH_BATCH = _env_int("SEO_AUDIT_DISTRIBUTED_PUSH_BATCH", 20)
+DISTRIBUTED_LEASE = _env_float("SEO_AUDIT_DISTRIBUTED_LEASE", 60)
+DISTRIBUTED_RETRY_DELAY = _env_float("SEO_AUDIT_DISTRIBUTED_RETRY_DELAY", 30)
+DISTRIBUTED_MAX_ATTEMPTS = _env_int("SEO_AUDIT_DISTRIBUTED_MAX_ATTEMPTS", 3)
+DISTRIBUTED_TOKEN = os.environ.get("SEO_AUDIT_DISTRIBUTED_TOKEN", "")
+
+# HTML report: rows shown in the links and images tables (0 shows every row)
+REPORT_MAX_TABLE_ROWS = _env_int("SEO_AUDIT_REPORT_MAX_ROWS", 1000)
+
+# Incremental re-audits: page fingerprints, previous reports and link/image
+# checks are kept in HISTORY_PATH; stored checks are reused until they expire
+HISTORY_PATH = os.environ.get("SEO_AUDIT_HISTORY_PATH", os.path.join(".cache", "history.sqlite"))
+HISTORY_LINK_TTL = _env_float("SEO_AUDIT_HISTORY_LINK_TTL", 3 * 24 * 60 * 60)
+HISTORY_IMAGE_TTL = _env_float("SEO_AUDIT_HISTORY_IMAGE_TTL", 7 * 24 * 60 * 60)
+
+# Import the whole audit stack when the web app loads instead of on the first
+# audit, for pre-fork servers (e.g. gunicorn --preload) whose workers then
+# start warm; everywhere else the heavy modules load lazily on first use
+PRELOAD = os.environ.get("SEO_AUDIT_PRELOAD", "0") == "1"
+
+# Per-audit profiling (/audit with profile=1): "cprofile" writes a .prof
+# file next to the report, "pyinstrument" an HTML page if it is installed
+PROFILER = os.environ.get("SEO_AUDIT_PROFILER", "cprofile")
+
+# Politeness: every request to a host goes through a token bucket (HOST_RATE
+# requests per second, bursts of HOST_BURST; 0 disables it) and an adaptive
+# concurrency limit that starts at HOST_INITIAL_CONCURRENCY, grows on healthy
+# responses up to HOST_MAX_CONCURRENCY and halves on 429/5xx, connection
+# errors or responses HOST_SLOW_FACTOR times slower than usual (and slower
+# than HOST_SLOW_LATENCY seconds). Limits are per process.
+HOST_RATE = _env_float("SEO_AUDIT_HOST_RATE", 20)
+HOST_BURST = _env_int("SEO_AUDIT_HOST_BURST", 20)
+HOST_INITIAL_CONCURRENCY = _env_int("SEO_AUDIT_HOST_INITIAL_CONCURRENCY", 4)
+HOST_MAX_CONCURRENCY = _env_int("SEO_AUDIT_HOST_MAX_CONCURRENCY", 16)
+HOST_SLOW_FACTOR = _env_float("SEO_AUDIT_HOST_SLOW_FACTOR", 3)
+HOST_SLOW_LATENCY = _env_float("SEO_AUDIT_HOST_SLOW_LATENCY", 1)
+# GET/HEAD requests answered with 429, 502, 503 or 504 are retried up to
+# RETRY_ATTEMPTS times with jittered exponential backoff (RETRY_BACKOFF
+# seconds doubling up to RETRY_BACKOFF_MAX), waiting at least as long as
+# Retry-After asks, up to RETRY_AFTER_MAX
+RETRY_ATTEMPTS = _env_int("SEO_AUDIT_RETRY_ATTEMPTS", 2)
+RETRY_BACKOFF = _env_float("SEO_AUDIT_RETRY_BACKOFF", 0.5)
+RETRY_BACKOFF_MAX = _env_float("SEO_AUDIT_RETRY_BACKOFF_MAX", 30)
+RETRY_AFTER_MAX = _env_float("SEO_AUDIT_RETRY_AFTER_MAX", 120)
+# External APIs get their own, stricter limits. PageSpeed Insights (two
+# remote Lighthouse runs of 20-60s each) is off unless SEO_AUDIT_PAGESPEED=1;
+# audits measure page weight locally instead
+PAGESPEED_ENABLED = os.environ.get("SEO_AUDIT_PAGESPEED", "0") == "1"
+PAGESPEED_API_URL = os.environ.get("SEO_AUDIT_PAGESPEED_API_URL",
+                                   "https://www.googleapis.com/pagespeedonline/v5/runPagespeed")
+# The API key, read by the web app's workers and by distributed workers; it
+# is never stored in a queue
+PAGESPEED_API_KEY = os.environ.get("SEO_AUDIT_PAGESPEED_API_KEY", "")
+PAGESPEED_RATE = _env_float("SEO_AUDIT_PAGESPEED_RATE", 4)
+PAGESPEED_CONCURRENCY = _env_int("SEO_AUDIT_PAGESPEED_CONCURRENCY", 4)
+PAGESPEED_TIMEOUT = _env_float("SEO_AUDIT_PAGESPEED_TIMEOUT", 60)
+WHOIS_RATE = _env_float("SEO_AUDIT_WHOIS_RATE", 1)
+WHOIS_CONCURRENCY = _env_int("SEO_AUDIT_WHOIS_CONCURRENCY", 2)
+
+# Sitemaps: files fetched and parsed at once, most sitemap files followed
+# through indexes, most URLs counted by the site check, and how many of
+# them have their status checked. Batch and distributed audits run that
+# full check once per domain; a single-page audit only reads the first
+# sitemap file, up to SITEMAP_QUICK_MAX_URLS entries, unless
+# SITEMAP_FULL_CHECK is set.
+SITEMAP_WORKERS = _env_int("SEO_AUDIT_SITEMAP_WORKERS", 4)
+SITEMAP_MAX_FILES = _env_int("SEO_AUDIT_SITEMAP_MAX_FILES", 1000)
+SITEMAP_MAX_URLS = _env_int("SEO_AUDIT_SITEMAP_MAX_URLS", 100000)
+SITEMAP_STATUS_SAMPLE = _env_int("SEO_AUDIT_SITEMAP_STATUS_SAMPLE", 20)
+SITEMAP_QUICK_MAX_URLS = _env_int("SEO_AUDIT_SITEMAP_QUICK_MAX_URLS", 1000)
+SITEMAP_FULL_CHECK = os.environ.get("SEO_AUDIT_SITEMAP_FULL_CHECK", "0") == "1"
+
+# Page weight: stylesheets, scripts and fonts probed at once, how much of a
+# stylesheet is read looking for fonts, and the cache lifetime (seconds)
+# under which a resource is reported as poorly cached
+PAGE_WEIGHT_WORKERS = _env_int("SEO_AUDIT_PAGE_WEIGHT_WORKERS", 16)
+PAGE_WEIGHT_MAX_CSS_BYTES = _env_int("SEO_AUDIT_PAGE_WEIGHT_MAX_CSS_BYTES", 2 * 1024 * 1024)
+PAGE_WEIGHT_MIN_CACHE_TTL = _env_float("SEO_AUDIT_PAGE_WEIGHT_MIN_CACHE_TTL", 7 * 24 * 60 * 60)
+
+# Duplicate content: pages sharing at least this share of their phrases
+# (estimated from MinHash signatures) are reported as near-duplicates
+DUPLICATE_THRESHOLD = _env_float("SEO_AUDIT_DUPLICATE_THRESHOLD", 0.8)
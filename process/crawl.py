@@ -0,0 +1,282 @@
+import argparse
+import hashlib
+import itertools
+import json
+import math
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urldefrag, urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+from process import config, metrics
+from process.audit import check_tags
+from process.batch import audit_domain, merge_domain
+from process.duplicates import DuplicateIndex
+from process.history import get_history, tee_changes
+from process.keywords import TfIdf
+from process.linkgraph import LinkGraph
+from process.model import EXPORT_FORMATS, write_reports
+from process.network import get_session, page_timeout
+from process.ratelimit import get_limiter
+from process.sitemaps import SitemapReader, discover_sitemaps
+
+# Links to files that are never HTML pages
+SKIPPED_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".pdf", ".zip",
+    ".gz", ".mp3", ".mp4", ".avi", ".mov", ".css", ".js", ".xml", ".json",
+)
+
+
+class BloomFilter:
+    # Compact URL-seen set: about 1.2 bytes per URL at a 1% false positive
+    # rate, versus ~100 bytes per URL for a Python set of strings. A false
+    # positive only means a page is skipped, never audited twice.
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        # Returns True if the item was not in the filter yet
+        added = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, item):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(item))
+
+
+class HostPolicy:
+    # robots.txt rules and crawl delay for every host the crawl touches
+
+    def __init__(self, user_agent=None, default_delay=None):
+        self.user_agent = user_agent or config.USER_AGENT
+        self.default_delay = config.CRAWL_DELAY if default_delay is None else default_delay
+        self.robots = {}
+        self.lock = threading.Lock()
+
+    def rules(self, url):
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        with self.lock:
+            parser = self.robots.get(host)
+        if parser is None:
+            parser = RobotFileParser(urljoin(host, "/robots.txt"))
+            try:
+                response = get_session().get(parser.url, timeout=page_timeout())
+                if response.status_code in (401, 403):
+                    parser.disallow_all = True
+                elif response.status_code == 200:
+                    parser.parse(response.text.splitlines())
+                else:
+                    parser.allow_all = True
+            except requests.RequestException:
+                parser.allow_all = True
+            with self.lock:
+                parser = self.robots.setdefault(host, parser)
+        return parser
+
+    def allowed(self, url):
+        return self.rules(url).can_fetch(self.user_agent, url)
+
+    def wait_turn(self, url):
+        # Blocks until the host's crawl delay since the previous page has
+        # passed; the requests themselves also go through the host's rate limit
+        rules = self.rules(url)
+        delay = rules.crawl_delay(self.user_agent)
+        delay = self.default_delay if delay is None else float(delay)
+        get_limiter().throttle(("crawl", urlparse(url).netloc), delay)
+
+
+def normalize_url(url):
+    url, _ = urldefrag(url)
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    if not parsed.path:
+        url = parsed._replace(path="/").geturl()
+    return url
+
+
+def sitemap_urls(seed_url, policy, limit, reader=None):
+    # Page URLs streamed from the site's sitemaps (see process/sitemaps.py)
+    reader = reader or SitemapReader(max_urls=limit)
+    sitemaps = discover_sitemaps(seed_url, policy.rules(seed_url).site_maps() or [])
+    return [entry.loc for entry in itertools.islice(reader.entries(sitemaps), limit)]
+
+
+def crawl(seed_url, api_key="", max_pages=None, max_depth=None, workers=None, use_sitemap=True, policy=None,
+          history=None, keyword_index=None, sitemap_report=None, site_checks=True, audited=None):
+    # Audits every reachable page of the seed's site and yields one report per
+    # page as soon as it completes. Only the frontier (capped at max_pages),
+    # the Bloom filter and the in-flight pages are held in memory. With a
+    # history, unchanged pages are not re-parsed (see process/history.py);
+    # a keyword_index (keywords.TfIdf) collects every page's word counts.
+    # A sitemap_report dict is filled, once the crawl is done, with the
+    # sitemap checks and the sitemap URLs no crawled page links to or that
+    # did not answer 200. With site_checks the site-level checks (robots.txt,
+    # sitemap, HTTPS, custom 404, WHOIS) run once, alongside the pages, and
+    # are merged into every page report like batch audits do. audited maps
+    # pages an earlier, interrupted attempt already reported to their
+    # internal links: they are followed without being fetched or yielded.
+    max_pages = max_pages or config.CRAWL_MAX_PAGES
+    max_depth = config.CRAWL_MAX_DEPTH if max_depth is None else max_depth
+    workers = workers or config.CRAWL_WORKERS
+    policy = policy or HostPolicy()
+    site = urlparse(seed_url).netloc
+    audited = audited or {}
+
+    seen = BloomFilter(max_pages * 2)
+    frontier = deque()
+    queued = 0
+
+    def enqueue(url, depth):
+        nonlocal queued
+        url = normalize_url(url)
+        if url is None or queued >= max_pages or urlparse(url).netloc != site:
+            return
+        if seen.add(url) and policy.allowed(url):
+            frontier.append((url, depth))
+            queued += 1
+
+    enqueue(seed_url, 0)
+    reader = SitemapReader(max_urls=max_pages)
+    in_sitemap = set()
+    if use_sitemap:
+        for url in sitemap_urls(seed_url, policy, max_pages, reader):
+            url = normalize_url(url)
+            if url is not None:
+                in_sitemap.add(url)
+                enqueue(url, 1)
+    linked = BloomFilter(max_pages * 20)
+    statuses = {}
+
+    def audit_page(url, depth):
+        if url in audited:
+            return {"URL": url, "Internal Links": audited[url]}
+        policy.wait_turn(url)
+        try:
+            report = check_tags(url, api_key, site_checks=False, history=history,
+                                keyword_index=keyword_index)
+        except Exception as e:
+            # One failing page (network, parse, history...) must not stop the crawl
+            metrics.record_error("page")
+            report = {"URL": url, "Error": str(e)}
+        report["Crawl Depth"] = depth
+        if use_sitemap:
+            report["In Sitemap"] = "Yes" if url in in_sitemap else "No"
+        return report
+
+    with ThreadPoolExecutor(max_workers=workers) as pool, ThreadPoolExecutor(max_workers=1) as site_pool:
+        # The crawl reads the sitemaps itself, the site check only needs the first one
+        domain_future = site_pool.submit(audit_domain, seed_url, False) if site_checks else None
+        pending = {}
+        while frontier or pending:
+            while frontier and len(pending) < workers:
+                url, depth = frontier.popleft()
+                pending[pool.submit(audit_page, url, depth)] = depth
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                depth = pending.pop(future)
+                report = future.result()
+                if report["URL"] in in_sitemap and report["URL"] not in audited:
+                    statuses[report["URL"]] = report.get("Status Code")
+                for link in report.get("Internal Links", []):
+                    if depth < max_depth:
+                        enqueue(link, depth + 1)
+                    if in_sitemap:
+                        link = normalize_url(link)
+                        if link is not None:
+                            linked.add(link)
+                if report["URL"] in audited:
+                    continue
+                if domain_future is not None:
+                    report = merge_domain(report, domain_future.result())
+                yield report
+
+    if sitemap_report is not None:
+        sitemap_report.update(reader.summary())
+        sitemap_report["Not Linked From Pages"] = sorted(url for url in in_sitemap if url not in linked)
+        sitemap_report["Non-200 URLs"] = [{"URL": url, "Status": status} for url, status in sorted(statuses.items())
+                                          if status != 200]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl a site and audit every page, one JSON report per line.")
+    parser.add_argument("url", help="Seed URL, e.g. https://example.com/")
+    parser.add_argument("--max-pages", type=int, default=config.CRAWL_MAX_PAGES)
+    parser.add_argument("--max-depth", type=int, default=config.CRAWL_MAX_DEPTH)
+    parser.add_argument("--workers", type=int, default=config.CRAWL_WORKERS)
+    parser.add_argument("--no-sitemap", action="store_true", help="Don't seed the crawl from sitemap.xml")
+    parser.add_argument("-o", "--output", help="Output file (JSON Lines), defaults to stdout; "
+                                                "a directory for csv and parquet")
+    parser.add_argument("--format", choices=("raw",) + EXPORT_FORMATS, default="raw",
+                        help="raw writes the report dicts as they are, the others the typed model")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the stored audit history: skip unchanged pages and fresh link checks")
+    parser.add_argument("--changes", help="With --incremental, write what changed on each page to this file")
+    parser.add_argument("--tfidf", help="After the crawl, write each page's top keywords by TF-IDF to this file")
+    parser.add_argument("--sitemap-report", help="After the crawl, write the sitemap checks (JSON) to this file")
+    parser.add_argument("--duplicates", help="Afterwards, write duplicate titles, descriptions and "
+                                             "near-duplicate pages (JSON) to this file")
+    parser.add_argument("--link-graph", help="Afterwards, write internal PageRank, click depth, inlinks and "
+                                             "orphan pages (JSON) to this file")
+    args = parser.parse_args(argv)
+    if args.format in ("csv", "parquet") and not args.output:
+        parser.error(f"--format {args.format} needs an --output directory")
+
+    keyword_index = TfIdf() if args.tfidf else None
+    sitemap_report = {} if args.sitemap_report else None
+    reports = crawl(args.url, max_pages=args.max_pages, max_depth=args.max_depth, workers=args.workers,
+                    use_sitemap=not args.no_sitemap, history=get_history() if args.incremental else None,
+                    keyword_index=keyword_index, sitemap_report=sitemap_report)
+    changes = open(args.changes, "w", encoding="utf-8") if args.changes else None
+    if changes is not None:
+        reports = tee_changes(reports, changes)
+    duplicates = DuplicateIndex() if args.duplicates else None
+    if duplicates is not None:
+        reports = duplicates.track(reports)
+    link_graph = LinkGraph([args.url]) if args.link_graph else None
+    if link_graph is not None:
+        reports = link_graph.track(reports)
+    try:
+        write_reports(reports, args.format, args.output)
+    finally:
+        if changes is not None:
+            changes.close()
+
+    if duplicates is not None:
+        duplicates.write(args.duplicates)
+
+    if link_graph is not None:
+        link_graph.write(args.link_graph)
+
+    if keyword_index is not None:
+        with open(args.tfidf, "w", encoding="utf-8") as f:
+            for url, keywords in keyword_index:
+                f.write(json.dumps({"URL": url, "TF-IDF Keywords": keywords}) + "\n")
+
+    if sitemap_report is not None:
+        with open(args.sitemap_report, "w", encoding="utf-8") as f:
+            json.dump(sitemap_report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+import argparse
+import hmac
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from process import config
+from process.model import EXPORT_FORMATS, write_reports
+
+# Distributed audits. A coordinator splits a URL list (or a set of sites to
+# crawl) into tasks of one host each and puts them in a shared SQLite queue;
+# workers on any number of machines claim tasks, audit them and push every
+# page report back to the queue, from which the coordinator merges them into
+# one output. Only one task per host is leased at a time, so a host's
+# politeness limits (process/ratelimit.py) stay within one worker.
+#
+# A claimed task is leased to its worker for DISTRIBUTED_LEASE seconds and
+# the worker keeps renewing it. When a worker crashes its lease runs out and
+# the task goes back to the queue, up to DISTRIBUTED_MAX_ATTEMPTS tries;
+# pages already pushed are kept and not audited again. Workers on the same
+# machine open the SQLite file directly, workers elsewhere reach it through
+# `serve`, a small HTTP front for the worker side of the queue that answers
+# only requests carrying the shared DISTRIBUTED_TOKEN. The PageSpeed API key
+# is never queued: each worker reads its own (PAGESPEED_API_KEY).
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    host TEXT NOT NULL,
+    urls TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, available_at);
+CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id, status);
+CREATE TABLE IF NOT EXISTS results (
+    task_id INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    report TEXT NOT NULL,
+    PRIMARY KEY (task_id, url)
+);
+"""
+
+AUDIT = "audit"
+CRAWL = "crawl"
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class TaskQueue:
+    def __init__(self, path=None):
+        self.path = path or config.DISTRIBUTED_QUEUE_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connection()
+        db.executescript(SCHEMA)
+        if "api_key" in {row["name"] for row in db.execute("PRAGMA table_info(runs)")}:
+            # Queues from before API keys were kept out of them
+            db.execute("UPDATE runs SET api_key = '' WHERE api_key != ''")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    # Coordinator side
+
+    def submit(self, kind, shards, options=None):
+        # shards: {host: [urls]}, each list becomes one or more tasks
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        size = config.DISTRIBUTED_TASK_URLS
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute("INSERT INTO runs (id, kind, options, created_at) VALUES (?, ?, ?, ?)",
+                       (run_id, kind, json.dumps(options or {}), now))
+            db.executemany(
+                "INSERT INTO tasks (run_id, host, urls, status, available_at, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, host, json.dumps(urls[start:start + size]), QUEUED, now, now)
+                 for host, urls in shards.items() for start in range(0, len(urls), size)],
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return run_id
+
+    def status(self, run_id):
+        db = self._connection()
+        tasks = dict(db.execute("SELECT status, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY status",
+                                (run_id,)).fetchall())
+        pages = db.execute("SELECT COUNT(*) FROM results JOIN tasks ON tasks.id = results.task_id"
+                           " WHERE tasks.run_id = ?", (run_id,)).fetchone()[0]
+        failed = [dict(row) for row in db.execute(
+            "SELECT host, attempts, error FROM tasks WHERE run_id = ? AND status = ?", (run_id, FAILED))]
+        return {"Tasks": tasks, "Pages": pages, "Failed Tasks": failed}
+
+    def finished(self, run_id):
+        return not self._connection().execute(
+            "SELECT 1 FROM tasks WHERE run_id = ? AND status IN (?, ?) LIMIT 1", (run_id, QUEUED, LEASED)
+        ).fetchone()
+
+    def results(self, run_id):
+        # Every pushed page report of the run, task by task
+        rows = self._connection().execute(
+            "SELECT report FROM results JOIN tasks ON tasks.id = results.task_id WHERE tasks.run_id = ?"
+            " ORDER BY results.task_id, results.rowid", (run_id,))
+        for (report,) in rows:
+            yield json.loads(report)
+
+    # Worker side
+
+    def claim(self, worker):
+        # Leases the oldest available task whose host no other worker holds,
+        # after expiring the leases of workers that stopped renewing them
+        now = time.time()
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL,"
+                " error = 'Lease expired', finished_at = CASE WHEN attempts >= ? THEN ? END"
+                " WHERE status = ? AND lease_expires < ?",
+                (config.DISTRIBUTED_MAX_ATTEMPTS, FAILED, QUEUED, config.DISTRIBUTED_MAX_ATTEMPTS, now, LEASED, now),
+            )
+            row = db.execute(
+                "SELECT tasks.id, tasks.run_id, tasks.host, tasks.urls, tasks.attempts, runs.kind, runs.options"
+                " FROM tasks JOIN runs ON runs.id = tasks.run_id"
+                " WHERE tasks.status = ? AND tasks.available_at <= ?"
+                " AND tasks.host NOT IN (SELECT host FROM tasks WHERE status = ?)"
+                " ORDER BY tasks.available_at, tasks.id LIMIT 1",
+                (QUEUED, now, LEASED),
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE tasks SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1"
+                           " WHERE id = ?", (LEASED, worker, now + config.DISTRIBUTED_LEASE, row["id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        task = dict(row)
+        task["urls"] = json.loads(task["urls"])
+        task["options"] = json.loads(task["options"])
+        task["attempts"] += 1
+        return task
+
+    def renew(self, task_id, worker):
+        # False once the lease has been lost (expired and taken over)
+        return self._connection().execute(
+            "UPDATE tasks SET lease_expires = ? WHERE id = ? AND worker = ? AND status = ?",
+            (time.time() + config.DISTRIBUTED_LEASE, task_id, worker, LEASED),
+        ).rowcount == 1
+
+    def push(self, task_id, reports):
+        # Page results are keyed by URL, so a retried task overwrites rather than repeats them
+        self._connection().executemany(
+            "INSERT OR REPLACE INTO results (task_id, url, report) VALUES (?, ?, ?)",
+            [(task_id, report.get("URL", ""), json.dumps(report, default=str)) for report in reports],
+        )
+
+    def pushed(self, task_id):
+        return [url for (url,) in self._connection().execute("SELECT url FROM results WHERE task_id = ?",
+                                                              (task_id,))]
+
+    def pushed_links(self, task_id):
+        # {url: internal links} of the pages pushed so far, for a retried
+        # crawl to follow without auditing them again
+        rows = self._connection().execute("SELECT url, report FROM results WHERE task_id = ?", (task_id,))
+        return {url: json.loads(report).get("Internal Links", []) for url, report in rows}
+
+    def complete(self, task_id, worker):
+        self._connection().execute(
+            "UPDATE tasks SET status = ?, error = NULL, lease_expires = NULL, finished_at = ?"
+            " WHERE id = ? AND worker = ? AND status = ?", (DONE, time.time(), task_id, worker, LEASED))
+
+    def fail(self, task_id, worker, error):
+        # Back in the queue after a growing delay, or failed for good
+        now = time.time()
+        self._connection().execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, worker = NULL,"
+            " lease_expires = NULL, error = ?, available_at = ? * (1 << (attempts - 1)) + ?,"
+            " finished_at = CASE WHEN attempts >= ? THEN ? END WHERE id = ? AND worker = ? AND status = ?",
+            (config.DISTRIBUTED_MAX_ATTEMPTS, FAILED, QUEUED, error, config.DISTRIBUTED_RETRY_DELAY, now,
+             config.DISTRIBUTED_MAX_ATTEMPTS, now, task_id, worker, LEASED),
+        )
+
+
+# Queue methods workers call, the only ones `serve` exposes
+WORKER_METHODS = ("claim", "renew", "push", "pushed", "pushed_links", "complete", "fail")
+
+
+class RemoteQueue:
+    # The worker side of a TaskQueue served by `serve` on another machine
+
+    def __init__(self, url, token=None):
+        import requests
+        self.url = url.rstrip("/")
+        # A session of its own: the audit session's per-host limits don't apply to the queue
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token or config.DISTRIBUTED_TOKEN}"
+
+    def _call(self, method, **arguments):
+        response = self.session.post(f"{self.url}/{method}", json=arguments, timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def claim(self, worker):
+        return self._call("claim", worker=worker)
+
+    def renew(self, task_id, worker):
+        return self._call("renew", task_id=task_id, worker=worker)
+
+    def push(self, task_id, reports):
+        return self._call("push", task_id=task_id, reports=reports)
+
+    def pushed(self, task_id):
+        return self._call("pushed", task_id=task_id)
+
+    def pushed_links(self, task_id):
+        return self._call("pushed_links", task_id=task_id)
+
+    def complete(self, task_id, worker):
+        return self._call("complete", task_id=task_id, worker=worker)
+
+    def fail(self, task_id, worker, error):
+        return self._call("fail", task_id=task_id, worker=worker, error=error)
+
+
+def open_queue(location=None):
+    # An http:// URL for a queue served elsewhere, otherwise a SQLite path
+    if location and location.startswith(("http://", "https://")):
+        return RemoteQueue(location)
+    return TaskQueue(location)
+
+
+class QueueHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {self.server.token}"):
+            self.send_error(401)
+            return
+        method = self.path.strip("/")
+        if method not in WORKER_METHODS:
+            self.send_error(404)
+            return
+        try:
+            arguments = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            body = json.dumps(getattr(self.server.queue, method)(**arguments)).encode()
+        except (TypeError, ValueError) as e:
+            self.send_error(400, str(e))
+            return
+        except sqlite3.Error as e:
+            # e.g. "database is locked", the worker retries the call
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(queue_path=None, host="127.0.0.1", port=8765, token=None):
+    token = token or config.DISTRIBUTED_TOKEN
+    if not token:
+        raise ValueError("Set SEO_AUDIT_DISTRIBUTED_TOKEN (shared with the workers) to serve the queue")
+    server = ThreadingHTTPServer((host, port), QueueHandler)
+    server.daemon_threads = True
+    server.queue = TaskQueue(queue_path)
+    server.token = token
+    return server
+
+
+def submit_audit(queue, urls):
+    shards = defaultdict(list)
+    for url in dict.fromkeys(urls):
+        shards[urlparse(url).netloc].append(url)
+    return queue.submit(AUDIT, shards)
+
+
+def submit_crawl(queue, seeds, max_pages=None, max_depth=None):
+    # One task per site; a crawl stays on its site, so its host is the seed's
+    shards = {}
+    for seed in dict.fromkeys(seeds):
+        shards.setdefault(urlparse(seed).netloc, []).append(seed)
+    return queue.submit(CRAWL, {host: seeds[:1] for host, seeds in shards.items()},
+                        {"max_pages": max_pages, "max_depth": max_depth})
+
+
+class Lease:
+    # Renews a task's lease in the background until stopped; `lost` is set
+    # once another worker has taken the task over
+
+    def __init__(self, queue, task, worker):
+        self.queue = queue
+        self.task_id = task["id"]
+        self.worker = worker
+        self.lost = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._renew, daemon=True)
+
+    def _renew(self):
+        while not self.stopped.wait(config.DISTRIBUTED_LEASE / 3):
+            try:
+                if not self.queue.renew(self.task_id, self.worker):
+                    self.lost.set()
+                    return
+            except Exception:
+                # A missed renewal is fine, the lease outlasts a couple of them
+                pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+
+
+def run_task(queue, task, worker, api_key=None):
+    # Audits a task's pages (or crawls its site), pushing reports in small
+    # batches. Pages pushed by an earlier attempt are not audited again; a
+    # retried crawl only follows their stored links.
+    from process.batch import audit_domain, audit_page, merge_domain
+
+    api_key = config.PAGESPEED_API_KEY if api_key is None else api_key
+    with Lease(queue, task, worker) as lease:
+        domain = audit_domain(task["urls"][0])
+        if task["kind"] == CRAWL:
+            from process.crawl import crawl
+            audited = queue.pushed_links(task["id"]) if task["attempts"] > 1 else {}
+            done = set(audited)
+            reports = crawl(task["urls"][0], api_key, max_pages=task["options"].get("max_pages"),
+                            max_depth=task["options"].get("max_depth"), site_checks=False, audited=audited)
+            pool = None
+        else:
+            done = set(queue.pushed(task["id"])) if task["attempts"] > 1 else set()
+            urls = [url for url in task["urls"] if url not in done]
+            pool = ThreadPoolExecutor(max_workers=config.BATCH_PER_DOMAIN)
+            reports = pool.map(audit_page, urls, [api_key] * len(urls))
+        try:
+            batch = []
+            for report in reports:
+                if lease.lost.is_set():
+                    return False
+                if report.get("URL") in done:
+                    continue
+                batch.append(merge_domain(report, domain))
+                if len(batch) >= config.DISTRIBUTED_PUSH_BATCH:
+                    queue.push(task["id"], batch)
+                    batch = []
+            if batch:
+                queue.push(task["id"], batch)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        queue.complete(task["id"], worker)
+    return True
+
+
+def worker_loop(queue_location, stop_event, worker, exit_when_idle=False, api_key=None):
+    queue = open_queue(queue_location)
+    while not stop_event.is_set():
+        task = queue.claim(worker)
+        if task is None:
+            if exit_when_idle:
+                return
+            stop_event.wait(config.JOB_POLL_INTERVAL)
+            continue
+        try:
+            run_task(queue, task, worker, api_key)
+        except Exception as e:
+            queue.fail(task["id"], worker, str(e))
+
+
+def run_workers(queue_location=None, slots=None, exit_when_idle=False, api_key=None):
+    # Runs `slots` worker loops on threads until interrupted (or, with
+    # exit_when_idle, until nothing is left to claim)
+    slots = slots or config.DISTRIBUTED_SLOTS
+    stop_event = threading.Event()
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [threading.Thread(target=worker_loop, args=(queue_location, stop_event, f"{name}-{slot}",
+                                                          exit_when_idle, api_key), daemon=True)
+               for slot in range(slots)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+
+
+def wait(queue, run_id, interval=None):
+    while not queue.finished(run_id):
+        time.sleep(interval or config.JOB_POLL_INTERVAL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed audits: host-sharded tasks in a shared queue.")
+    parser.add_argument("--queue", default=None, help="SQLite queue path, or for workers the URL of a queue "
+                                                      f"served with `serve` (default {config.DISTRIBUTED_QUEUE_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    audit = commands.add_parser("audit", help="Queue a list of URLs, prints the run ID")
+    audit.add_argument("input", help="File with one URL per line or a JSON list ('-' for stdin)")
+
+    crawl = commands.add_parser("crawl", help="Queue a crawl of each site, prints the run ID")
+    crawl.add_argument("urls", nargs="+", help="Seed URLs, one crawl per host")
+    crawl.add_argument("--max-pages", type=int, default=config.CRAWL_MAX_PAGES)
+    crawl.add_argument("--max-depth", type=int, default=config.CRAWL_MAX_DEPTH)
+
+    worker = commands.add_parser("worker", help="Claim and run tasks until interrupted")
+    worker.add_argument("--slots", type=int, default=config.DISTRIBUTED_SLOTS, help="Tasks run at the same time")
+    worker.add_argument("--exit-when-idle", action="store_true", help="Stop once no task is left to claim")
+    worker.add_argument("--api-key", default=config.PAGESPEED_API_KEY,
+                        help="Google PageSpeed API key (default SEO_AUDIT_PAGESPEED_API_KEY)")
+
+    status = commands.add_parser("status", help="Task counts, pages pushed and failed tasks of a run")
+    status.add_argument("run_id")
+
+    collect = commands.add_parser("collect", help="Write the merged results of a run")
+    collect.add_argument("run_id")
+    collect.add_argument("-o", "--output", help="Output file (JSON Lines), defaults to stdout; "
+                                                "a directory for csv and parquet")
+    collect.add_argument("--format", choices=("raw",) + EXPORT_FORMATS, default="raw",
+                         help="raw writes the report dicts as they are, the others the typed model")
+    collect.add_argument("--wait", action="store_true", help="Wait for the run to finish first")
+
+    server = commands.add_parser("serve", help="Serve the queue to workers on other machines")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        run_workers(args.queue, args.slots, args.exit_when_idle, args.api_key)
+        return
+    if args.command == "serve":
+        try:
+            httpd = serve(args.queue, args.host, args.port)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Serving the queue on http://{args.host}:{httpd.server_address[1]}/", file=sys.stderr)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            httpd.shutdown()
+        return
+
+    queue = TaskQueue(args.queue)
+    if args.command == "audit":
+        from process.batch import read_urls
+        try:
+            if args.input == "-":
+                urls = read_urls(sys.stdin)
+            else:
+                with open(args.input, encoding="utf-8") as f:
+                    urls = read_urls(f)
+        except ValueError as e:
+            parser.error(f"{args.input}: {e}")
+        print(submit_audit(queue, urls))
+    elif args.command == "crawl":
+        print(submit_crawl(queue, args.urls, args.max_pages, args.max_depth))
+    elif args.command == "status":
+        print(json.dumps(queue.status(args.run_id), indent=2))
+    elif args.command == "collect":
+        if args.format in ("csv", "parquet") and not args.output:
+            parser.error(f"--format {args.format} needs an --output directory")
+        if args.wait:
+            wait(queue, args.run_id)
+        write_reports(queue.results(args.run_id), args.format, args.output)
+        failed = queue.status(args.run_id)["Failed Tasks"]
+        for task in failed:
+            print(f"Failed: {task['host']} after {task['attempts']} attempts: {task['error']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import json
+import re
+import struct
+import threading
+from array import array
+from collections import defaultdict
+from process import config
+
+# Duplicate content across the pages of a site. Each page body gets a
+# MinHash signature of the phrases (word bigrams and trigrams) the keyword
+# stage already counted, stored in the report as "Content Signature"; the
+# share of equal signature slots estimates how much two pages' phrases
+# overlap (Jaccard similarity). The signature uses one-permutation hashing:
+# every phrase is hashed once and lands in one of SIGNATURE_SIZE slots,
+# which keep their minimum, so it costs one hash per phrase.
+#
+# DuplicateIndex finds similar pages without comparing every pair (LSH):
+# the signature is cut into BANDS bands of ROWS slots and only pages with an
+# identical band are compared. A pair with similarity s shares a band with
+# probability 1 - (1 - s**ROWS)**BANDS: 16 bands of 4 catch about 99.98% of
+# pairs at the default 0.8 threshold, 99% at 0.7 and 89% at 0.6 (wider
+# bands would miss a quarter of the pairs right at 0.8). Matches are
+# merged into clusters with union-find.
+# Exact duplicate titles and descriptions are grouped alongside.
+
+SIGNATURE_SIZE = 64
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+EMPTY = 1 << 32
+# Pages with fewer distinct phrases than this are too short to compare
+MIN_FEATURES = 20
+# Compared against at most this many earlier pages per bucket, so a template
+# shared by thousands of pages stays linear (union-find links them anyway)
+MAX_BUCKET_CANDIDATES = 64
+
+_SPACE = re.compile(r"\s+")
+# Placeholders check_tags reports for a missing title or description
+MISSING = {"no title", "no description"}
+
+
+def minhash(features):
+    # One-permutation MinHash of an iterable of strings, as a list of
+    # SIGNATURE_SIZE 32-bit values
+    slots = [EMPTY] * SIGNATURE_SIZE
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        slot = value % SIGNATURE_SIZE
+        value >>= 32
+        if value < slots[slot]:
+            slots[slot] = value
+    # Short texts leave slots empty; each borrows the next filled slot
+    # (rotation densification) so they still compare position by position
+    filled = [index for index, value in enumerate(slots) if value != EMPTY]
+    if not filled:
+        return None
+    for index in range(SIGNATURE_SIZE):
+        if slots[index] == EMPTY:
+            slots[index] = slots[next((i for i in filled if i > index), filled[0])]
+    return slots
+
+
+def content_signature(keywords):
+    # MinHash of a page's word bigrams and trigrams (keywords.KeywordStats),
+    # base64 encoded, or None for pages with too little text. Phrases rather
+    # than single words, so pages on the same topic don't match.
+    features = [" ".join(gram) for gram in keywords.bigrams]
+    features.extend(" ".join(gram) for gram in keywords.trigrams)
+    if len(features) < MIN_FEATURES:
+        return None
+    return base64.b64encode(struct.pack(f"<{SIGNATURE_SIZE}I", *minhash(features))).decode("ascii")
+
+
+def decode_signature(signature):
+    return struct.unpack(f"<{SIGNATURE_SIZE}I", base64.b64decode(signature))
+
+
+def similarity(a, b):
+    # Estimated Jaccard similarity of two signatures
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+def _normalize(text):
+    return _SPACE.sub(" ", text).strip().lower() if isinstance(text, str) else ""
+
+
+class DuplicateIndex:
+    # Thread-safe; add() every page's report as it completes, then read
+    # clusters(), duplicate_titles() and duplicate_descriptions(). Per page
+    # it keeps the signature and a hash of each band in flat arrays (about
+    # 384 bytes); bands are matched by sorting once the pages are all in.
+
+    def __init__(self, threshold=None):
+        self.threshold = config.DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.urls = []
+        # Pages with a signature, their signatures and band hashes, aligned
+        self.signed = array("I")
+        self.signatures = array("I")
+        self.band_keys = [array("q") for _ in range(BANDS)]
+        self.titles = defaultdict(list)
+        self.descriptions = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, report):
+        if report.get("Status Code") != 200:
+            return
+        signature = report.get("Content Signature")
+        signature = decode_signature(signature) if signature else None
+        with self.lock:
+            page = len(self.urls)
+            self.urls.append(report["URL"])
+            for value, groups in ((report.get("Title"), self.titles),
+                                  (report.get("Description"), self.descriptions)):
+                key = _normalize(value)
+                if key and key not in MISSING:
+                    groups[key].append(page)
+            if signature is not None:
+                self.signed.append(page)
+                self.signatures.extend(signature)
+                for band, keys in enumerate(self.band_keys):
+                    keys.append(hash(signature[band * ROWS:(band + 1) * ROWS]))
+
+    def track(self, reports):
+        # Passes reports through, adding each one
+        for report in reports:
+            self.add(report)
+            yield report
+
+    def clusters(self):
+        # Groups of near-duplicate pages, largest first
+        with self.lock:
+            count = len(self.signed)
+            signatures = self.signatures
+            parents = list(range(count))
+
+            def signature(item):
+                return signatures[item * SIGNATURE_SIZE:(item + 1) * SIGNATURE_SIZE]
+
+            def find(item):
+                while parents[item] != item:
+                    parents[item] = parents[parents[item]]
+                    item = parents[item]
+                return item
+
+            for keys in self.band_keys:
+                # Pages with an identical band end up next to each other
+                order = sorted(range(count), key=keys.__getitem__)
+                start = 0
+                for end in range(1, count + 1):
+                    if end < count and keys[order[end]] == keys[order[start]]:
+                        continue
+                    run = order[start:end]
+                    for index, item in enumerate(run[1:], 1):
+                        current = signature(item)
+                        for other in run[max(0, index - MAX_BUCKET_CANDIDATES):index]:
+                            a, b = find(item), find(other)
+                            if a != b and similarity(current, signature(other)) >= self.threshold:
+                                parents[max(a, b)] = min(a, b)
+                    start = end
+
+            groups = defaultdict(list)
+            for item in range(count):
+                groups[find(item)].append(self.urls[self.signed[item]])
+        return sorted((urls for urls in groups.values() if len(urls) > 1), key=len, reverse=True)
+
+    def _duplicates(self, groups):
+        with self.lock:
+            return {text: [self.urls[page] for page in pages] for text, pages in groups.items() if len(pages) > 1}
+
+    def duplicate_titles(self):
+        return self._duplicates(self.titles)
+
+    def duplicate_descriptions(self):
+        return self._duplicates(self.descriptions)
+
+    def summary(self):
+        return {
+            "Pages": len(self.urls),
+            "Near-Duplicate Clusters": self.clusters(),
+            "Duplicate Titles": self.duplicate_titles(),
+            "Duplicate Descriptions": self.duplicate_descriptions(),
+        }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
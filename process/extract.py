@@ -0,0 +1,307 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from process import config
+
+# Single-pass extraction of every on-page signal check_tags reports on.
+# The document is walked once and each tag is routed to the fields it feeds,
+# instead of scanning the whole tree again for every field.
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+
+# Text inside these tags is not visible and is left out of the page text
+NON_TEXT_TAGS = {"script", "style", "template"}
+
+META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+PARSER_BACKENDS = ("html.parser", "lxml", "selectolax")
+
+
+class PageExtractor:
+    def __init__(self):
+        self.favicon = None
+        self.title = None
+        self.description = None
+        self.canonical = None
+        self.robots = None
+        self.og_tags = False
+        self.schema_markup = False
+        self.h1_texts = []
+        self.heading_counts = dict.fromkeys(HEADING_TAGS, 0)
+        self.iframes = []
+        self.links = []
+        self.images = []
+        self.lang = None
+        # Stylesheets, scripts and preloaded fonts as (kind, href, render
+        # blocking), in document order, and the text of inline <style> tags
+        self.resources = []
+        self.inline_css = []
+        # Bytes of the document read, after decompression
+        self.size = 0
+
+        self._text = []
+        self._title_text = None
+        self._h1_text = []
+        self._h1_depth = 0
+        self._skip_depth = 0
+        self._in_head = False
+        self._style_text = None
+
+    def start(self, tag, attrs):
+        if tag in NON_TEXT_TAGS:
+            self._skip_depth += 1
+            if tag == "script" and attrs.get("type") == "application/ld+json":
+                self.schema_markup = True
+            elif tag == "script" and attrs.get("src"):
+                # Classic scripts in <head> stop rendering until they have run
+                blocking = (self._in_head and "async" not in attrs and "defer" not in attrs
+                            and attrs.get("type", "").lower() != "module")
+                self.resources.append(("script", attrs["src"], blocking))
+            elif tag == "style":
+                self._style_text = []
+        elif tag == "a":
+            if "href" in attrs:
+                self.links.append(attrs["href"])
+        elif tag == "img":
+            self.images.append(attrs)
+        elif tag in self.heading_counts:
+            self.heading_counts[tag] += 1
+            if tag == "h1":
+                self._h1_depth += 1
+        elif tag == "link":
+            rel = attrs.get("rel", "").split()
+            if "icon" in rel and self.favicon is None:
+                self.favicon = attrs.get("href")
+            if "canonical" in rel and self.canonical is None:
+                self.canonical = attrs.get("href", "")
+            if "stylesheet" in rel and attrs.get("href"):
+                # Print-only stylesheets are downloaded without holding up rendering
+                blocking = (self._in_head and "disabled" not in attrs
+                            and attrs.get("media", "all").strip().lower() not in ("print", "none"))
+                self.resources.append(("css", attrs["href"], blocking))
+            elif "preload" in rel and attrs.get("as") == "font" and attrs.get("href"):
+                self.resources.append(("font", attrs["href"], False))
+        elif tag == "meta":
+            name = attrs.get("name")
+            if name == "description" and self.description is None:
+                self.description = attrs.get("content", "")
+            elif name == "robots" and self.robots is None:
+                self.robots = attrs.get("content", "")
+            if attrs.get("property", "").startswith("og:"):
+                self.og_tags = True
+        elif tag == "iframe":
+            self.iframes.append({attr: value for attr, value in attrs.items() if "src" in attr})
+        elif tag == "title" and self.title is None:
+            self._title_text = []
+        elif tag == "html" and self.lang is None:
+            self.lang = attrs.get("lang")
+        elif tag == "head":
+            self._in_head = True
+        elif tag == "body":
+            self._in_head = False
+
+    def end(self, tag):
+        if tag in NON_TEXT_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+            if tag == "style" and self._style_text is not None:
+                self.inline_css.append("".join(self._style_text))
+                self._style_text = None
+        elif tag == "head":
+            self._in_head = False
+        elif tag == "h1" and self._h1_depth:
+            self._h1_depth -= 1
+            if not self._h1_depth:
+                self._finish_h1()
+        elif tag == "title" and self._title_text is not None:
+            self.title = "".join(self._title_text)
+            self._title_text = None
+
+    def data(self, text):
+        if self._style_text is not None:
+            self._style_text.append(text)
+        if self._skip_depth:
+            return
+        self._text.append(text)
+        if self._h1_depth:
+            self._h1_text.append(text.strip())
+        if self._title_text is not None:
+            self._title_text.append(text)
+
+    def close(self):
+        if self._h1_depth:
+            self._finish_h1()
+        if self._title_text is not None:
+            self.title = "".join(self._title_text)
+            self._title_text = None
+
+    @property
+    def text(self):
+        return "".join(self._text)
+
+    def _finish_h1(self):
+        self.h1_texts.append("".join(self._h1_text))
+        self._h1_text = []
+        self._h1_depth = 0
+
+
+class _HTMLParserDriver(HTMLParser):
+    def __init__(self, extractor):
+        super().__init__(convert_charrefs=True)
+        self.extractor = extractor
+
+    def handle_starttag(self, tag, attrs):
+        self.extractor.start(tag, {name: value or "" for name, value in attrs})
+
+    def handle_endtag(self, tag):
+        self.extractor.end(tag)
+
+    def handle_data(self, data):
+        self.extractor.data(data)
+
+
+class _LxmlTarget:
+    # lxml parser target: libxml2 drives the same callbacks as html.parser
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    def start(self, tag, attrib):
+        self.extractor.start(tag, {name: value or "" for name, value in attrib.items()})
+
+    def end(self, tag):
+        self.extractor.end(tag)
+
+    def data(self, data):
+        self.extractor.data(data)
+
+    def close(self):
+        return self.extractor
+
+
+class _IncrementalParser:
+    # Common feed()/close() interface over the supported backends
+
+    def __init__(self, backend, extractor):
+        self.backend = backend
+        self.extractor = extractor
+        self._buffer = []
+        if backend == "html.parser":
+            self._parser = _HTMLParserDriver(extractor)
+        elif backend == "lxml":
+            from lxml import etree
+            self._parser = etree.HTMLParser(target=_LxmlTarget(extractor))
+        elif backend == "selectolax":
+            # selectolax has no incremental API, the document is parsed on close()
+            from selectolax.lexbor import LexborHTMLParser
+            self._parser = LexborHTMLParser
+        else:
+            raise ValueError(f"Unknown HTML parser backend: {backend}")
+
+    def feed(self, text):
+        if self.backend == "selectolax":
+            self._buffer.append(text)
+        else:
+            self._parser.feed(text)
+
+    def close(self):
+        if self.backend == "selectolax":
+            tree = self._parser("".join(self._buffer))
+            self._buffer = []
+            if tree.root is not None:
+                _walk_selectolax(tree.root, self.extractor)
+        else:
+            self._parser.close()
+        self.extractor.close()
+        return self.extractor
+
+
+def _walk_selectolax(root, extractor):
+    stack = [(root, False)]
+    while stack:
+        node, closing = stack.pop()
+        tag = node.tag
+        if closing:
+            extractor.end(tag)
+        elif tag == "-text":
+            extractor.data(node.text(deep=False))
+        elif not tag.startswith(("-", "_")):
+            extractor.start(tag, {name: value or "" for name, value in node.attributes.items()})
+            stack.append((node, True))
+            children = []
+            child = node.child
+            while child is not None:
+                children.append(child)
+                child = child.next
+            stack.extend((child, False) for child in reversed(children))
+
+
+def extract_page(html, backend=None):
+    parser = _IncrementalParser(backend or config.PARSER_BACKEND, PageExtractor())
+    parser.feed(html)
+    return parser.close()
+
+
+def extract_response(response, backend=None, max_bytes=None, chunk_size=64 * 1024, body=None):
+    # Parse a streamed requests response. With streaming enabled the body is
+    # decoded and fed to the parser chunk by chunk and never held in memory
+    # as a whole; reading stops once max_bytes have been consumed. body is
+    # the response content when the caller has already read it (read_body).
+    max_bytes = config.PARSER_MAX_BYTES if max_bytes is None else max_bytes
+    parser = _IncrementalParser(backend or config.PARSER_BACKEND, PageExtractor())
+    decoder = None
+    received = 0
+    try:
+        if body is not None:
+            chunks = [body]
+        elif config.PARSER_STREAMING:
+            chunks = response.iter_content(chunk_size=chunk_size)
+        else:
+            chunks = [response.content]
+        for chunk in chunks:
+            if max_bytes:
+                chunk = chunk[:max_bytes - received]
+            if not chunk:
+                break
+            received += len(chunk)
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(_detect_encoding(response, chunk))(errors="replace")
+            parser.feed(decoder.decode(chunk))
+            if max_bytes and received >= max_bytes:
+                break
+        if decoder is not None:
+            parser.feed(decoder.decode(b"", final=True))
+    finally:
+        response.close()
+    page = parser.close()
+    page.size = received
+    return page
+
+
+def read_body(response, max_bytes=None, chunk_size=64 * 1024):
+    # The raw body of a streamed response, capped at max_bytes like extract_response
+    max_bytes = config.PARSER_MAX_BYTES if max_bytes is None else max_bytes
+    chunks = []
+    received = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if max_bytes:
+            chunk = chunk[:max_bytes - received]
+        if not chunk:
+            break
+        chunks.append(chunk)
+        received += len(chunk)
+        if max_bytes and received >= max_bytes:
+            break
+    return b"".join(chunks)
+
+
+def _detect_encoding(response, first_chunk):
+    # Charset from the Content-Type header, then from a <meta> in the first chunk
+    if "charset" in response.headers.get("Content-Type", "").lower() and response.encoding:
+        encoding = response.encoding
+    else:
+        match = META_CHARSET.search(first_chunk[:4096])
+        encoding = match.group(1).decode("ascii", "ignore") if match else "utf-8"
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = "utf-8"
+    return encoding
@@ -1,19 +1,17 @@
 import requests
-from urllib.request import urlopen
 from urllib.parse import urljoin, urlparse
+from process import config
+from process.images import probe_image
+from process.network import get_session, page_timeout
+from process.sitemaps import check_sitemaps, quick_check_sitemaps, sitemaps_in_robots
 
 def get_image_size(url):
-    try:
-        image = urlopen(url)
-        image_size = len(image.read()) / 1024  # Size in KB
-        return round(image_size, 2)
-    except Exception as e:
-        print(f"Error fetching image size: {e}")
-        return "N/A"
+    # Size in KB, without downloading the image body when Content-Length is known
+    return probe_image(url, sniff=False)["size"]
 
 def check_custom_404(url):
     test_url = urljoin(url, "nonexistentpage12345")
-    response = requests.get(test_url)
+    response = get_session().get(test_url, timeout=page_timeout())
     
     # Check for 404 status code and presence of '404' in the response text
     if response.status_code == 404 and "404" in response.text.lower():
@@ -22,7 +20,11 @@ def check_custom_404(url):
         return "No"
 
 
-def check_robots_sitemap_https(url):
+def check_robots_sitemap_https(url, full_sitemaps=None):
+    # full_sitemaps walks every sitemap (check_sitemaps) instead of reading
+    # the first file only (default config.SITEMAP_FULL_CHECK); batch audits
+    # turn it on for their once-per-domain checks
+    full_sitemaps = config.SITEMAP_FULL_CHECK if full_sitemaps is None else full_sitemaps
     report = {"Robots.txt Available": "No", "Sitemap.xml Available": "No", "HTTPS": "No"}
     parsed_url = urlparse(url)
     
@@ -30,26 +32,25 @@ def check_robots_sitemap_https(url):
     if parsed_url.scheme == "https":
         report["HTTPS"] = "Yes"
     
-    # Define the URLs for robots.txt and sitemap.xml
-    robots_url = urljoin(url, "robots.txt")
-    sitemap_url = urljoin(url, "sitemap.xml")
+    # Define the URL for robots.txt
+    robots_url = urljoin(url, "/robots.txt")
+    robots_sitemaps = []
     
-    # Check if robots.txt is available
+    # Check if robots.txt is available, and which sitemaps it lists
     try:
-        response = requests.get(robots_url)
+        response = get_session().get(robots_url, timeout=page_timeout())
         if response.status_code == 200:
             report["Robots.txt Available"] = "Yes"
+            robots_sitemaps = sitemaps_in_robots(response.text)
     except requests.RequestException:
         # Handle possible exceptions like network issues
         pass
     
-    # Check if sitemap.xml is available
-    try:
-        response = requests.get(sitemap_url)
-        if response.status_code == 200:
-            report["Sitemap.xml Available"] = "Yes"
-    except requests.RequestException:
-        # Handle possible exceptions like network issues
-        pass
+    # Find the sitemaps (robots.txt Sitemap: lines, or /sitemap.xml) and stream
+    # the first one, or every one, nested indexes and all
+    if full_sitemaps:
+        report.update(check_sitemaps(url, robots_sitemaps))
+    else:
+        report.update(quick_check_sitemaps(url, robots_sitemaps))
     
-    return report
\ No newline at end of file
+    return report
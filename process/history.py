@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from process import config
+
+# Audit history for incremental re-audits. Every audited page is stored with
+# a fingerprint of its body (and its ETag), so an unchanged page reuses the
+# previous report instead of being parsed again; link and image checks are
+# stored per URL and only repeated once they expire. Each new report is
+# compared with the previous one and the differences recorded in "Changes".
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    fingerprint TEXT,
+    etag TEXT,
+    report TEXT NOT NULL,
+    audited_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checks (
+    kind TEXT NOT NULL,
+    url TEXT NOT NULL,
+    value TEXT NOT NULL,
+    checked_at REAL NOT NULL,
+    PRIMARY KEY (kind, url)
+);
+"""
+
+# Report keys derived from the page body alone, reused while it is unchanged
+PAGE_KEYS = (
+    "Favicon Link", "Title", "Description", "H1 Tags Text", "H1 Count", "H2 Count", "H3 Count",
+    "H4 Count", "H5 Count", "H6 Count", "Canonical Tag", "Robots Tag", "OG Tags Available",
+    "Schema Markup Available", "iframes", "social_media_links", "Internal Links", "External Links",
+    "Image Count", "Images with Alt Text", "Language", "Top Keywords", "Top Bigrams", "Top Trigrams",
+    "Content Signature", "Page Weight",
+)
+
+# Report values compared as a whole by diff_reports
+COMPARED_KEYS = ("Status Code", "Title", "Description", "H1 Tags Text", "Canonical Tag", "Robots Tag")
+
+
+class AuditHistory:
+    def __init__(self, path=None):
+        self.path = path or config.HISTORY_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def previous(self, url):
+        # (fingerprint, etag, report) of the last audit of url, or None
+        row = self._connection().execute(
+            "SELECT fingerprint, etag, report FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def record(self, url, fingerprint, etag, report):
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                       (url, fingerprint, etag, json.dumps(report, default=str), time.time()))
+
+    def checked(self, kind, urls, ttl):
+        # {url: value} for the urls whose last check of this kind is younger than ttl
+        db = self._connection()
+        oldest = time.time() - ttl
+        found = {}
+        for url in urls:
+            row = db.execute("SELECT value FROM checks WHERE kind = ? AND url = ? AND checked_at > ?",
+                             (kind, url, oldest)).fetchone()
+            if row is not None:
+                found[url] = json.loads(row[0])
+        return found
+
+    def record_checks(self, kind, values):
+        now = time.time()
+        with self._connection() as db:
+            db.executemany("INSERT OR REPLACE INTO checks VALUES (?, ?, ?, ?)",
+                           [(kind, url, json.dumps(value), now) for url, value in values.items()])
+
+
+_history = None
+_lock = threading.Lock()
+
+
+def get_history():
+    global _history
+    if _history is None:
+        with _lock:
+            if _history is None:
+                _history = AuditHistory()
+    return _history
+
+
+def body_fingerprint(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def find_broken_links_incremental(urls, history, ttl=None):
+    # Like links.find_broken_links, but only links without a fresh stored
+    # status are probed. Unreachable links are not stored and are retried.
+    from process.links import UNREACHABLE, check_links, normalize_links
+
+    ttl = config.HISTORY_LINK_TTL if ttl is None else ttl
+    urls = normalize_links(urls)
+    statuses = history.checked("link", urls, ttl)
+    checked = check_links([url for url in urls if url not in statuses])
+    history.record_checks("link", {url: status for url, status in checked.items() if status != UNREACHABLE})
+    statuses.update(checked)
+    return [url for url in urls if statuses.get(url) in (404, UNREACHABLE)]
+
+
+def probe_images_incremental(urls, history, ttl=None):
+    # probe_images, reusing stored results younger than ttl
+    from process.images import probe_images
+
+    ttl = config.HISTORY_IMAGE_TTL if ttl is None else ttl
+    urls = [url for url in dict.fromkeys(urls) if url]
+    info = history.checked("image", urls, ttl)
+    probed = probe_images([url for url in urls if url not in info])
+    history.record_checks("image", {url: value for url, value in probed.items() if value.get("size") != "N/A"})
+    info.update(probed)
+    return info
+
+
+def _as_list(value):
+    # Report lists can be placeholder messages ("All links well good"...)
+    return value if isinstance(value, list) else []
+
+
+def _stored(value):
+    # The value as it reads back from the history (tuples become lists...)
+    return json.loads(json.dumps(value, default=str))
+
+
+def diff_reports(old, new):
+    # What changed between two reports of the same URL; empty when nothing did
+    changes = {}
+    for key in COMPARED_KEYS:
+        if old.get(key) != _stored(new.get(key)):
+            changes[key] = {"before": old.get(key), "after": new.get(key)}
+
+    def added_removed(before, after, added_key, removed_key):
+        before, after = dict.fromkeys(before), dict.fromkeys(after)
+        added = [item for item in after if item not in before]
+        removed = [item for item in before if item not in after]
+        if added:
+            changes[added_key] = added
+        if removed:
+            changes[removed_key] = removed
+
+    added_removed(_as_list(old.get("broken_links")), _as_list(new.get("broken_links")),
+                  "New Broken Links", "Fixed Broken Links")
+    added_removed(old.get("Internal Links", []) + old.get("External Links", []),
+                  new.get("Internal Links", []) + new.get("External Links", []),
+                  "Added Links", "Removed Links")
+    added_removed([image["src"] for image in old.get("Image Details", [])],
+                  [image["src"] for image in new.get("Image Details", [])],
+                  "Added Images", "Removed Images")
+    return changes
+
+
+def tee_changes(reports, out):
+    # Passes reports through, writing the URL and changes of each changed page to out
+    for report in reports:
+        if report.get("Changes"):
+            out.write(json.dumps({"URL": report["URL"], "Changes": report["Changes"]}, default=str) + "\n")
+            out.flush()
+        yield report
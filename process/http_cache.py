@@ -0,0 +1,335 @@
+import email.utils
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from process import config, metrics
+
+# On-disk HTTP cache shared by every fetch that goes through get_session().
+# Responses are kept in SQLite and served locally while fresh according to
+# Cache-Control/Expires. A response without either is stale from the start
+# (unless a default TTL is configured), so a re-audit never reads an old
+# page unchecked; stale entries with an ETag or Last-Modified are
+# revalidated with a conditional request and a 304 just refreshes the
+# stored copy. Stale entries without validators are not stored at all.
+
+CACHEABLE_METHODS = ("GET", "HEAD")
+CACHEABLE_STATUSES = (200, 203, 204, 300, 301, 308, 404, 410)
+
+# Headers that describe the transfer rather than the stored body
+HOP_BY_HOP_HEADERS = ("transfer-encoding", "connection", "keep-alive")
+
+# Query parameters that carry credentials (the PageSpeed API key...); they
+# are left out of cache keys and stored URLs
+CREDENTIAL_PARAMS = frozenset(("key", "api_key", "apikey", "access_token", "token"))
+
+# Headers a 304 may update on the stored response
+REVALIDATED_HEADERS = ("cache-control", "expires", "etag", "last-modified", "date", "age", "vary")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    reason TEXT,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+
+class HttpCache:
+    def __init__(self, path=None, max_bytes=None, max_age=None, default_ttl=None):
+        self.path = path or config.HTTP_CACHE_PATH
+        self.max_bytes = config.HTTP_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.max_age = config.HTTP_CACHE_MAX_AGE if max_age is None else max_age
+        self.default_ttl = config.HTTP_CACHE_DEFAULT_TTL if default_ttl is None else default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(SCHEMA)
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads, keep one per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT url, status, reason, headers, body, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, reason, headers, body, expires_at = row
+        return {"url": url, "status": status, "reason": reason, "headers": json.loads(headers),
+                "body": body, "expires_at": expires_at}
+
+    def put(self, key, url, status, reason, headers, body):
+        expires_at = self.expiry(headers)
+        if expires_at is None:
+            return
+        now = time.time()
+        validators = CaseInsensitiveDict(headers)
+        if expires_at <= now and "ETag" not in validators and "Last-Modified" not in validators:
+            # Could never be served or revalidated
+            return
+        with self._connection() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, reason, json.dumps(headers), body, len(body), now, expires_at, now),
+            )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self.evict()
+
+    def touch(self, key, headers):
+        # A 304 confirmed the stored body, refresh its headers and lifetime
+        expires_at = self.expiry(headers)
+        now = time.time()
+        with self._connection() as db:
+            db.execute("UPDATE responses SET headers = ?, expires_at = ?, last_used = ? WHERE key = ?",
+                       (json.dumps(headers), expires_at if expires_at is not None else now, now, key))
+
+    def mark_used(self, key):
+        with self._connection() as db:
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+
+    def expiry(self, headers):
+        # Absolute expiry time, or None when the response must not be stored
+        headers = CaseInsensitiveDict(headers)
+        directives = parse_cache_control(headers.get("Cache-Control", ""))
+        if "no-store" in directives:
+            return None
+        now = time.time()
+        if "no-cache" in directives:
+            return now
+        for directive in ("s-maxage", "max-age"):
+            if directives.get(directive, "").isdigit():
+                return now + int(directives[directive]) - _age(headers)
+        if "Expires" in headers:
+            expires = _parse_date(headers["Expires"])
+            return expires if expires is not None else now
+        if "Last-Modified" in headers:
+            # Heuristic freshness: 10% of the time since the last change, at most default_ttl
+            modified = _parse_date(headers["Last-Modified"])
+            if modified is not None:
+                return now + max(min((now - modified) / 10, self.default_ttl), 0)
+        # No freshness information: stale straight away unless a default TTL is set
+        return now + self.default_ttl
+
+    def evict(self):
+        # Drop entries past the retention age, then the least recently used
+        # ones until the cache fits in max_bytes
+        with self._connection() as db:
+            if self.max_age:
+                db.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.max_age,))
+            if self.max_bytes:
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    excess = total - self.max_bytes
+                    freed = 0
+                    keys = []
+                    for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                        keys.append((key,))
+                        freed += size
+                        if freed >= excess:
+                            break
+                    db.executemany("DELETE FROM responses WHERE key = ?", keys)
+
+    def clear(self):
+        with self._connection() as db:
+            db.execute("DELETE FROM responses")
+
+
+class CachedSession(requests.Session):
+    # requests.Session that answers from an HttpCache where it can. The cache
+    # sits in send(), so every redirect hop is cached on its own.
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if not self._cacheable_request(request):
+            return super().send(request, **kwargs)
+
+        # Follow redirects here, one cached hop at a time, like Session.send does
+        allow_redirects = kwargs.pop("allow_redirects", True)
+        response = self._send_cached(request, **kwargs)
+        if allow_redirects:
+            history = list(self.resolve_redirects(response, request, **kwargs))
+            if history:
+                history.insert(0, response)
+                response = history.pop()
+                response.history = history
+        return response
+
+    def _send_cached(self, request, **kwargs):
+        key = f"{request.method} {_redact(request.url)}"
+        entry = self.cache.get(key)
+        if entry is not None and entry["expires_at"] > time.time():
+            self.cache.hits += 1
+            metrics.record_cache("http", "hit")
+            self.cache.mark_used(key)
+            return self._build_response(request, entry)
+
+        if entry is not None:
+            # Stale: revalidate with the stored validators
+            stored = CaseInsensitiveDict(entry["headers"])
+            validators = {}
+            if "ETag" in stored:
+                validators["If-None-Match"] = stored["ETag"]
+            if "Last-Modified" in stored:
+                validators["If-Modified-Since"] = stored["Last-Modified"]
+            if validators:
+                request = request.copy()
+                request.headers.update(validators)
+
+        response = super().send(request, allow_redirects=False, **kwargs)
+        if entry is not None and response.status_code == 304:
+            self.cache.revalidated += 1
+            metrics.record_cache("http", "revalidated")
+            headers = {**entry["headers"], **{name: value for name, value in response.headers.items()
+                                              if name.lower() in REVALIDATED_HEADERS}}
+            self.cache.touch(key, headers)
+            response.close()
+            return self._build_response(request, {**entry, "headers": headers})
+
+        self.cache.misses += 1
+        metrics.record_cache("http", "miss")
+        self._store(key, request, response, kwargs.get("stream", False))
+        return response
+
+    def _cacheable_request(self, request):
+        if request.method not in CACHEABLE_METHODS:
+            return False
+        if "Range" in request.headers or "Authorization" in request.headers:
+            return False
+        return "no-cache" not in request.headers.get("Cache-Control", "")
+
+    def _store(self, key, request, response, stream):
+        if response.status_code not in CACHEABLE_STATUSES:
+            return
+        if any(field.strip().lower() != "accept-encoding" for field in response.headers.get("Vary", "").split(",")
+               if field.strip()):
+            # The stored copy would be served whatever the varying request
+            # headers are. Accept-Encoding is the exception: the session
+            # always sends the same one and bodies are stored decoded.
+            return
+        if request.method == "HEAD":
+            self._put(key, response, b"")
+        elif stream:
+            # Stored once the caller has read the whole body
+            self._tee(key, response)
+        elif len(response.content) <= config.HTTP_CACHE_MAX_ENTRY_BYTES:
+            self._put(key, response, response.content)
+
+    def _put(self, key, response, body):
+        self.cache.put(key, _redact(response.url), response.status_code, response.reason,
+                       _stored_headers(response.headers, len(body) if response.request.method == "GET" else None),
+                       body)
+
+    def _tee(self, key, response):
+        # Copies the chunks of a streamed body into the cache as the caller
+        # reads them (through iter_content, or .content which uses it), and
+        # stores them if the body is read to the end within the entry limit.
+        # A caller that stops early, like an image probe, leaves nothing.
+        iter_content = response.iter_content
+
+        def tee(chunk_size=1, decode_unicode=False):
+            if decode_unicode:
+                yield from iter_content(chunk_size, decode_unicode)
+                return
+            chunks = []
+            size = 0
+            for chunk in iter_content(chunk_size):
+                if chunks is not None:
+                    size += len(chunk)
+                    if size > config.HTTP_CACHE_MAX_ENTRY_BYTES:
+                        chunks = None
+                    else:
+                        chunks.append(chunk)
+                yield chunk
+            if chunks is not None:
+                self._put(key, response, b"".join(chunks))
+
+        response.iter_content = tee
+
+    def _build_response(self, request, entry):
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response._content = entry["body"]
+        response._content_consumed = True
+        response.elapsed = timedelta(0)
+        response.from_cache = True
+        return response
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+def _stored_headers(headers, body_length=None):
+    # GET bodies are stored decoded, so their encoding and length are rewritten.
+    # HEAD responses keep Content-Length/Content-Encoding as the server sent them.
+    stored = {name: value for name, value in headers.items() if name.lower() not in HOP_BY_HOP_HEADERS}
+    if body_length is not None:
+        stored = {name: value for name, value in stored.items() if name.lower() != "content-encoding"}
+        stored["Content-Length"] = str(body_length)
+    return stored
+
+
+def _redact(url):
+    # url without its credential query parameters
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    kept = [(name, value) for name, value in query if name.lower() not in CREDENTIAL_PARAMS]
+    if len(kept) == len(query):
+        return url
+    return urlunsplit(parts._replace(query=urlencode(kept)))
+
+
+def _parse_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _age(headers):
+    age = headers.get("Age", "")
+    return int(age) if age.isdigit() else 0
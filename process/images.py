@@ -0,0 +1,157 @@
+import base64
+import binascii
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+import requests
+from process import config, metrics
+from process.network import get_session
+
+logger = logging.getLogger(__name__)
+
+# Attributes lazy-loading scripts use to hold the real image URL
+LAZY_SRC_ATTRS = ("data-src", "data-lazy-src", "data-original")
+
+
+def resolve_image_src(img):
+    # Returns (main_url, srcset_urls) for an <img> attribute dict.
+    # Lazy-loaded images keep a placeholder in src and the real file in data-src.
+    srcset = parse_srcset(img.get("srcset") or img.get("data-srcset") or "")
+    for attr in LAZY_SRC_ATTRS:
+        if img.get(attr):
+            return img[attr], srcset
+    if img.get("src"):
+        return img["src"], srcset
+    return (srcset[0] if srcset else None), srcset
+
+
+def parse_srcset(srcset):
+    # "a.jpg 1x, b.jpg 2x" -> ["a.jpg", "b.jpg"]
+    urls = []
+    for candidate in srcset.split(","):
+        parts = candidate.split()
+        if parts:
+            urls.append(parts[0])
+    return urls
+
+
+def probe_image(url, sniff=None):
+    # Size in KB, plus format/width/height when sniff is enabled.
+    # The full body is never held in memory: Content-Length from a HEAD is
+    # trusted when present, otherwise the body is streamed and counted.
+    sniff = config.IMAGE_SNIFF_DIMENSIONS if sniff is None else sniff
+    info = {"size": "N/A"}
+    if url.startswith("data:"):
+        header, _, payload = url.partition(",")
+        try:
+            data = base64.b64decode(payload + "===") if header.endswith(";base64") else unquote(payload).encode()
+        except (binascii.Error, ValueError):
+            return info
+        info["size"] = round(len(data) / 1024, 2)
+        if sniff:
+            info.update(sniff_image(data))
+        return info
+
+    session = get_session()
+    timeout = (config.LINK_CHECK_CONNECT_TIMEOUT, config.IMAGE_READ_TIMEOUT)
+    try:
+        response = session.head(url, allow_redirects=True, timeout=timeout)
+        response.close()
+        length = response.headers.get("Content-Length")
+        if response.ok and length and length.isdigit() and "Content-Encoding" not in response.headers:
+            info["size"] = round(int(length) / 1024, 2)
+            if not sniff:
+                return info
+
+        headers = {}
+        if info["size"] != "N/A":
+            headers["Range"] = f"bytes=0-{config.IMAGE_SNIFF_BYTES - 1}"
+        response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        try:
+            if not response.ok:
+                return info
+            head = b""
+            size = 0
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                if sniff and len(head) < config.IMAGE_SNIFF_BYTES:
+                    head += chunk[:config.IMAGE_SNIFF_BYTES - len(head)]
+                size += len(chunk)
+                if info["size"] != "N/A" and len(head) >= config.IMAGE_SNIFF_BYTES:
+                    # Size already known from HEAD, only the header bytes were needed
+                    break
+            if info["size"] == "N/A":
+                info["size"] = round(size / 1024, 2)
+            if sniff:
+                info.update(sniff_image(head))
+        finally:
+            response.close()
+    except requests.RequestException as e:
+        logger.warning("Error fetching image size of %s: %s", url, e)
+        metrics.record_error("image")
+    return info
+
+
+def probe_images(urls, sniff=None, max_workers=None):
+    # Probes every distinct URL once, concurrently. Returns {url: info}.
+    max_workers = max_workers or config.IMAGE_PROBE_WORKERS
+    unique = [url for url in dict.fromkeys(urls) if url]
+    if not unique:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = [pool.submit(metrics.bind(probe_image), url, sniff) for url in unique]
+        return {url: future.result() for url, future in zip(unique, futures)}
+
+
+def sniff_image(data):
+    # Format and dimensions from the first bytes of a PNG, GIF, JPEG or WebP file
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+            width, height = struct.unpack(">II", data[16:24])
+            return {"format": "PNG", "width": width, "height": height}
+        if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+            width, height = struct.unpack("<HH", data[6:10])
+            return {"format": "GIF", "width": width, "height": height}
+        if data.startswith(b"\xff\xd8"):
+            return _sniff_jpeg(data)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return _sniff_webp(data)
+        if data.lstrip()[:5] in (b"<?xml", b"<svg ") or b"<svg" in data[:512]:
+            return {"format": "SVG"}
+    except struct.error:
+        pass
+    return {"format": "Unknown"}
+
+
+def _sniff_jpeg(data):
+    # Walk the marker segments up to the first start-of-frame
+    index = 2
+    while index + 9 < len(data):
+        if data[index] != 0xFF:
+            index += 1
+            continue
+        marker = data[index + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            index += 2
+            continue
+        length = struct.unpack(">H", data[index + 2:index + 4])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[index + 5:index + 9])
+            return {"format": "JPEG", "width": width, "height": height}
+        index += 2 + length
+    return {"format": "JPEG"}
+
+
+def _sniff_webp(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return {"format": "WebP", "width": width & 0x3FFF, "height": height & 0x3FFF}
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], "little")
+        return {"format": "WebP", "width": (bits & 0x3FFF) + 1, "height": ((bits >> 14) & 0x3FFF) + 1}
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return {"format": "WebP", "width": width, "height": height}
+    return {"format": "WebP"}
@@ -0,0 +1,258 @@
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from process import config
+
+logger = logging.getLogger(__name__)
+
+# Background audit jobs. /audit only enqueues a row in a local SQLite queue
+# and returns its ID; a pool of worker threads or processes claims queued
+# jobs, runs the audit, writes a per-job report file and records progress
+# that the client polls through /status/<job_id>. Each finished section of
+# the report is also stored as a job event, which /audit/stream relays.
+# The PageSpeed API key is not stored with the job: workers read it from
+# PAGESPEED_API_KEY.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '',
+    filename TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    profile INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+EVENTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+)
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(self, path=None):
+        self.path = path or config.JOB_QUEUE_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(SCHEMA)
+            db.execute(EVENTS_SCHEMA)
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+            if "profile" not in columns:
+                # Queues created before per-job profiling
+                db.execute("ALTER TABLE jobs ADD COLUMN profile INTEGER NOT NULL DEFAULT 0")
+            if "api_key" in columns:
+                # Queues from before API keys were kept out of them
+                db.execute("UPDATE jobs SET api_key = '' WHERE api_key != ''")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def submit(self, url, profile=False):
+        job_id = uuid.uuid4().hex
+        self._connection().execute(
+            "INSERT INTO jobs (id, url, status, progress, created_at, profile) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, url, QUEUED, "Waiting in queue", time.time(), int(profile)),
+        )
+        return job_id
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            "SELECT id, url, status, progress, filename, error, created_at, started_at, finished_at, profile"
+            " FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def claim(self):
+        # Atomically move the oldest queued job to running
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, url, profile FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = ?, progress = ?, started_at = ? WHERE id = ?",
+                           (RUNNING, "Starting", time.time(), row["id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return dict(row) if row else None
+
+    def add_event(self, job_id, event, data):
+        # Appends a record to the job's event log, numbered from 1
+        self._connection().execute(
+            "INSERT INTO job_events (job_id, seq, event, data)"
+            " SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?",
+            (job_id, event, json.dumps(data, default=str), job_id),
+        )
+
+    def events(self, job_id, after=0):
+        # [(seq, event, data)] recorded after seq `after`
+        rows = self._connection().execute(
+            "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        ).fetchall()
+        return [(row["seq"], row["event"], json.loads(row["data"])) for row in rows]
+
+    def update_progress(self, job_id, progress):
+        self._connection().execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def finish(self, job_id, filename):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, progress = ?, filename = ?, finished_at = ? WHERE id = ?",
+            (DONE, "Report ready", filename, time.time(), job_id),
+        )
+
+    def fail(self, job_id, error):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, progress = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED, "Failed", error, time.time(), job_id),
+        )
+
+    def counts(self):
+        # {status: number of jobs}
+        return dict(self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def requeue_stale(self, older_than):
+        # Jobs left running by a worker that died are put back in the queue,
+        # and the sections they had streamed are dropped with them
+        db = self._connection()
+        stale = (RUNNING, time.time() - older_than)
+        db.execute("DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs WHERE status = ? AND started_at < ?)",
+                   stale)
+        db.execute("UPDATE jobs SET status = ?, progress = ? WHERE status = ? AND started_at < ?",
+                   (QUEUED, "Waiting in queue") + stale)
+
+
+def report_path(job_id):
+    return os.path.join(config.REPORTS_DIR, f"seo_audit_report_{job_id}.html")
+
+
+def profile_path(job_id):
+    extension = "html" if config.PROFILER == "pyinstrument" else "prof"
+    return os.path.join(config.REPORTS_DIR, f"seo_audit_profile_{job_id}.{extension}")
+
+
+def run_job(queue, job):
+    # Imported here so the queue itself stays cheap to import in the web process
+    from process.audit import iter_audit
+    from process import metrics
+    from process.report import generate_html_report
+
+    job_id = job["id"]
+    try:
+        # Each section is stored on the job as soon as its stage completes
+        full_report = {}
+        with metrics.profiled(profile_path(job_id)) if job["profile"] else contextlib.nullcontext():
+            for section, fields in iter_audit(job["url"], config.PAGESPEED_API_KEY,
+                                              progress=lambda message: queue.update_progress(job_id, message)):
+                full_report.update(fields)
+                queue.add_event(job_id, "section", {"section": section, "fields": fields})
+        queue.update_progress(job_id, "Generating report")
+        os.makedirs(config.REPORTS_DIR, exist_ok=True)
+        generate_html_report(full_report, filename=report_path(job_id))
+        queue.finish(job_id, os.path.basename(report_path(job_id)))
+    except Exception as e:
+        logger.exception("Audit job %s of %s failed", job_id, job["url"])
+        queue.fail(job_id, str(e))
+
+
+def worker_loop(queue_path, stop_event):
+    queue = JobQueue(queue_path)
+    while not stop_event.is_set():
+        job = queue.claim()
+        if job is None:
+            stop_event.wait(config.JOB_POLL_INTERVAL)
+            continue
+        run_job(queue, job)
+
+
+class WorkerPool:
+    def __init__(self, queue_path=None, workers=None, mode=None):
+        self.queue_path = queue_path or config.JOB_QUEUE_PATH
+        self.workers = workers or config.JOB_WORKERS
+        self.mode = mode or config.JOB_WORKER_MODE
+        self.started = []
+        if self.mode == "process":
+            self.stop_event = multiprocessing.Event()
+        else:
+            self.stop_event = threading.Event()
+
+    def start(self):
+        JobQueue(self.queue_path).requeue_stale(config.JOB_STALE_AFTER)
+        if self.mode == "process" and multiprocessing.get_start_method() == "fork":
+            # Forked workers inherit the parent's modules, import the audit stack once here
+            from process.audit import preload
+            preload()
+        for index in range(self.workers):
+            if self.mode == "process":
+                worker = multiprocessing.Process(target=worker_loop, args=(self.queue_path, self.stop_event),
+                                                 name=f"audit-worker-{index}", daemon=True)
+            else:
+                worker = threading.Thread(target=worker_loop, args=(self.queue_path, self.stop_event),
+                                          name=f"audit-worker-{index}", daemon=True)
+            worker.start()
+            self.started.append(worker)
+        return self
+
+    def stop(self, timeout=None):
+        self.stop_event.set()
+        for worker in self.started:
+            worker.join(timeout)
+
+
+_queue = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+
+def ensure_workers():
+    # Workers start with the first submitted job, in whichever process serves it
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = WorkerPool().start()
+    return _pool
@@ -0,0 +1,144 @@
+import functools
+import math
+import re
+import threading
+from collections import Counter
+
+# Keyword analysis of a page's visible text (the extractor already leaves out
+# script, style and template contents). Stopwords are loaded once per
+# language, picked from <html lang>. Tokens are streamed off a precompiled
+# pattern and lowercased one at a time, feeding the word counts and a
+# two-token window for the bigrams and trigrams, so no lowered copy of the
+# text or token list is built; stopwords are dropped from the word counts
+# afterwards. Bigrams and trigrams skip phrases that start or end with a
+# stopword. TfIdf ranks words across crawled pages.
+
+WORD = re.compile(r"\w+")
+
+# <html lang> primary subtags mapped to NLTK stopword lists
+STOPWORD_LANGUAGES = {
+    "ar": "arabic", "az": "azerbaijani", "eu": "basque", "bn": "bengali", "ca": "catalan",
+    "zh": "chinese", "da": "danish", "nl": "dutch", "en": "english", "fi": "finnish",
+    "fr": "french", "de": "german", "el": "greek", "he": "hebrew", "hu": "hungarian",
+    "id": "indonesian", "it": "italian", "kk": "kazakh", "ne": "nepali", "no": "norwegian",
+    "nb": "norwegian", "nn": "norwegian", "pt": "portuguese", "ro": "romanian", "ru": "russian",
+    "sl": "slovene", "es": "spanish", "sv": "swedish", "tg": "tajik", "tr": "turkish",
+}
+DEFAULT_LANGUAGE = "english"
+
+
+def language_for(lang):
+    # "en-US" -> "english"; unknown or missing tags fall back to English
+    primary = (lang or "").strip().lower().replace("_", "-").split("-")[0]
+    return STOPWORD_LANGUAGES.get(primary, DEFAULT_LANGUAGE)
+
+
+_stop_words_lock = threading.RLock()
+
+
+@functools.lru_cache(maxsize=None)
+def stop_words(language=DEFAULT_LANGUAGE):
+    # nltk takes longer to import than the rest of the audit stack together,
+    # so it is loaded with the first stopword list. NLTK's lazy corpus loader
+    # is not thread-safe, so the first loads are serialized.
+    with _stop_words_lock:
+        from nltk.corpus import stopwords
+
+        try:
+            return frozenset(stopwords.words(language))
+        except OSError:
+            # The stopwords corpus is installed but has no list for this language
+            if language == DEFAULT_LANGUAGE:
+                raise
+            return stop_words(DEFAULT_LANGUAGE)
+
+
+class KeywordStats:
+    # Word, bigram and trigram counts of one text
+    __slots__ = ("words", "bigrams", "trigrams")
+
+    def __init__(self, words, bigrams, trigrams):
+        self.words = words
+        self.bigrams = bigrams
+        self.trigrams = trigrams
+
+    def top(self, n=15):
+        return self.words.most_common(n)
+
+    def top_bigrams(self, n=10):
+        return [(" ".join(gram), count) for gram, count in self.bigrams.most_common(n)]
+
+    def top_trigrams(self, n=10):
+        return [(" ".join(gram), count) for gram, count in self.trigrams.most_common(n)]
+
+
+def analyze(text, lang=None, ngrams=True):
+    stop = stop_words(language_for(lang))
+    tokens = (match.group().lower() for match in WORD.finditer(text))
+    bigrams = Counter()
+    trigrams = Counter()
+    if ngrams:
+        words = Counter()
+        # The two tokens before the current one
+        before = last = None
+        for token in tokens:
+            words[token] += 1
+            if token not in stop:
+                if last is not None and last not in stop:
+                    bigrams[last, token] += 1
+                if before is not None and before not in stop:
+                    trigrams[before, last, token] += 1
+            before, last = last, token
+    else:
+        words = Counter(tokens)
+    for word in stop & words.keys():
+        del words[word]
+    return KeywordStats(words, bigrams, trigrams)
+
+
+def top_keywords(text, lang=None, n=15):
+    return analyze(text, lang, ngrams=False).top(n)
+
+
+class TfIdf:
+    # Collects word counts of many pages (thread-safe, a crawl adds from its
+    # workers) and ranks each page's words by TF-IDF against all of them.
+    # Only each page's max_terms most frequent words are kept as candidates.
+    # Adding a page again replaces its earlier words.
+
+    def __init__(self, max_terms=200):
+        self.max_terms = max_terms
+        self.document_frequency = Counter()
+        self.documents = {}
+        self.terms = {}
+        self.lock = threading.Lock()
+
+    def add(self, doc_id, words):
+        total = sum(words.values())
+        candidates = {word: count / total for word, count in words.most_common(self.max_terms)} if total else None
+        terms = frozenset(word for word, count in words.items() if count > 0)
+        with self.lock:
+            self._remove(doc_id)
+            if candidates:
+                self.document_frequency.update(terms)
+                self.documents[doc_id] = candidates
+                self.terms[doc_id] = terms
+
+    def _remove(self, doc_id):
+        # Takes doc_id's words back out of the document frequencies (lock held)
+        self.documents.pop(doc_id, None)
+        for word in self.terms.pop(doc_id, ()):
+            self.document_frequency[word] -= 1
+            if not self.document_frequency[word]:
+                del self.document_frequency[word]
+
+    def top(self, doc_id, n=15):
+        documents = len(self.documents)
+        scores = {word: tf * (math.log((1 + documents) / (1 + self.document_frequency[word])) + 1)
+                  for word, tf in self.documents.get(doc_id, {}).items()}
+        return sorted(((word, round(score, 6)) for word, score in scores.items()),
+                      key=lambda item: item[1], reverse=True)[:n]
+
+    def __iter__(self):
+        for doc_id in list(self.documents):
+            yield doc_id, self.top(doc_id)
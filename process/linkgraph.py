@@ -0,0 +1,211 @@
+import argparse
+import json
+import sys
+import threading
+from array import array
+from collections import Counter
+from urllib.parse import urldefrag, urlparse
+
+# Internal link graph of a site, built from the "Internal Links" of every
+# audited page. URLs are interned to integer ids and edges kept in two flat
+# arrays (8 bytes per link) while pages come in; analyze() turns them into a
+# compressed sparse row (CSR) adjacency with NumPy and computes, without any
+# per-node Python loops:
+#
+# - PageRank over internal links (power iteration, damping 0.85), pages
+#   without outlinks spreading their rank evenly over the site
+# - click depth, the fewest clicks from the homepage (breadth-first search,
+#   one vectorized step per level)
+# - inlinks and outlinks per page, counting each linking page once
+# - orphan pages (audited, but no other page links to them) and dead ends
+#   (audited pages without internal links)
+#
+# A 100k page site with a million links takes a couple of seconds. NumPy is
+# imported on first use, so the CLIs don't pay for it unless asked.
+
+DAMPING = 0.85
+# Power iteration stops once the total change in rank is below this
+TOLERANCE = 1e-6
+MAX_ITERATIONS = 100
+# Pages listed by name in the summary, the rest are counted
+MAX_LISTED = 1000
+
+
+def normalize(url):
+    # Fragment-free URL with an explicit path, or None for non-web links
+    if url.startswith(("http://", "https://")) and "#" not in url and url.find("/", 8) > 0:
+        # Already normal, the common case; skips parsing a million links
+        return url
+    url, _ = urldefrag(url)
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return None
+    return url if parsed.path else parsed._replace(path="/").geturl()
+
+
+class LinkGraph:
+    # Thread-safe; add() every page's report as it completes, then call
+    # analyze(). The homepages to measure click depth from default to "/" of
+    # every host seen (batch audits may cover several sites).
+
+    def __init__(self, roots=None):
+        self.ids = {}
+        self.urls = []
+        self.sources = array("I")
+        self.targets = array("I")
+        # Audited pages and whether they answered 200, by id
+        self.audited = {}
+        self.roots = [url for url in map(normalize, roots or []) if url]
+        self.lock = threading.Lock()
+
+    def _intern(self, url):
+        node = self.ids.get(url)
+        if node is None:
+            node = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+        return node
+
+    def add(self, report):
+        url = normalize(report.get("URL", ""))
+        if url is None or "Error" in report:
+            return
+        links = [link for link in map(normalize, report.get("Internal Links", [])) if link]
+        with self.lock:
+            source = self._intern(url)
+            self.audited[source] = report.get("Status Code") == 200
+            self.targets.extend([self._intern(link) for link in links])
+            self.sources.extend(array("I", [source]) * len(links))
+
+    def track(self, reports):
+        # Passes reports through, adding each one
+        for report in reports:
+            self.add(report)
+            yield report
+
+    def _root_ids(self):
+        roots = self.roots or sorted({f"{urlparse(self.urls[node]).scheme}://{urlparse(self.urls[node]).netloc}/"
+                                      for node in self.audited})
+        return [self.ids[url] for url in roots if url in self.ids]
+
+    def analyze(self):
+        import numpy as np
+
+        with self.lock:
+            count = len(self.urls)
+            sources = np.frombuffer(self.sources, dtype=np.uint32).astype(np.int64)
+            targets = np.frombuffer(self.targets, dtype=np.uint32).astype(np.int64)
+            audited = np.fromiter(self.audited, dtype=np.int64, count=len(self.audited))
+            ok = np.fromiter(self.audited.values(), dtype=bool, count=len(self.audited))
+            roots = np.array(self._root_ids(), dtype=np.int64)
+            urls = list(self.urls)
+
+        # Sorting the unique (source, target) pairs gives the CSR order;
+        # repeated links and links to the page itself count once / not at all
+        edges = np.unique(sources[sources != targets] * count + targets[sources != targets])
+        sources, targets = np.divmod(edges, max(count, 1))
+        outlinks = np.bincount(sources, minlength=count)
+        inlinks = np.bincount(targets, minlength=count)
+        indptr = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(outlinks, out=indptr[1:])
+
+        rank = pagerank(np, sources, targets, outlinks, count)
+        depth = click_depth(np, indptr, targets, roots, count)
+
+        is_root = np.zeros(count, dtype=bool)
+        is_root[roots] = True
+        orphans = audited[(inlinks[audited] == 0) & ~is_root[audited]]
+        dead_ends = audited[ok & (outlinks[audited] == 0)]
+        order = audited[np.argsort(-rank[audited], kind="stable")]
+        depths = Counter(depth[audited].tolist())
+        unreachable = depths.pop(-1, 0)
+
+        return {
+            "Pages": int(audited.size),
+            "Links": int(edges.size),
+            "Homepages": [urls[node] for node in roots.tolist()],
+            "Click Depths": {str(level): depths[level] for level in sorted(depths)},
+            "Unreachable Pages": unreachable,
+            "Orphan Pages": len(orphans),
+            "Orphan Page URLs": [urls[node] for node in orphans[:MAX_LISTED].tolist()],
+            "Dead-End Pages": len(dead_ends),
+            "Dead-End Page URLs": [urls[node] for node in dead_ends[:MAX_LISTED].tolist()],
+            # Every audited page, highest PageRank first
+            "Page Metrics": [
+                {"URL": urls[node], "PageRank": score, "Click Depth": None if level < 0 else level,
+                 "Inlinks": inbound, "Outlinks": outbound}
+                for node, score, level, inbound, outbound in zip(
+                    order.tolist(), rank[order].tolist(), depth[order].tolist(),
+                    inlinks[order].tolist(), outlinks[order].tolist())
+            ],
+        }
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.analyze(), f, indent=2)
+
+
+def pagerank(np, sources, targets, outlinks, count, damping=DAMPING, tolerance=TOLERANCE,
+             max_iterations=MAX_ITERATIONS):
+    # Scores summing to 1; each iteration is one weighted bincount over the edges
+    if not count:
+        return np.zeros(0)
+    rank = np.full(count, 1 / count)
+    dangling = outlinks == 0
+    weights = np.zeros(count)
+    np.divide(1, outlinks, out=weights, where=~dangling)
+    for _ in range(max_iterations):
+        spread = damping * rank[dangling].sum() + 1 - damping
+        updated = damping * np.bincount(targets, weights=(rank * weights)[sources], minlength=count)
+        updated += spread / count
+        change = np.abs(updated - rank).sum()
+        rank = updated
+        if change < tolerance:
+            break
+    return rank
+
+
+def click_depth(np, indptr, targets, roots, count):
+    # Fewest clicks from any root, -1 where no root leads
+    depth = np.full(count, -1, dtype=np.int64)
+    frontier = np.unique(roots)
+    depth[frontier] = 0
+    level = 0
+    while frontier.size:
+        level += 1
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            break
+        # Positions of every outgoing edge of the frontier in `targets`
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        reached = targets[offsets]
+        frontier = np.unique(reached[depth[reached] < 0])
+        depth[frontier] = level
+    return depth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Link graph analytics (PageRank, click depth, orphan pages) "
+                                                 "from crawl or batch output.")
+    parser.add_argument("input", help="Raw JSON Lines reports ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="Output file (JSON), defaults to stdout")
+    parser.add_argument("--root", action="append", help="Homepage to count click depth from "
+                                                        "(default: / of every host)")
+    args = parser.parse_args(argv)
+
+    graph = LinkGraph(args.root)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    with source:
+        for line in source:
+            if line.strip():
+                graph.add(json.loads(line))
+    if args.output:
+        graph.write(args.output)
+    else:
+        json.dump(graph.analyze(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urldefrag, urlparse
+import requests
+from process import config, metrics
+from process.network import get_session
+
+# Status used when a link could not be reached at all (DNS, refused, timeout...)
+UNREACHABLE = 0
+
+# Servers that refuse HEAD usually answer with one of these
+HEAD_NOT_SUPPORTED = {400, 403, 405, 501}
+
+
+def normalize_links(urls):
+    # Drop fragments and duplicates, keep the first-seen order
+    seen = set()
+    unique = []
+    for url in urls:
+        url, _ = urldefrag(url)
+        if urlparse(url).scheme not in ("http", "https"):
+            continue
+        if url not in seen:
+            seen.add(url)
+            unique.append(url)
+    return unique
+
+
+def probe_link(url, timeout=None, session=None):
+    session = session or get_session()
+    timeout = timeout or (config.LINK_CHECK_CONNECT_TIMEOUT, config.LINK_CHECK_READ_TIMEOUT)
+    try:
+        response = session.head(url, allow_redirects=True, timeout=timeout)
+        response.close()
+        if response.status_code not in HEAD_NOT_SUPPORTED:
+            return response.status_code
+
+        # Fall back to a GET for a single byte so we never pull the whole body
+        response = session.get(url, headers={"Range": "bytes=0-0"}, stream=True,
+                               allow_redirects=True, timeout=timeout)
+        response.close()
+        return response.status_code
+    except requests.RequestException:
+        metrics.record_error("link")
+        return UNREACHABLE
+
+
+def check_links(urls, timeout=None, deadline=None, max_workers=None, max_per_host=None):
+    # Returns {url: status_code}. Links still pending when the deadline
+    # expires are left out of the result instead of stalling the audit.
+    deadline = config.LINK_CHECK_DEADLINE if deadline is None else deadline
+    max_workers = max_workers or config.LINK_CHECK_WORKERS
+    max_per_host = max_per_host or config.LINK_CHECK_PER_HOST
+
+    urls = normalize_links(urls)
+    if not urls:
+        return {}
+
+    host_limits = defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+    for url in urls:
+        host_limits[urlparse(url).netloc]
+
+    def run(url):
+        with host_limits[urlparse(url).netloc]:
+            return probe_link(url, timeout)
+
+    results = {}
+    end_time = time.monotonic() + deadline
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    try:
+        pending = {pool.submit(metrics.bind(run), url): url for url in _interleave_hosts(urls)}
+        while pending:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def find_broken_links(urls, **kwargs):
+    statuses = check_links(urls, **kwargs)
+    return [url for url in normalize_links(urls) if statuses.get(url) in (404, UNREACHABLE)]
+
+
+def _interleave_hosts(urls):
+    # Round-robin over hosts so workers are not all queued behind one host's limit
+    by_host = defaultdict(list)
+    for url in urls:
+        by_host[urlparse(url).netloc].append(url)
+    queues = list(by_host.values())
+    ordered = []
+    index = 0
+    while queues:
+        queues = [queue for queue in queues if index < len(queue)]
+        ordered.extend(queue[index] for queue in queues)
+        index += 1
+    return ordered
@@ -0,0 +1,182 @@
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from process import config, metrics
+
+# Memoization for slow, rate-limited lookups (WHOIS, PageSpeed). Results are
+# kept in a per-source LRU with a TTL, persisted to SQLite so they survive
+# restarts, and concurrent calls for the same key share one in-flight lookup.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS memo (
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (source, key)
+)
+"""
+
+
+class MemoStore:
+    # SQLite persistence shared by every memoized source
+
+    def __init__(self, path=None):
+        self.path = path or config.MEMO_CACHE_PATH
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get(self, source, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM memo WHERE source = ? AND key = ?", (source, key)
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[1], pickle.loads(row[0])
+
+    def put(self, source, key, value, expires_at):
+        with self._connection() as db:
+            db.execute("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)",
+                       (source, key, pickle.dumps(value), expires_at))
+            db.execute("DELETE FROM memo WHERE expires_at <= ?", (time.time(),))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MemoStore()
+    return _store
+
+
+class Memo:
+    def __init__(self, source, func, ttl, maxsize, key, should_cache):
+        self.source = source
+        self.func = func
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.key = key
+        self.should_cache = should_cache
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __call__(self, *args, **kwargs):
+        key = repr(self.key(*args, **kwargs))
+        with self.lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                metrics.record_cache(self.source, "hit")
+                return value[0]
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                metrics.record_cache(self.source, "coalesced")
+                leader = False
+            else:
+                future = self.in_flight[key] = Future()
+                leader = True
+        if not leader:
+            return future.result()
+
+        try:
+            value = self._load_persisted(key)
+            if value is None:
+                self.misses += 1
+                metrics.record_cache(self.source, "miss")
+                result = self.func(*args, **kwargs)
+                if self.should_cache(result):
+                    self._remember(key, result, time.time() + self.ttl, persist=config.MEMO_PERSIST)
+            else:
+                result = value
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def _lookup(self, key):
+        # Called with the lock held; returns (value,) so None results can be cached
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return (value,)
+
+    def _load_persisted(self, key):
+        if not config.MEMO_PERSIST:
+            return None
+        row = get_store().get(self.source, key)
+        if row is None:
+            return None
+        self.hits += 1
+        metrics.record_cache(self.source, "hit")
+        expires_at, value = row
+        self._remember(key, value, expires_at, persist=False)
+        return value
+
+    def _remember(self, key, value, expires_at, persist):
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        if persist:
+            get_store().put(self.source, key, value, expires_at)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def memoize(source, ttl, maxsize=1024, key=None, should_cache=None):
+    # key(*args, **kwargs) picks the cache key (defaults to all arguments);
+    # should_cache(result) can refuse to cache failed lookups.
+    key = key or (lambda *args, **kwargs: (args, sorted(kwargs.items())))
+    should_cache = should_cache or (lambda result: True)
+
+    def decorator(func):
+        memo = Memo(source, func, ttl, maxsize, key, should_cache)
+        wrapper = functools.wraps(func)(lambda *args, **kwargs: memo(*args, **kwargs))
+        wrapper.memo = memo
+        return wrapper
+
+    return decorator
+
+
+def without_error(result):
+    # WHOIS and PageSpeed report failures as {"Error": ...}; retry those next time
+    return not (isinstance(result, dict) and "Error" in result)
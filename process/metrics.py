@@ -0,0 +1,284 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from process import config
+
+# Instrumentation. Each audit runs inside an AuditTrace that records timed
+# spans per stage, HTTP requests, bytes downloaded, cache hits and errors;
+# its summary is attached to the report as "Audit Metrics". Everything is
+# also added to process-wide counters and histograms that /metrics exposes
+# in the Prometheus text format (for the process serving the request, so
+# thread-mode job workers are included, process-mode and batch workers not).
+#
+# The active trace lives in a context variable. Work handed to a thread
+# pool is wrapped with bind() so it is counted in the submitting audit.
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += amount
+
+    def observe(self, name, value, buckets=STAGE_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [buckets, [0] * len(buckets), 0, 0.0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                histogram[1][index] += 1
+            histogram[2] += 1
+            histogram[3] += value
+
+    def render(self, gauges=()):
+        # Prometheus text exposition format; gauges are (name, labels, value) read at scrape time
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (buckets, counts, count, total) in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        for name, labels, value in gauges:
+            header(name, "gauge")
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+METRIC_HELP = {
+    "seo_audit_audits_total": "Audits run.",
+    "seo_audit_stage_duration_seconds": "Duration of each audit stage.",
+    "seo_audit_http_requests_total": "HTTP requests sent over the network.",
+    "seo_audit_http_bytes_total": "Response body bytes downloaded.",
+    "seo_audit_http_cache_total": "HTTP cache lookups by result.",
+    "seo_audit_lookup_cache_total": "WHOIS and PageSpeed cache lookups by result.",
+    "seo_audit_errors_total": "Errors by audit stage.",
+    "seo_audit_http_retries_total": "HTTP requests retried after a 429 or 5xx response.",
+    "seo_audit_backoffs_total": "Times a host's concurrency limit was halved.",
+    "seo_audit_jobs": "Background audit jobs by status.",
+}
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = Registry()
+
+_current = contextvars.ContextVar("audit_trace", default=None)
+
+
+class AuditTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans = []
+        self.requests = 0
+        self.bytes = 0
+        self.cache = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.spans.append((stage, start - self.started, duration, failed))
+            registry.observe("seo_audit_stage_duration_seconds", duration, stage=stage)
+            if failed:
+                self.error(stage)
+
+    def timed(self, stage, func):
+        # func wrapped to run as a span of this trace, in a copy of the caller's context
+        def run(*args, **kwargs):
+            with self.span(stage):
+                result = func(*args, **kwargs)
+            if isinstance(result, dict) and "Error" in result:
+                # WHOIS and PageSpeed report failures in the result
+                self.error(stage)
+            return result
+        return bind(run)
+
+    def error(self, stage):
+        with self.lock:
+            self.errors[stage] += 1
+        registry.inc("seo_audit_errors_total", stage=stage)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "Total Seconds": round(time.perf_counter() - self.started, 3),
+                "Stages": [{"stage": stage, "start": round(start, 3), "seconds": round(duration, 3),
+                            "failed": failed} for stage, start, duration, failed in self.spans],
+                "HTTP Requests": self.requests,
+                "Bytes Downloaded": self.bytes,
+                "Cache": dict(self.cache),
+                "Errors": dict(self.errors),
+            }
+
+
+@contextlib.contextmanager
+def trace():
+    # The active trace, or a new one for the duration of the block
+    current = _current.get()
+    if current is not None:
+        yield current
+        return
+    current = AuditTrace()
+    token = _current.set(current)
+    registry.inc("seo_audit_audits_total")
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+
+
+def current_trace():
+    return _current.get()
+
+
+def bind(func):
+    # Runs func in a copy of the current context, for thread pools
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def record_request():
+    registry.inc("seo_audit_http_requests_total")
+    active = _current.get()
+    if active is not None:
+        with active.lock:
+            active.requests += 1
+
+
+def record_bytes(count):
+    registry.inc("seo_audit_http_bytes_total", count)
+    active = _current.get()
+    if active is not None:
+        with active.lock:
+            active.bytes += count
+
+
+def record_cache(kind, result):
+    # kind is "http" or a memoized lookup source ("whois", "pagespeed")
+    if kind == "http":
+        registry.inc("seo_audit_http_cache_total", result=result)
+    else:
+        registry.inc("seo_audit_lookup_cache_total", source=kind, result=result)
+    active = _current.get()
+    if active is not None:
+        with active.lock:
+            active.cache[f"{kind} {result}"] += 1
+
+
+def record_error(stage):
+    active = _current.get()
+    if active is not None:
+        active.error(stage)
+    else:
+        registry.inc("seo_audit_errors_total", stage=stage)
+
+
+class CountingStream:
+    # Wraps a urllib3 response so bytes read off the wire are counted,
+    # whether the body is streamed (iter_content) or read at once
+    def __init__(self, raw):
+        self._raw = raw
+
+    def stream(self, *args, **kwargs):
+        before = self._raw.tell()
+        for chunk in self._raw.stream(*args, **kwargs):
+            after = self._raw.tell()
+            record_bytes(after - before)
+            before = after
+            yield chunk
+
+    def read(self, *args, **kwargs):
+        before = self._raw.tell()
+        data = self._raw.read(*args, **kwargs)
+        record_bytes(self._raw.tell() - before)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+@contextlib.contextmanager
+def profiled(path):
+    # Profiles the block into path: a pyinstrument HTML page when
+    # config.PROFILER is "pyinstrument" and it is installed, otherwise cProfile
+    # stats (open with pstats or snakeviz). Only the calling thread is
+    # profiled; stage threads show up as time spent waiting on their futures.
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if config.PROFILER == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            pass
+        else:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+            return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,419 @@
+import csv
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+from urllib.parse import urlsplit
+
+# Typed, compact form of an audit report. check_tags produces a dict of
+# display strings ("No title", "Yes"/"No", "All links well good"...);
+# AuditResult.from_report turns it into real values, and keeps links and
+# images as array-backed columns with hostnames interned in a HostTable,
+# so thousands of results can be held and exported cheaply. A HostTable is
+# shared by the results of one export (pass it to from_report) and freed
+# with them; a result built without one gets its own.
+
+HEADINGS = ("H1", "H2", "H3", "H4", "H5", "H6")
+UNKNOWN = -1
+
+
+class HostTable:
+    # Interns hostnames: each distinct host is stored once and referenced by
+    # id. Thread-safe, results built on several threads may share one.
+    __slots__ = ("hosts", "ids", "lock")
+
+    def __init__(self):
+        self.hosts = []
+        self.ids = {}
+        self.lock = threading.Lock()
+
+    def intern(self, host):
+        host_id = self.ids.get(host)
+        if host_id is None:
+            with self.lock:
+                host_id = self.ids.get(host)
+                if host_id is None:
+                    self.hosts.append(sys.intern(host))
+                    host_id = self.ids[host] = len(self.hosts) - 1
+        return host_id
+
+    def split(self, url):
+        # (host id, rest of the URL)
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}" if parts.netloc else ""
+        return self.intern(origin), url[len(origin):]
+
+
+class LinkTable:
+    __slots__ = ("hosts", "host_ids", "paths", "internal", "broken")
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.host_ids = array("I")
+        self.paths = []
+        self.internal = array("b")
+        self.broken = array("b")
+
+    def append(self, url, internal, broken):
+        host_id, path = self.hosts.split(url)
+        self.host_ids.append(host_id)
+        self.paths.append(path)
+        self.internal.append(internal)
+        self.broken.append(broken)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        for host_id, path, internal, broken in zip(self.host_ids, self.paths, self.internal, self.broken):
+            yield {"url": self.hosts.hosts[host_id] + path, "internal": bool(internal), "broken": bool(broken)}
+
+
+class ImageTable:
+    __slots__ = ("hosts", "host_ids", "paths", "alts", "sizes", "widths", "heights", "formats")
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.host_ids = array("I")
+        self.paths = []
+        self.alts = []
+        self.sizes = array("d")
+        self.widths = array("i")
+        self.heights = array("i")
+        self.formats = []
+
+    def append(self, src, alt, size, width=None, height=None, format=None):
+        host_id, path = self.hosts.split(src)
+        self.host_ids.append(host_id)
+        self.paths.append(path)
+        self.alts.append(alt)
+        self.sizes.append(size if isinstance(size, (int, float)) else math.nan)
+        self.widths.append(width if width is not None else UNKNOWN)
+        self.heights.append(height if height is not None else UNKNOWN)
+        self.formats.append(sys.intern(format) if format else None)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        for i, host_id in enumerate(self.host_ids):
+            yield {
+                "src": self.hosts.hosts[host_id] + self.paths[i],
+                "alt": self.alts[i],
+                "size_kb": None if math.isnan(self.sizes[i]) else self.sizes[i],
+                "width": None if self.widths[i] == UNKNOWN else self.widths[i],
+                "height": None if self.heights[i] == UNKNOWN else self.heights[i],
+                "format": self.formats[i],
+            }
+
+
+class AuditResult:
+    __slots__ = (
+        "url", "status_code", "error", "title", "description", "favicon", "h1_texts",
+        "heading_counts", "canonical", "robots_tag", "og_tags", "schema_markup",
+        "social_links", "iframes", "links", "images", "keywords", "pagespeed_mobile",
+        "pagespeed_desktop", "custom_404", "robots_txt", "sitemap_xml", "https", "whois",
+        "crawl_depth", "changes", "language", "bigrams", "trigrams", "audit_metrics", "sitemap_urls",
+        "in_sitemap", "content_signature", "page_weight",
+    )
+
+    def __init__(self, url, hosts=None):
+        hosts = HostTable() if hosts is None else hosts
+        self.url = url
+        self.status_code = None
+        self.error = None
+        self.title = None
+        self.description = None
+        self.favicon = None
+        self.h1_texts = ()
+        self.heading_counts = (0,) * len(HEADINGS)
+        self.canonical = None
+        self.robots_tag = None
+        self.og_tags = False
+        self.schema_markup = False
+        self.social_links = ()
+        self.iframes = ()
+        self.links = LinkTable(hosts)
+        self.images = ImageTable(hosts)
+        self.keywords = ()
+        self.pagespeed_mobile = {}
+        self.pagespeed_desktop = {}
+        self.custom_404 = None
+        self.robots_txt = None
+        self.sitemap_xml = None
+        self.sitemap_urls = None
+        self.https = None
+        self.whois = {}
+        self.crawl_depth = None
+        self.in_sitemap = None
+        self.changes = None
+        self.language = None
+        self.bigrams = ()
+        self.trigrams = ()
+        self.audit_metrics = None
+        self.content_signature = None
+        self.page_weight = None
+
+    @classmethod
+    def from_report(cls, report, hosts=None):
+        result = cls(report["URL"], hosts)
+        result.status_code = report.get("Status Code")
+        result.error = report.get("Error")
+        result.title = _text(report.get("Title"), "No title")
+        result.description = _text(report.get("Description"), "No description")
+        result.favicon = _text(report.get("Favicon Link"), "No favicon link")
+        result.h1_texts = tuple(_items(report.get("H1 Tags Text")))
+        result.heading_counts = tuple(report.get(f"{heading} Count", 0) for heading in HEADINGS)
+        result.canonical = _text(report.get("Canonical Tag"), "No canonical tag")
+        result.robots_tag = _text(report.get("Robots Tag"), "No robots tag")
+        result.og_tags = _flag(report.get("OG Tags Available")) or False
+        result.schema_markup = _flag(report.get("Schema Markup Available")) or False
+        result.social_links = tuple(_items(report.get("social_media_links")))
+        result.iframes = tuple(iframe for iframe in _items(report.get("iframes")) if isinstance(iframe, dict))
+
+        broken = set(_items(report.get("broken_links")))
+        for url in report.get("Internal Links", []):
+            result.links.append(url, True, url in broken)
+        for url in report.get("External Links", []):
+            result.links.append(url, False, url in broken)
+        for image in report.get("Image Details", []):
+            result.images.append(image["src"], image.get("alt"), image.get("size"),
+                                 image.get("width"), image.get("height"), image.get("format"))
+
+        result.keywords = tuple((word, count) for word, count in report.get("Top Keywords", []))
+        result.bigrams = tuple((phrase, count) for phrase, count in report.get("Top Bigrams", []))
+        result.trigrams = tuple((phrase, count) for phrase, count in report.get("Top Trigrams", []))
+        result.language = _text(report.get("Language"), "Not specified")
+        result.content_signature = report.get("Content Signature")
+        result.audit_metrics = report.get("Audit Metrics")
+        result.page_weight = report.get("Page Weight")
+        result.pagespeed_mobile = report.get("PageSpeed Metrics Mobile") or {}
+        result.pagespeed_desktop = report.get("PageSpeed Metrics Desktop") or {}
+        result.custom_404 = _flag(report.get("Custom 404 Page"))
+        result.robots_txt = _flag(report.get("Robots.txt Available"))
+        result.sitemap_xml = _flag(report.get("Sitemap.xml Available"))
+        result.sitemap_urls = report.get("Sitemap URLs")
+        result.https = _flag(report.get("HTTPS"))
+        result.whois = {key: report[key] for key in WHOIS_KEYS if key in report}
+        result.crawl_depth = report.get("Crawl Depth")
+        result.in_sitemap = _flag(report.get("In Sitemap"))
+        result.changes = report.get("Changes")
+        return result
+
+    @property
+    def broken_links(self):
+        return [link["url"] for link in self.links if link["broken"]]
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "status_code": self.status_code,
+            "error": self.error,
+            "title": self.title,
+            "description": self.description,
+            "favicon": self.favicon,
+            "h1_texts": list(self.h1_texts),
+            "heading_counts": dict(zip(HEADINGS, self.heading_counts)),
+            "canonical": self.canonical,
+            "robots_tag": self.robots_tag,
+            "og_tags": self.og_tags,
+            "schema_markup": self.schema_markup,
+            "social_links": list(self.social_links),
+            "iframes": list(self.iframes),
+            "links": list(self.links),
+            "images": list(self.images),
+            "language": self.language,
+            "keywords": [list(keyword) for keyword in self.keywords],
+            "bigrams": [list(phrase) for phrase in self.bigrams],
+            "trigrams": [list(phrase) for phrase in self.trigrams],
+            "content_signature": self.content_signature,
+            "page_weight": self.page_weight,
+            "pagespeed_mobile": self.pagespeed_mobile,
+            "pagespeed_desktop": self.pagespeed_desktop,
+            "custom_404": self.custom_404,
+            "robots_txt": self.robots_txt,
+            "sitemap_xml": self.sitemap_xml,
+            "sitemap_urls": self.sitemap_urls,
+            "https": self.https,
+            "whois": self.whois,
+            "crawl_depth": self.crawl_depth,
+            "in_sitemap": self.in_sitemap,
+            "changes": self.changes,
+            "audit_metrics": self.audit_metrics,
+        }
+
+
+WHOIS_KEYS = ("Domain Name", "Registrar", "Creation Date", "Expiration Date", "Last Updated", "Name Servers", "Status")
+
+
+def _text(value, missing):
+    return None if value in (None, "", missing) else value
+
+
+def _items(value):
+    # Lists stay lists, placeholder messages ("No H1 tags"...) become empty
+    return value if isinstance(value, (list, tuple)) else []
+
+
+def _flag(value):
+    return {"Yes": True, "No": False}.get(value)
+
+
+def _weight_columns(weight):
+    # page_weight_kb, page_requests, render_blocking_count
+    if not weight:
+        return None, None, None
+    return weight["Total Weight KB"], weight["Requests"], len(weight["Render-Blocking Resources"])
+
+
+# Exports
+
+def write_json(results, out):
+    json.dump([result.to_dict() for result in results], out, default=str)
+
+
+def write_ndjson(results, out):
+    for result in results:
+        out.write(json.dumps(result.to_dict(), default=str) + "\n")
+
+
+PAGE_COLUMNS = ("page_id", "url", "status_code", "error", "title", "description", "canonical",
+                "robots_tag", "og_tags", "schema_markup", "h1_count", "h2_count", "h3_count",
+                "h4_count", "h5_count", "h6_count", "link_count", "broken_link_count", "image_count",
+                "custom_404", "robots_txt", "sitemap_xml", "sitemap_urls", "https", "crawl_depth",
+                "in_sitemap", "content_signature", "page_weight_kb", "page_requests", "render_blocking_count")
+LINK_COLUMNS = ("page_id", "url", "internal", "broken")
+IMAGE_COLUMNS = ("page_id", "src", "alt", "size_kb", "width", "height", "format")
+
+
+def iter_tables(results):
+    # Flattens results into (table, row) pairs for the pages, links and images tables
+    for page_id, result in enumerate(results):
+        yield "pages", (page_id, result.url, result.status_code, result.error, result.title,
+                        result.description, result.canonical, result.robots_tag, result.og_tags,
+                        result.schema_markup, *result.heading_counts, len(result.links),
+                        sum(result.links.broken), len(result.images), result.custom_404,
+                        result.robots_txt, result.sitemap_xml, result.sitemap_urls, result.https,
+                        result.crawl_depth, result.in_sitemap, result.content_signature,
+                        *_weight_columns(result.page_weight))
+        for link in result.links:
+            yield "links", (page_id, link["url"], link["internal"], link["broken"])
+        for image in result.images:
+            yield "images", (page_id, *image.values())
+
+
+TABLE_COLUMNS = {"pages": PAGE_COLUMNS, "links": LINK_COLUMNS, "images": IMAGE_COLUMNS}
+
+# Arrow type of every column (pyarrow type factory names), so each Parquet
+# batch has the same schema whichever of its columns happen to be all null
+COLUMN_TYPES = {
+    "page_id": "int64", "url": "string", "status_code": "int64", "error": "string", "title": "string",
+    "description": "string", "canonical": "string", "robots_tag": "string", "og_tags": "bool_",
+    "schema_markup": "bool_", "h1_count": "int64", "h2_count": "int64", "h3_count": "int64",
+    "h4_count": "int64", "h5_count": "int64", "h6_count": "int64", "link_count": "int64",
+    "broken_link_count": "int64", "image_count": "int64", "custom_404": "bool_", "robots_txt": "bool_",
+    "sitemap_xml": "bool_", "sitemap_urls": "int64", "https": "bool_", "crawl_depth": "int64",
+    "in_sitemap": "bool_", "content_signature": "string", "page_weight_kb": "float64",
+    "page_requests": "int64", "render_blocking_count": "int64", "internal": "bool_", "broken": "bool_",
+    "src": "string", "alt": "string", "size_kb": "float64", "width": "int64", "height": "int64",
+    "format": "string",
+}
+
+
+def table_schema(name):
+    # The pyarrow schema of one of the TABLE_COLUMNS tables
+    import pyarrow as pa
+
+    return pa.schema([(column, getattr(pa, COLUMN_TYPES[column])()) for column in TABLE_COLUMNS[name]])
+
+
+def write_csv_tables(results, directory):
+    # pages.csv, links.csv and images.csv, joined on page_id
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, f"{name}.csv"), "w", newline="", encoding="utf-8")
+             for name in TABLE_COLUMNS}
+    try:
+        writers = {name: csv.writer(f) for name, f in files.items()}
+        for name, columns in TABLE_COLUMNS.items():
+            writers[name].writerow(columns)
+        for name, row in iter_tables(results):
+            writers[name].writerow(row)
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def write_parquet_tables(results, directory, batch_size=50000):
+    # Same tables as write_csv_tables, as Parquet files (needs pyarrow)
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+
+    os.makedirs(directory, exist_ok=True)
+    schemas = {name: table_schema(name) for name in TABLE_COLUMNS}
+    writers = {}
+    buffers = {name: [] for name in TABLE_COLUMNS}
+
+    def flush(name):
+        rows = buffers[name]
+        if not rows:
+            return
+        table = pa.Table.from_pydict({column: list(values) for column, values in zip(TABLE_COLUMNS[name], zip(*rows))},
+                                     schema=schemas[name])
+        if name not in writers:
+            writers[name] = pq.ParquetWriter(os.path.join(directory, f"{name}.parquet"), schemas[name])
+        writers[name].write_table(table)
+        buffers[name] = []
+
+    try:
+        for name, row in iter_tables(results):
+            buffers[name].append(row)
+            if len(buffers[name]) >= batch_size:
+                flush(name)
+        for name in TABLE_COLUMNS:
+            flush(name)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+
+EXPORT_FORMATS = ("ndjson", "json", "csv", "parquet")
+
+
+def export(results, format, output):
+    # output is a file object for json/ndjson and a directory for csv/parquet
+    if format == "ndjson":
+        write_ndjson(results, output)
+    elif format == "json":
+        write_json(results, output)
+    elif format == "csv":
+        write_csv_tables(results, output)
+    elif format == "parquet":
+        write_parquet_tables(results, output)
+    else:
+        raise ValueError(f"Unknown export format: {format}")
+
+
+def write_reports(reports, format="raw", output=None):
+    # CLI output for report dicts: "raw" writes them as they are, one JSON
+    # object per line, the export formats convert them to the typed model.
+    # output is a path (a directory for csv/parquet), stdout when None.
+    hosts = HostTable()
+    if format in ("csv", "parquet"):
+        export((AuditResult.from_report(report, hosts) for report in reports), format, output)
+        return
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        if format == "raw":
+            for report in reports:
+                out.write(json.dumps(report, default=str) + "\n")
+                out.flush()
+        else:
+            export((AuditResult.from_report(report, hosts) for report in reports), format, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,83 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from process import config, metrics
+from process.http_cache import CachedSession, HttpCache
+from process.ratelimit import RETRY_METHODS, RETRY_STATUSES, get_limiter, parse_retry_after, retry_delay
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PoliteAdapter(HTTPAdapter):
+    # Every request that goes out on the network waits for its host's rate
+    # limit and concurrency slot (process/ratelimit.py), is counted, and
+    # reports its status and time to headers back to the limiter. GET and
+    # HEAD requests answered with 429/502/503/504 are retried after a
+    # jittered backoff, as long as the waits add up to no more than the
+    # request's read timeout (a long Retry-After returns the answer as is);
+    # connection errors and timeouts are not retried here.
+    def send(self, request, **kwargs):
+        limiter = get_limiter()
+        host = urlparse(request.url).netloc
+        budget = read_timeout(kwargs.get("timeout"))
+        waited = 0
+        attempt = 0
+        while True:
+            with limiter.slot(host) as state:
+                metrics.record_request()
+                start = time.monotonic()
+                response = super().send(request, **kwargs)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                limiter.record(state, response.status_code, time.monotonic() - start, retry_after)
+            if (response.status_code not in RETRY_STATUSES or request.method not in RETRY_METHODS
+                    or attempt >= config.RETRY_ATTEMPTS):
+                return response
+            delay = retry_delay(attempt, retry_after)
+            if budget is not None and waited + delay > budget:
+                return response
+            response.close()
+            metrics.registry.inc("seo_audit_http_retries_total")
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
+
+    def build_response(self, req, resp):
+        response = super().build_response(req, resp)
+        response.raw = metrics.CountingStream(response.raw)
+        return response
+
+
+def read_timeout(timeout):
+    # The read part of a requests timeout (a number or a (connect, read) tuple)
+    if isinstance(timeout, tuple):
+        timeout = timeout[1]
+    return timeout if isinstance(timeout, (int, float)) else None
+
+
+def get_session():
+    # One shared session so every check reuses keep-alive connections and
+    # the on-disk HTTP cache. urllib3 keeps a separate pool per host behind the adapter.
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                if config.HTTP_CACHE_ENABLED:
+                    session = CachedSession(HttpCache())
+                else:
+                    session = requests.Session()
+                adapter = PoliteAdapter(
+                    pool_connections=config.HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["User-Agent"] = config.USER_AGENT
+                _session = session
+    return _session
+
+
+def page_timeout():
+    return (config.LINK_CHECK_CONNECT_TIMEOUT, config.PAGE_READ_TIMEOUT)
@@ -1,9 +1,19 @@
 import requests
+from process import config
+from process.memo import memoize, without_error
+from process.network import get_session
 
 # Function to fetch Google PageSpeed Insights metrics
+# Results are cached per URL and strategy; the API key is not part of the key
+@memoize("pagespeed", ttl=config.PAGESPEED_CACHE_TTL,
+         key=lambda url, api_key, strategy: (url, strategy), should_cache=without_error)
 def get_pagespeed_metrics(url, api_key, strategy):
-    api_url = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={url}&strategy={strategy}&key={api_key}"
-    response = requests.get(api_url)
+    api_url = f"{config.PAGESPEED_API_URL}?url={url}&strategy={strategy}&key={api_key}"
+    # Through the shared session, so the API's rate limit and retries apply
+    try:
+        response = get_session().get(api_url, timeout=(config.LINK_CHECK_CONNECT_TIMEOUT, config.PAGESPEED_TIMEOUT))
+    except requests.RequestException as e:
+        return {"Error": f"Failed to fetch PageSpeed data: {e}"}
     metrics = {}
 
     if response.status_code == 200:
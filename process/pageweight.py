@@ -0,0 +1,177 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin
+import requests
+from process import config, metrics
+from process.http_cache import parse_cache_control
+from process.network import get_session
+
+# Local page weight and render-blocking analysis, from the parsed page
+# instead of a remote Lighthouse run. The stylesheets, scripts and preloaded
+# fonts the extractor found are probed concurrently for their transfer size,
+# compression and cache lifetime; stylesheets are read to find the fonts
+# their @font-face rules load. Images come from the image stage, which has
+# already measured them. Resources in <head> that hold up the first render
+# (stylesheets, scripts without async/defer) are flagged. Probes bypass the
+# HTTP cache, which stores bodies decoded, so sizes and headers are the
+# ones a browser would get.
+
+FONT_FACE = re.compile(r"@font-face\s*{[^}]*}", re.IGNORECASE)
+FONT_URL = re.compile(r"""url\(\s*['"]?([^'")]+?\.(?:woff2?|ttf|otf|eot)(?:[?#][^'")]*)?)['"]?\s*\)""", re.IGNORECASE)
+# Text resources worth compressing; smaller ones gain too little to report
+TEXT_TYPES = ("document", "css", "script")
+MIN_COMPRESSIBLE_BYTES = 1024
+
+
+def font_urls(css):
+    # Font files loaded by the @font-face rules of a stylesheet
+    return [url for rule in FONT_FACE.findall(css) for url in FONT_URL.findall(rule)]
+
+
+def cache_lifetime(headers):
+    # Seconds a response may be reused from the browser cache, 0 when it must
+    # not be, None without any caching headers
+    directives = parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    if directives.get("max-age", "").isdigit():
+        return int(directives["max-age"])
+    if headers.get("Expires"):
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            # Invalid dates such as "0" mean already expired
+            return 0
+        return max(0, int(expires - time.time()))
+    return None
+
+
+def _resource(url, kind, render_blocking, response=None, size=None):
+    headers = response.headers if response is not None else {}
+    return {
+        "URL": url,
+        "Type": kind,
+        "Status": response.status_code if response is not None else None,
+        "Size KB": round(size / 1024, 2) if size is not None else None,
+        "Compression": headers.get("Content-Encoding"),
+        "Cache Lifetime": cache_lifetime(headers),
+        "Render Blocking": render_blocking,
+    }
+
+
+def document_resource(url, response, size):
+    # The page itself, from its response and the bytes the parser read
+    try:
+        size = response.raw.tell() or size
+    except (AttributeError, TypeError, ValueError):
+        pass
+    resource = _resource(url, "document", False, response, size)
+    if getattr(response, "from_cache", False):
+        # Served from the HTTP cache, decoded: the size is uncompressed and
+        # whether the server compresses it is unknown
+        resource["From Cache"] = True
+    return resource
+
+
+def probe_resource(url, kind, render_blocking=False):
+    # (resource info, stylesheet text or None). Content-Length from a HEAD
+    # is trusted when present; stylesheets, and responses without a length,
+    # are downloaded and counted as they arrive off the wire.
+    if url.startswith("data:"):
+        return _resource(url, kind, render_blocking, size=len(url.partition(",")[2])), None
+    session = get_session()
+    timeout = (config.LINK_CHECK_CONNECT_TIMEOUT, config.IMAGE_READ_TIMEOUT)
+    headers = {"Cache-Control": "no-cache"}
+    try:
+        if kind != "css":
+            response = session.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+            response.close()
+            length = response.headers.get("Content-Length")
+            if response.ok and length and length.isdigit():
+                return _resource(url, kind, render_blocking, response, int(length)), None
+
+        response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        try:
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if kind == "css" and size <= config.PAGE_WEIGHT_MAX_CSS_BYTES:
+                    chunks.append(chunk)
+            try:
+                # Bytes on the wire, before decompression
+                size = response.raw.tell() or size
+            except (AttributeError, TypeError, ValueError):
+                pass
+        finally:
+            response.close()
+        css = b"".join(chunks).decode(response.encoding or "utf-8", "replace") if response.ok and chunks else None
+        return _resource(url, kind, render_blocking, response, size), css
+    except requests.RequestException:
+        metrics.record_error("page weight")
+        return _resource(url, kind, render_blocking), None
+
+
+def probe_resources(resources, max_workers=None):
+    # resources: [(kind, url, render_blocking)]. Each distinct URL is probed
+    # once, concurrently, then the fonts the stylesheets load.
+    max_workers = max_workers or config.PAGE_WEIGHT_WORKERS
+    unique = {}
+    for kind, url, render_blocking in resources:
+        if url not in unique:
+            unique[url] = (kind, render_blocking)
+    if not unique:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique))) as pool:
+        futures = {url: pool.submit(metrics.bind(probe_resource), url, kind, render_blocking)
+                   for url, (kind, render_blocking) in unique.items()}
+        results = []
+        fonts = []
+        for url, future in futures.items():
+            info, css = future.result()
+            results.append(info)
+            if css:
+                fonts.extend(urljoin(url, font) for font in font_urls(css))
+        font_futures = [pool.submit(metrics.bind(probe_resource), font, "font")
+                        for font in dict.fromkeys(fonts) if font not in unique]
+        results.extend(future.result()[0] for future in font_futures)
+    return results
+
+
+def page_resources(url, page):
+    # The resources of a parsed page (extract.PageExtractor) to probe, as absolute URLs
+    resources = [(kind, urljoin(url, href), blocking) for kind, href, blocking in page.resources]
+    for css in page.inline_css:
+        resources.extend(("font", urljoin(url, font), False) for font in font_urls(css))
+    return resources
+
+
+def page_weight(document, resources, images):
+    # Totals and findings for the page, its probed resources and its
+    # measured images (report["Image Details"])
+    rows = [document, *resources]
+    image_sizes = {}
+    for image in images:
+        image_sizes.setdefault(image["src"], image.get("size"))
+    sizes = [(row["Type"], row["Size KB"]) for row in rows]
+    sizes.extend(("image", size) for size in image_sizes.values())
+    by_type = {}
+    for kind, size in sizes:
+        totals = by_type.setdefault(kind, {"Requests": 0, "Size KB": 0})
+        totals["Requests"] += 1
+        if isinstance(size, (int, float)):
+            totals["Size KB"] = round(totals["Size KB"] + size, 2)
+    return {
+        "Total Weight KB": round(sum(totals["Size KB"] for totals in by_type.values()), 2),
+        "Requests": sum(totals["Requests"] for totals in by_type.values()),
+        "By Type": by_type,
+        "Render-Blocking Resources": [row["URL"] for row in resources if row["Render Blocking"]],
+        "Uncompressed Resources": [row["URL"] for row in rows if row["Type"] in TEXT_TYPES and row["Status"] == 200
+                                   and not row["Compression"] and not row.get("From Cache")
+                                   and (row["Size KB"] or 0) * 1024 >= MIN_COMPRESSIBLE_BYTES],
+        "Short Cache Lifetime": [row["URL"] for row in resources if row["Status"] == 200
+                                 and (row["Cache Lifetime"] or 0) < config.PAGE_WEIGHT_MIN_CACHE_TTL],
+        "Resources": rows,
+    }
@@ -0,0 +1,180 @@
+import contextlib
+import email.utils
+import random
+import threading
+import time
+from urllib.parse import urlparse
+from process import config, metrics
+
+# Politeness and adaptive concurrency, shared by every request the process
+# makes. Each host (or external API, e.g. "whois") has a token bucket that
+# caps its request rate and an AIMD concurrency limit: a 429/5xx response,
+# a connection failure or a response much slower than the host's usual
+# latency halves the limit (at most once per round trip), healthy responses
+# grow it back by about one per round trip. Retry-After pauses the host's
+# bucket for everyone; retries back off exponentially with full jitter.
+
+RETRY_STATUSES = {429, 502, 503, 504}
+BACKOFF_STATUSES = {429, 500, 502, 503, 504}
+RETRY_METHODS = {"GET", "HEAD"}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        # rate in requests per second; a rate of 0 means unlimited
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self.paused_until - now
+                if self.rate:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if wait <= 0 and self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = max(wait, (1 - self.tokens) / self.rate)
+                elif wait <= 0:
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class HostState:
+    def __init__(self, rate, burst, max_concurrency, initial_concurrency):
+        self.bucket = TokenBucket(rate, burst)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.active = 0
+        self.latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition()
+
+
+class Limiter:
+    def __init__(self, rate=None, burst=None, max_concurrency=None, initial_concurrency=None):
+        self.rate = config.HOST_RATE if rate is None else rate
+        self.burst = burst or config.HOST_BURST
+        self.max_concurrency = max_concurrency or config.HOST_MAX_CONCURRENCY
+        self.initial_concurrency = initial_concurrency or config.HOST_INITIAL_CONCURRENCY
+        self.overrides = {}
+        self.hosts = {}
+        self.intervals = {}
+        self.lock = threading.Lock()
+
+    def configure(self, key, rate, max_concurrency, burst=1):
+        # Limits for one host or API, applied when it is first used
+        self.overrides[key] = (rate, burst, max_concurrency, max_concurrency)
+
+    def state(self, key):
+        with self.lock:
+            state = self.hosts.get(key)
+            if state is None:
+                limits = self.overrides.get(
+                    key, (self.rate, self.burst, self.max_concurrency, self.initial_concurrency))
+                state = self.hosts[key] = HostState(*limits)
+            return state
+
+    @contextlib.contextmanager
+    def slot(self, key):
+        # Waits for a concurrency slot and a token. The caller reports the
+        # outcome with record(); an exception counts as a failure.
+        state = self.state(key)
+        with state.condition:
+            while state.active >= max(int(state.limit), 1):
+                state.condition.wait()
+            state.active += 1
+        try:
+            state.bucket.acquire()
+            yield state
+        except Exception:
+            self._decrease(state)
+            raise
+        finally:
+            with state.condition:
+                state.active -= 1
+                state.condition.notify()
+
+    def record(self, state, status, latency, retry_after=None):
+        if retry_after:
+            state.bucket.pause(retry_after)
+        if status in BACKOFF_STATUSES:
+            self._decrease(state)
+            return
+        with state.condition:
+            usual = state.latency
+            state.latency = latency if usual is None else 0.8 * usual + 0.2 * latency
+        if usual is not None and latency > max(config.HOST_SLOW_FACTOR * usual, config.HOST_SLOW_LATENCY):
+            self._decrease(state)
+            return
+        with state.condition:
+            # Additive increase: about +1 once a full window of requests succeeded
+            state.limit = min(state.max_concurrency, state.limit + 1 / state.limit)
+            state.condition.notify_all()
+
+    def _decrease(self, state):
+        with state.condition:
+            now = time.monotonic()
+            if now - state.last_decrease < (state.latency or 1.0):
+                return
+            state.last_decrease = now
+            state.limit = max(1.0, state.limit / 2)
+        metrics.registry.inc("seo_audit_backoffs_total")
+
+    def throttle(self, key, interval):
+        # At most one pass per interval seconds for key (robots.txt Crawl-delay)
+        if not interval:
+            return
+        with self.lock:
+            bucket = self.intervals.get(key)
+            if bucket is None or bucket.rate != 1 / interval:
+                bucket = self.intervals[key] = TokenBucket(1 / interval, 1)
+        bucket.acquire()
+
+
+def retry_delay(attempt, retry_after=None):
+    # Exponential backoff with full jitter, never shorter than Retry-After
+    delay = random.uniform(0, min(config.RETRY_BACKOFF_MAX, config.RETRY_BACKOFF * 2 ** attempt))
+    return max(delay, retry_after or 0)
+
+
+def parse_retry_after(value):
+    # Seconds to wait from a Retry-After header (delta-seconds or HTTP date), capped
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = int(value)
+    else:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), config.RETRY_AFTER_MAX)
+
+
+_limiter = None
+_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                limiter = Limiter()
+                limiter.configure(urlparse(config.PAGESPEED_API_URL).netloc, config.PAGESPEED_RATE,
+                                  config.PAGESPEED_CONCURRENCY)
+                limiter.configure("whois", config.WHOIS_RATE, config.WHOIS_CONCURRENCY)
+                _limiter = limiter
+    return _limiter
@@ -0,0 +1,62 @@
+import os
+from datetime import datetime
+from itertools import islice, zip_longest
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from process import config
+
+# HTML report rendering. The template is compiled once per process and
+# rendered with Template.generate(), so the report is written (or sent)
+# chunk by chunk instead of being built as one big string. Long tables are
+# produced lazily and cut at REPORT_MAX_TABLE_ROWS rows.
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def _as_list(value):
+    # Several report fields hold a message string instead of an empty list
+    return [] if isinstance(value, str) else value
+
+
+environment = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    finalize=lambda value: "Null" if value is None else value,
+)
+environment.filters["as_list"] = _as_list
+
+
+def _limited(rows, total, max_rows):
+    # (rows to render, number of rows left out)
+    if not max_rows or total <= max_rows:
+        return rows, 0
+    return islice(rows, max_rows), total - max_rows
+
+
+def render_report(report, max_rows=None):
+    # Yields the report HTML in chunks
+    max_rows = config.REPORT_MAX_TABLE_ROWS if max_rows is None else max_rows
+    internal_links = report.get("Internal Links", [])
+    external_links = report.get("External Links", [])
+    link_rows, link_rows_hidden = _limited(
+        zip_longest(internal_links, external_links, fillvalue=""),
+        max(len(internal_links), len(external_links)), max_rows,
+    )
+    images = report.get("Image Details", [])
+    image_rows, image_rows_hidden = _limited(iter(images), len(images), max_rows)
+
+    template = environment.get_template("report.html")
+    return template.generate(
+        report=report,
+        current_date=datetime.now().strftime("%I:%M %p %d-%m-%y"),
+        link_rows=link_rows,
+        link_rows_hidden=link_rows_hidden,
+        image_rows=image_rows,
+        image_rows_hidden=image_rows_hidden,
+    )
+
+
+def generate_html_report(report, filename="seo_audit_report.html", max_rows=None):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.writelines(render_report(report, max_rows))
+
+    return filename
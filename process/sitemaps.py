@@ -0,0 +1,317 @@
+import hashlib
+import queue
+import threading
+import zlib
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urljoin, urlparse
+from xml.etree import ElementTree
+import requests
+from process import config, metrics
+from process.network import get_session, page_timeout
+
+# Sitemap discovery and streaming parsing. Sitemaps come from the Sitemap:
+# lines of robots.txt, or /sitemap.xml; sitemap indexes are followed, each
+# file is fetched and parsed by a worker thread while it downloads (gzipped
+# files are unpacked on the fly), and page entries reach the consumer
+# through a bounded queue, so a 50MB / 50,000 URL sitemap is never held in
+# memory. Entries are validated as they stream by.
+
+# Limits from the sitemaps.org protocol
+MAX_SITEMAP_URLS = 50000
+MAX_SITEMAP_BYTES = 50 * 1024 * 1024
+CHANGEFREQS = {"always", "hourly", "daily", "weekly", "monthly", "yearly", "never"}
+GZIP_MAGIC = b"\x1f\x8b"
+# Indexes may only list sitemaps, but some sites nest them anyway
+MAX_INDEX_DEPTH = 3
+EXAMPLES_PER_ISSUE = 5
+
+SitemapEntry = namedtuple("SitemapEntry", "loc lastmod changefreq priority sitemap")
+
+
+def sitemaps_in_robots(text):
+    # URLs of the Sitemap: lines in a robots.txt
+    sitemaps = []
+    for line in text.splitlines():
+        name, _, value = line.partition(":")
+        if name.strip().lower() == "sitemap" and value.strip():
+            sitemaps.append(value.strip())
+    return sitemaps
+
+
+def discover_sitemaps(site_url, robots_sitemaps=None):
+    # The Sitemap: lines of robots.txt (fetched when not given), or
+    # /sitemap.xml when it lists none
+    if robots_sitemaps is None:
+        try:
+            response = get_session().get(urljoin(site_url, "/robots.txt"), timeout=page_timeout())
+            robots_sitemaps = sitemaps_in_robots(response.text) if response.status_code == 200 else []
+        except requests.RequestException:
+            robots_sitemaps = []
+    return list(dict.fromkeys(robots_sitemaps)) or [urljoin(site_url, "/sitemap.xml")]
+
+
+def parse_lastmod(value):
+    # W3C datetime (YYYY, YYYY-MM, YYYY-MM-DD or a full timestamp), or None
+    try:
+        if len(value) == 4:
+            parsed = datetime(int(value), 1, 1)
+        elif len(value) == 7:
+            parsed = datetime(int(value[:4]), int(value[5:]), 1)
+        else:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def entry_issues(entry, host, now):
+    # Validation problems of one sitemap entry
+    issues = []
+    parsed = urlparse(entry.loc)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        issues.append("invalid loc")
+    elif parsed.netloc != host:
+        issues.append("loc on another host")
+    if entry.lastmod is not None:
+        lastmod = parse_lastmod(entry.lastmod)
+        if lastmod is None:
+            issues.append("invalid lastmod")
+        elif lastmod > now + timedelta(days=1):
+            issues.append("lastmod in the future")
+    if entry.changefreq is not None and entry.changefreq.lower() not in CHANGEFREQS:
+        issues.append("invalid changefreq")
+    if entry.priority is not None:
+        try:
+            if not 0 <= float(entry.priority) <= 1:
+                issues.append("invalid priority")
+        except ValueError:
+            issues.append("invalid priority")
+    return issues
+
+
+def body_chunks(response, max_bytes=MAX_SITEMAP_BYTES, chunk_size=64 * 1024):
+    # The decoded body, gzip files unpacked, cut off after max_bytes.
+    # Yields (chunk, gzipped); raises ValueError once the limit is passed.
+    decompressor = None
+    received = 0
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if received == 0 and decompressor is None and chunk.startswith(GZIP_MAGIC):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while chunk:
+            if decompressor is not None:
+                # Bounded output per call, so a gzip bomb can't blow up memory
+                data = decompressor.decompress(chunk, chunk_size)
+                chunk = decompressor.unconsumed_tail
+            else:
+                data, chunk = chunk, b""
+            received += len(data)
+            if received > max_bytes:
+                raise ValueError(f"larger than {max_bytes // (1024 * 1024)}MB")
+            if data:
+                yield data, decompressor is not None
+
+
+def parse_sitemap(chunks, sitemap_url):
+    # Streams ("url" | "sitemap", SitemapEntry) pairs from XML chunks; each
+    # element is dropped as soon as it is read. The root tag comes first as
+    # ("root", tag).
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root = namespace = None
+    fields = {}
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            element_namespace, _, tag = element.tag.rpartition("}")
+            if event == "start":
+                if root is None:
+                    root, namespace = element, element_namespace
+                    yield "root", tag
+                continue
+            if element_namespace != namespace:
+                # Extensions (image:loc, xhtml:link...) are not page entries
+                continue
+            if tag in ("loc", "lastmod", "changefreq", "priority"):
+                fields[tag] = (element.text or "").strip() or None
+            elif tag in ("url", "sitemap"):
+                if fields.get("loc"):
+                    yield tag, SitemapEntry(fields["loc"], fields.get("lastmod"), fields.get("changefreq"),
+                                            fields.get("priority"), sitemap_url)
+                fields = {}
+                root.clear()
+    parser.close()
+
+
+class SitemapReader:
+    # Streams the page entries of a set of sitemaps, following indexes. Per
+    # sitemap results are kept in self.sitemaps, validation issue counts (with
+    # a few example URLs) in self.issues and self.examples.
+
+    def __init__(self, workers=None, max_sitemaps=None, max_urls=None, queue_size=1000):
+        self.workers = workers or config.SITEMAP_WORKERS
+        self.max_sitemaps = max_sitemaps or config.SITEMAP_MAX_FILES
+        self.max_urls = max_urls
+        self.queue_size = queue_size
+        self.sitemaps = {}
+        self.issues = Counter()
+        self.examples = {}
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def entries(self, sitemap_urls):
+        # Generator of unique SitemapEntry items, issues and all. Closing it
+        # early (e.g. once a crawl has enough URLs) stops the workers.
+        results = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        seen_sitemaps = set()
+        seen_urls = set()
+        pending = 0
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read(url, depth):
+            try:
+                self._read(url, depth, put)
+            finally:
+                put(("done", url, depth))
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+
+        def submit(url, depth):
+            nonlocal pending
+            if url in seen_sitemaps or len(seen_sitemaps) >= self.max_sitemaps:
+                return
+            seen_sitemaps.add(url)
+            pending += 1
+            pool.submit(metrics.bind(read), url, depth)
+
+        try:
+            for url in sitemap_urls:
+                submit(url, 0)
+            while pending:
+                kind, entry, depth = results.get()
+                if kind == "done":
+                    pending -= 1
+                elif kind == "sitemap":
+                    if depth < MAX_INDEX_DEPTH:
+                        submit(entry.loc, depth + 1)
+                else:
+                    # 64-bit hashes keep the seen set small on very large sites
+                    digest = int.from_bytes(hashlib.blake2b(entry.loc.encode("utf-8"), digest_size=8).digest(), "little")
+                    if digest in seen_urls:
+                        self._issue("duplicate loc", entry.loc)
+                        continue
+                    seen_urls.add(digest)
+                    self.count += 1
+                    yield entry
+                    if self.max_urls and self.count >= self.max_urls:
+                        return
+        finally:
+            stop.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _read(self, url, depth, put):
+        result = self.sitemaps[url] = {"URL": url, "Type": None, "Status": None, "Entries": 0,
+                                       "Gzip": False, "Error": None}
+        host = urlparse(url).netloc
+        now = datetime.now(timezone.utc)
+        issues = Counter()
+        try:
+            response = get_session().get(url, timeout=page_timeout(), stream=True)
+        except requests.RequestException as e:
+            result["Error"] = str(e)
+            return
+        try:
+            result["Status"] = response.status_code
+            if response.status_code != 200:
+                result["Error"] = f"Status code {response.status_code}"
+                return
+
+            def chunks():
+                for chunk, gzipped in body_chunks(response):
+                    result["Gzip"] = gzipped
+                    yield chunk
+
+            for kind, entry in parse_sitemap(chunks(), url):
+                if kind == "root":
+                    if entry not in ("urlset", "sitemapindex"):
+                        result["Error"] = f"Not a sitemap (root element {entry})"
+                        return
+                    result["Type"] = entry
+                    continue
+                if kind != ("url" if result["Type"] == "urlset" else "sitemap"):
+                    continue
+                result["Entries"] += 1
+                if result["Entries"] > MAX_SITEMAP_URLS:
+                    result["Error"] = f"More than {MAX_SITEMAP_URLS} entries"
+                    return
+                if kind == "url":
+                    for issue in entry_issues(entry, host, now):
+                        issues[issue] += 1
+                        self._issue(issue, entry.loc)
+                if not put((kind, entry, depth)):
+                    return
+        except ElementTree.ParseError as e:
+            result["Error"] = f"Invalid XML: {e}"
+        except ValueError as e:
+            result["Error"] = f"Sitemap {e}"
+        except requests.RequestException as e:
+            result["Error"] = str(e)
+        finally:
+            response.close()
+            if result["Error"]:
+                metrics.record_error("sitemap")
+            result["Issues"] = dict(issues)
+
+    def _issue(self, issue, loc):
+        with self.lock:
+            self.issues[issue] += 1
+            examples = self.examples.setdefault(issue, [])
+            if len(examples) < EXAMPLES_PER_ISSUE:
+                examples.append(loc)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "Sitemaps": list(self.sitemaps.values()),
+                "Sitemap URLs": self.count,
+                "Sitemap Issues": dict(self.issues),
+                "Sitemap Issue Examples": {issue: list(urls) for issue, urls in self.examples.items()},
+            }
+
+
+def check_sitemaps(site_url, robots_sitemaps=None, max_urls=None, sample=None, max_sitemaps=None):
+    # Site-level sitemap checks: every sitemap found (up to max_sitemaps
+    # files), the number of unique URLs they list (up to max_urls),
+    # validation issues, and the status of the first `sample` URLs
+    from process.links import check_links
+
+    max_urls = config.SITEMAP_MAX_URLS if max_urls is None else max_urls
+    sample = config.SITEMAP_STATUS_SAMPLE if sample is None else sample
+    reader = SitemapReader(max_sitemaps=max_sitemaps, max_urls=max_urls)
+    sampled = []
+    for entry in reader.entries(discover_sitemaps(site_url, robots_sitemaps)):
+        if len(sampled) < sample:
+            sampled.append(entry.loc)
+    report = reader.summary()
+    statuses = check_links(sampled) if sampled else {}
+    report["Sitemap Non-200 URLs"] = [{"URL": url, "Status": status} for url, status in statuses.items()
+                                      if status != 200]
+    report["Sitemap.xml Available"] = "Yes" if any(sitemap["Type"] for sitemap in report["Sitemaps"]) else "No"
+    return report
+
+
+def quick_check_sitemaps(site_url, robots_sitemaps=None):
+    # The per-page version of check_sitemaps: only the first sitemap found
+    # (and the first sitemap it lists, when it is an index), up to
+    # SITEMAP_QUICK_MAX_URLS entries, and no status checks
+    first = discover_sitemaps(site_url, robots_sitemaps)[:1]
+    return check_sitemaps(site_url, first, max_urls=config.SITEMAP_QUICK_MAX_URLS, sample=0, max_sitemaps=2)